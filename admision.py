@@ -0,0 +1,145 @@
+"""
+Control de admisión por memoria: cada request de procesamiento reserva una
+estimación de la memoria que va a usar (según tamaño y formato de la subida)
+contra un presupuesto por proceso. Si no cabe espera un rato en cola (FIFO);
+si sigue sin caber, o la cola está llena, se rechaza con 503 + Retry-After en
+vez de dejar que un pico de fin de mes tumbe el worker por falta de memoria.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+
+import metricas
+
+# Presupuesto de memoria para procesamiento, por proceso (worker de gunicorn)
+PRESUPUESTO_BYTES = int(os.environ.get("RELOJ_MEMORIA_MB", "256")) * 1024 * 1024
+# Cuánto puede esperar una request en cola antes de responder 503
+ESPERA_MAX_S = float(os.environ.get("RELOJ_ESPERA_ADMISION_S", "10"))
+# Requests esperando a la vez; con la cola llena se rechaza sin esperar
+MAX_COLA = int(os.environ.get("RELOJ_MAX_COLA", "16"))
+
+# Pico de memoria por byte subido, medido con benchmarks (tracemalloc + margen
+# para lo que asignan lxml/openpyxl en C). El XLSX viene comprimido: por eso
+# cuesta más por byte. Sin firma conocida se asume lo peor.
+FACTOR_POR_FORMATO = {"html": 10, "xls": 16, "xlsx": 32, "desconocido": 32}
+# Costo fijo por request (DataFrames intermedios, escritor, buffers de salida)
+COSTO_BASE_BYTES = 8 * 1024 * 1024
+
+DECISIONES = metricas.contador("reloj_admision_total", "Decisiones de admisión por resultado.")
+ESPERA = metricas.histograma("reloj_admision_espera_segundos", "Tiempo en cola hasta ser admitida o rechazada.")
+
+
+def estimar_costo(n_bytes, formato) -> int:
+    """Bytes de memoria que se estima usará procesar una subida de n_bytes en ese formato."""
+    return COSTO_BASE_BYTES + n_bytes * FACTOR_POR_FORMATO.get(formato, FACTOR_POR_FORMATO["desconocido"])
+
+
+class SinCapacidad(Exception):
+    """No hay memoria disponible: el cliente debe reintentar tras `reintentar_en` segundos."""
+
+    def __init__(self, motivo, reintentar_en):
+        super().__init__(motivo)
+        self.reintentar_en = reintentar_en
+
+
+class Reserva:
+    """Memoria admitida para una request; liberar() es idempotente."""
+
+    __slots__ = ("_control", "costo", "_inicio")
+
+    def __init__(self, control, costo):
+        self._control = control
+        self.costo = costo
+        self._inicio = time.perf_counter()
+
+    def liberar(self):
+        control, self._control = self._control, None
+        if control is not None:
+            control._liberar(self.costo, time.perf_counter() - self._inicio)
+
+
+class ControlAdmision:
+    def __init__(self, presupuesto, espera_max, max_cola):
+        self.presupuesto = presupuesto
+        self.espera_max = espera_max
+        self.max_cola = max_cola
+        self._cond = threading.Condition()
+        self._cola = deque()
+        self._en_uso = 0
+        self._activas = 0
+        self._duracion_media = None  # EWMA de cuánto se retiene una reserva
+        self.admitidas = 0
+        self.rechazadas = 0
+
+    def admitir(self, costo) -> Reserva:
+        """
+        Reserva `costo` bytes (una sola request más grande que el presupuesto
+        igual corre, pero sola). Lanza SinCapacidad si no se logra a tiempo.
+        """
+        costo = min(costo, self.presupuesto)
+        turno = object()
+        t = time.perf_counter()
+        with self._cond:
+            if self._cola and len(self._cola) >= self.max_cola:
+                self._rechazar(t, "cola_llena")
+            self._cola.append(turno)
+            try:
+                admitida = self._cond.wait_for(
+                    lambda: self._cola[0] is turno and self._en_uso + costo <= self.presupuesto,
+                    timeout=self.espera_max,
+                )
+            finally:
+                self._cola.remove(turno)
+                self._cond.notify_all()
+            if not admitida:
+                self._rechazar(t, "sin_memoria")
+            self._en_uso += costo
+            self._activas += 1
+            self.admitidas += 1
+        ESPERA.observar(time.perf_counter() - t, resultado="admitida")
+        DECISIONES.incrementar(resultado="admitida")
+        return Reserva(self, costo)
+
+    def _rechazar(self, t, motivo):
+        # Se asume el lock tomado
+        self.rechazadas += 1
+        reintentar_en = self._reintentar_en()
+        ESPERA.observar(time.perf_counter() - t, resultado=motivo)
+        DECISIONES.incrementar(resultado=motivo)
+        raise SinCapacidad(motivo, reintentar_en)
+
+    def _reintentar_en(self) -> int:
+        # Lo que se estima tarda en vaciarse lo que hay delante (1 a 60 s)
+        media = self._duracion_media or 1.0
+        return max(1, min(60, math.ceil(media * (len(self._cola) + 1))))
+
+    def _liberar(self, costo, duracion):
+        with self._cond:
+            self._en_uso -= costo
+            self._activas -= 1
+            media = self._duracion_media
+            self._duracion_media = duracion if media is None else 0.8 * media + 0.2 * duracion
+            self._cond.notify_all()
+
+    def estadisticas(self):
+        with self._cond:
+            return {
+                "presupuesto_bytes": self.presupuesto,
+                "en_uso_bytes": self._en_uso,
+                "activas": self._activas,
+                "en_cola": len(self._cola),
+                "admitidas": self.admitidas,
+                "rechazadas": self.rechazadas,
+            }
+
+
+control = ControlAdmision(PRESUPUESTO_BYTES, ESPERA_MAX_S, MAX_COLA)
+
+metricas.medidor("reloj_admision_en_cola", "Requests esperando memoria para procesarse.",
+                 lambda: control.estadisticas()["en_cola"])
+metricas.medidor("reloj_admision_activas", "Requests procesándose con memoria reservada.",
+                 lambda: control.estadisticas()["activas"])
+metricas.medidor("reloj_admision_memoria_bytes", "Memoria reservada por las requests en curso.",
+                 lambda: control.estadisticas()["en_uso_bytes"])
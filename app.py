@@ -1,11 +1,138 @@
-from flask import Flask, request, send_file, jsonify
+import arranque  # primero: marca el inicio del proceso para medir el arranque
+import admision
+import base64
+import binascii
+from flask import Flask, Response, g, request, send_file, jsonify, url_for
 from flask_cors import CORS
+from functools import wraps
 from io import BytesIO
-from procesador import procesar_excel, detectar_html_y_procesar
+import metricas
+import perfilado
+import re
+import subidas
+import subidas_partes
+import time
+
+# procesador, cache_resultados, lote y trabajos (pandas/numpy/openpyxl/lxml) se
+# importan dentro de las rutas: / responde sin esperarlos y arranque.iniciar()
+# los carga y calienta en segundo plano (o en el master con preload_app)
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+# formato -> (mimetype, extensión). Solo xlsx lleva ambas hojas con color;
+# el resto entrega una hoja (?hoja=detalle|resumen) sin pasar por openpyxl.
+FORMATOS_SALIDA = {
+    "xlsx": (XLSX_MIMETYPE, "xlsx"),
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson; charset=utf-8", "ndjson"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
 
 app = Flask(__name__)
 # CORS abierto (si quieres, limita con origins=["https://tudominio"])
 CORS(app)
+# Subidas grandes a disco (no a memoria) y tope de tamaño -> 413
+app.request_class = subidas.RequestEnDisco
+app.config["MAX_CONTENT_LENGTH"] = subidas.MAX_SUBIDA_BYTES
+
+
+def _estadisticas_cache(nombre):
+    """Estadísticas de un caché sin forzar la carga del procesamiento (sin serie mientras no cargue)."""
+    if not arranque.cargado():
+        raise LookupError("procesamiento aún no cargado")
+    if nombre == "turnos":
+        from procesador import estadisticas_cache_turnos
+        return estadisticas_cache_turnos()
+    from cache_resultados import cache
+    return cache.estadisticas()
+
+
+metricas.medidor("reloj_cache_turnos_hits", "Aciertos del caché de turnos compilados.",
+                 lambda: _estadisticas_cache("turnos")["hits"])
+metricas.medidor("reloj_cache_turnos_misses", "Fallos del caché de turnos compilados.",
+                 lambda: _estadisticas_cache("turnos")["misses"])
+metricas.medidor("reloj_cache_resultados_hits", "Aciertos del caché de resultados (memoria + disco).",
+                 lambda: _estadisticas_cache("resultados")["hits"] + _estadisticas_cache("resultados")["hits_disco"])
+metricas.medidor("reloj_cache_resultados_misses", "Fallos del caché de resultados.",
+                 lambda: _estadisticas_cache("resultados")["misses"])
+metricas.medidor("reloj_cache_resultados_bytes", "Bytes en el caché de resultados en memoria.",
+                 lambda: _estadisticas_cache("resultados")["bytes"])
+
+# Endpoints cuya primera request se reporta como latencia en frío/caliente
+ENDPOINTS_PROCESAMIENTO = ("procesar_archivo", "procesar_lote", "crear_trabajo", "finalizar_subida")
+
+
+@app.before_request
+def _iniciar_metricas():
+    metricas.iniciar_registro()
+
+
+@app.after_request
+def _cerrar_metricas(resp):
+    """Server-Timing por request + acumulado para /metrics."""
+    registro = metricas.registro_actual()
+    if registro is None or request.endpoint in (None, "static", "exportar_metricas"):
+        return resp
+    if "formato_entrada" in g:
+        resp.headers["X-Formato-Entrada"] = g.formato_entrada
+    resp.headers["Server-Timing"] = metricas.server_timing(registro)
+    resp.headers["Timing-Allow-Origin"] = "*"
+    if request.endpoint in ENDPOINTS_PROCESAMIENTO:
+        arranque.registrar_request(request.endpoint, time.perf_counter() - registro.inicio)
+    metricas.cerrar_registro(registro, request.endpoint, resp.status_code, resp.content_length)
+    return resp
+
+
+@app.after_request
+def _liberar_al_cerrar(resp):
+    reserva = g.pop("reserva_admision", None)
+    if reserva is None:
+        return resp
+    if resp.is_streamed and not resp.direct_passthrough:
+        # CSV/NDJSON en streaming: el resultado sigue en memoria hasta terminar de enviarlo
+        resp.call_on_close(reserva.liberar)
+    else:
+        # Ya está todo calculado (send_file no llama a call_on_close)
+        reserva.liberar()
+    return resp
+
+
+@app.teardown_request
+def _cerrar_subida(_exc):
+    vista = g.pop("vista_subida", None)
+    if vista is not None:
+        subidas.cerrar_vista(vista)
+    # Si no se llegó a armar respuesta (excepción no capturada), se libera aquí
+    reserva = g.pop("reserva_admision", None)
+    if reserva is not None:
+        reserva.liberar()
+
+
+@app.errorhandler(413)
+def subida_muy_grande(_e):
+    limite_mb = app.config["MAX_CONTENT_LENGTH"] / (1024 * 1024)
+    return jsonify({"error": f"El archivo supera el máximo permitido ({limite_mb:g} MB)"}), 413
+
+
+@app.errorhandler(admision.SinCapacidad)
+def sin_capacidad(e):
+    return (
+        jsonify({"error": "El servidor está procesando demasiados archivos. Reintenta en unos segundos.",
+                 "reintentar_en": e.reintentar_en}),
+        503,
+        {"Retry-After": str(e.reintentar_en)},
+    )
+
+
+@app.errorhandler(subidas_partes.ErrorSubida)
+def error_subida(e):
+    return jsonify({"error": str(e), **e.detalle}), e.codigo
+
+
+def _admitir(n_bytes, formato):
+    """Espera memoria para procesar (o lanza admision.SinCapacidad -> 503)."""
+    with metricas.etapa("admision"):
+        g.reserva_admision = admision.control.admitir(admision.estimar_costo(n_bytes, formato))
 
 
 @app.route("/", methods=["GET"])
@@ -14,42 +141,270 @@ def health():
     return "🟢 Backend Reloj Control activo", 200
 
 
-@app.route("/procesar", methods=["POST"])
-def procesar_archivo():
+@app.route("/listo", methods=["GET"])
+def listo():
+    """
+    Readiness: 200 cuando el procesamiento ya está importado y caliente, 503
+    mientras tanto. Incluye los tiempos de arranque del worker.
+    """
+    return jsonify(arranque.estado()), 200 if arranque.listo() else 503
+
+
+@app.route("/metrics", methods=["GET"])
+def exportar_metricas():
+    """Métricas del worker en formato Prometheus."""
+    return metricas.exportar(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
+@app.route("/estado", methods=["GET"])
+def estado():
+    """Estado interno del worker (cachés) para diagnóstico."""
+    from almacen import almacen
+    from cache_resultados import cache
+    from procesador import estadisticas_cache_turnos
+
+    return jsonify({
+        "cache_turnos": estadisticas_cache_turnos(),
+        "cache_resultados": cache.estadisticas(),
+        "almacen_dias": almacen.estadisticas() if almacen else None,
+        "arranque": arranque.estado(),
+        "admision": admision.control.estadisticas(),
+    }), 200
+
+
+MAX_LIMITE_RESUMEN = 1000
+_RE_MES = re.compile(r"^\d{4}-(0[1-9]|1[0-2])$")
+
+
+@app.route("/resumen", methods=["GET"])
+def resumen():
+    """
+    Totales de atraso y horas extra 50%/25% ya guardados, sin volver a procesar
+    planillas. Parámetros (todos opcionales):
+      agrupar=organigrama,mes,rut   dimensiones, en ese orden (vacío = total general)
+      organigrama=..., rut=...      filtros exactos
+      desde=YYYY-MM, hasta=YYYY-MM  rango de meses (inclusive)
+      limite=100, pagina=1          paginación
+    Requiere el almacén de días (RELOJ_DB_DIAS).
+    """
+    from almacen import DIMENSIONES_RESUMEN, almacen
+    from procesador import convertir_a_hhmm, minutos_a_hhmm
+
+    if almacen is None:
+        return jsonify({"error": "Resumen no disponible: el servidor no tiene almacén de días (RELOJ_DB_DIAS)"}), 501
+
+    agrupar = [d.strip().lower() for d in request.args.get("agrupar", "organigrama,mes").split(",") if d.strip()]
+    if any(d not in DIMENSIONES_RESUMEN for d in agrupar) or len(set(agrupar)) != len(agrupar):
+        return jsonify({"error": f"agrupar admite {', '.join(DIMENSIONES_RESUMEN)} sin repetir"}), 400
+    desde, hasta = request.args.get("desde"), request.args.get("hasta")
+    if any(m is not None and not _RE_MES.match(m) for m in (desde, hasta)):
+        return jsonify({"error": "desde/hasta deben ser meses YYYY-MM"}), 400
+    try:
+        limite = int(request.args.get("limite", 100))
+        pagina = int(request.args.get("pagina", 1))
+    except ValueError:
+        return jsonify({"error": "limite y pagina deben ser enteros"}), 400
+    if not 1 <= limite <= MAX_LIMITE_RESUMEN or pagina < 1:
+        return jsonify({"error": f"limite debe estar entre 1 y {MAX_LIMITE_RESUMEN}; pagina desde 1"}), 400
+
+    with metricas.etapa("consulta"):
+        total, filas = almacen.consultar_resumen(
+            agrupar, organigrama=request.args.get("organigrama"), rut=request.args.get("rut"),
+            desde=desde, hasta=hasta, limite=limite, desplazamiento=(pagina - 1) * limite,
+        )
+    for fila in filas:
+        fila["h50"], fila["h25"] = round(fila["h50"], 4), round(fila["h25"], 4)
+        fila["atraso"] = minutos_a_hhmm(fila["atraso_min"])
+        fila["extras_50"] = convertir_a_hhmm(fila["h50"])
+        fila["extras_25"] = convertir_a_hhmm(fila["h25"])
+        fila["extras_total"] = convertir_a_hhmm(fila["h50"] + fila["h25"])
+    return jsonify({
+        "agrupar": agrupar,
+        "total": total,
+        "pagina": pagina,
+        "limite": limite,
+        "paginas": -(-total // limite),
+        "filas": filas,
+    }), 200
+
+
+def _leer_archivo():
+    """Retorna (nombre, contenido, None) o (None, None, respuesta_error)."""
     if "archivo" not in request.files:
-        return jsonify({"error": "No se envió ningún archivo"}), 400
+        return None, None, (jsonify({"error": "No se envió ningún archivo"}), 400)
 
     file = request.files["archivo"]
     if file.filename.strip() == "":
-        return jsonify({"error": "El nombre del archivo está vacío"}), 400
+        return None, None, (jsonify({"error": "El nombre del archivo está vacío"}), 400)
+
+    # Las subidas grandes ya están en un temporal en disco: se leen vía mmap,
+    # sin copiarlas a memoria (se cierra al terminar la request)
+    contenido = subidas.abrir_vista(file.stream)
+    g.vista_subida = contenido
+    if not len(contenido):
+        return None, None, (jsonify({"error": "El archivo está vacío"}), 400)
+    _registrar_entrada(contenido)
+    return file.filename, contenido, None
+
+
+def _registrar_entrada(contenido):
+    """Bytes y formato de la entrada, para métricas y el header X-Formato-Entrada."""
+    from procesador import detectar_formato
+
+    metricas.contar("bytes_entrada", len(contenido))
+    # Solo mira la firma (primeros bytes): también sirve en los aciertos de caché
+    g.formato_entrada = detectar_formato(contenido)
+    metricas.anotar("formato", g.formato_entrada)
+
+
+def _token_perfil():
+    return request.headers.get("X-Perfil") or request.args.get("perfil")
+
+
+def _perfilable(vista):
+    """
+    Con el token de perfilado (X-Perfil o ?perfil=) la vista corre bajo
+    cProfile + tracemalloc, sin caché, y el informe queda en /perfiles/<id>
+    (header X-Perfil-Id). Sin token, la vista corre tal cual.
+    """
+    @wraps(vista)
+    def envoltura(*args, **kwargs):
+        token = _token_perfil()
+        if token is None:
+            return vista(*args, **kwargs)
+        if not perfilado.autorizado(token):
+            return jsonify({"error": "Perfilado no autorizado"}), 403
+
+        with perfilado.Perfilador() as perfil:
+            g.perfilando = perfil is not None
+            resp = app.make_response(vista(*args, **kwargs))
+            if perfil is not None and resp.is_streamed and not resp.direct_passthrough:
+                resp.get_data()  # el CSV/NDJSON en streaming también queda dentro del perfil
+        if perfil is None:
+            # Ya hay otra request perfilándose en este worker: se atiende sin perfil
+            resp.headers["X-Perfil-Estado"] = "ocupado"
+            return resp
+
+        registro = metricas.registro_actual()
+        conteos = registro.conteos if registro else {}
+        etiquetas = {
+            "endpoint": request.endpoint,
+            "formato": g.get("formato_entrada"),
+            "bytes_entrada": conteos.get("bytes_entrada"),
+            "filas": conteos.get("filas"),
+            "funcionarios": conteos.get("funcionarios"),
+            # sin el token: el informe se puede leer y compartir
+            "parametros": {k: v for k, v in request.args.items() if k != "perfil"},
+            "estado_http": resp.status_code,
+            "etapas": {n: round(s, 4) for n, s in (registro.etapas.items() if registro else ())},
+        }
+        if conteos.get("trozos"):
+            etiquetas["nota"] = "El XLSX se leyó en paralelo: esa parte corrió en procesos hijos y no aparece en el perfil."
+        id_perfil = perfil.guardar(etiquetas)
+        resp.headers["X-Perfil-Id"] = id_perfil
+        resp.headers["X-Perfil-Url"] = url_for("ver_perfil", id_perfil=id_perfil)
+        return resp
 
-    # Leemos en memoria (permite inspección + reuso)
-    contenido = file.read()
-    if not contenido:
-        return jsonify({"error": "El archivo está vacío"}), 400
+    return envoltura
 
+
+def _parametros_salida():
+    """Retorna (formato, hoja, None) según ?formato=&hoja= (o el form), o (None, None, respuesta_error)."""
+    formato = (request.args.get("formato") or request.form.get("formato") or "xlsx").lower()
+    hoja = (request.args.get("hoja") or request.form.get("hoja") or "detalle").lower()
+    if formato not in FORMATOS_SALIDA:
+        return None, None, (
+            jsonify({"error": f"Formato no soportado: {formato} (use {', '.join(FORMATOS_SALIDA)})"}), 400
+        )
+    if hoja not in ("detalle", "resumen"):
+        return None, None, (jsonify({"error": "hoja debe ser 'detalle' o 'resumen'"}), 400)
+    if formato == "xlsx":
+        hoja = ""  # el XLSX siempre trae ambas hojas
+    return formato, hoja, None
+
+
+@app.route("/procesar", methods=["POST"])
+@_perfilable
+def procesar_archivo():
+    formato, hoja, error = _parametros_salida()
+    if error:
+        return error
+
+    _, contenido, error = _leer_archivo()
+    if error:
+        return error
+    return _responder_procesamiento(contenido, formato, hoja)
+
+
+def _responder_procesamiento(contenido, formato, hoja, prefijo=None):
+    """
+    Resultado del archivo en el formato pedido, con caché por contenido, ETag y
+    control de admisión (común a /procesar y a las subidas por partes).
+    prefijo: comienzo del HTML ya parseado (ver subidas_partes).
+    """
+    from cache_resultados import cache
+    from procesador import (
+        COLUMNAS_DETALLE, COLUMNAS_RESUMEN, armar_parquet, calcular_contenido, generar_csv, generar_ndjson,
+        procesar_contenido,
+    )
+
+    # Mismo archivo + mismas reglas => mismo resultado: se sirve desde caché
+    # (salvo al perfilar: se quiere ver el procesamiento real)
+    perfilando = g.get("perfilando", False)
+    with metricas.etapa("hash"):
+        clave = cache.clave(contenido, formato, hoja)
+    if not perfilando and request.if_none_match.contains(clave):
+        # El cliente ya tiene este resultado
+        return "", 304, {"ETag": f'"{clave}"'}
+
+    mimetype, extension = FORMATOS_SALIDA[formato]
+    nombre = f"resultado.{extension}" if formato == "xlsx" else f"resultado_{hoja}.{extension}"
     try:
-        # Detecta si es XLS-HTML (muchas plataformas exportan HTML con extensión .xls)
-        cab = contenido[:200].lstrip().lower()
-        es_html = cab.startswith(b"<html") or b"<table" in cab
-
-        if es_html:
-            output = detectar_html_y_procesar(contenido)
-        else:
-            # .xls binario real o .xlsx
-            output = procesar_excel(BytesIO(contenido))
-
-        return send_file(
-            output,
-            mimetype="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+        datos = None if perfilando else cache.obtener(clave)
+        origen = "HIT"
+        if datos is None:
+            _admitir(len(contenido), g.formato_entrada)
+        if datos is None and formato == "xlsx":
+            datos = procesar_contenido(contenido, prefijo).getvalue()
+            cache.guardar(clave, datos)
+            origen = "MISS"
+        elif datos is None:
+            resultado = calcular_contenido(contenido, prefijo)
+            if hoja == "resumen":
+                columnas, filas = COLUMNAS_RESUMEN, resultado.filas_resumen()
+            else:
+                columnas, filas = COLUMNAS_DETALLE, resultado.filas_detalle()
+            if formato != "parquet":
+                # Texto en streaming: no se arma en memoria ni se guarda en caché
+                generar = generar_csv if formato == "csv" else generar_ndjson
+                resp = Response(generar(columnas, filas), content_type=mimetype)
+                resp.headers["Content-Disposition"] = f"attachment; filename={nombre}"
+                resp.set_etag(clave)
+                return resp
+            try:
+                datos = armar_parquet(columnas, filas).getvalue()
+            except ImportError:
+                return jsonify({"error": "Parquet no disponible en este servidor (falta pyarrow)"}), 501
+            cache.guardar(clave, datos)
+            origen = "MISS"
+
+        resp = send_file(
+            BytesIO(datos),
+            mimetype=mimetype,
             as_attachment=True,
-            download_name="resultado.xlsx",
+            download_name=nombre,
+            etag=clave,
         )
+        resp.headers["X-Cache"] = origen
+        return resp
 
+    except admision.SinCapacidad:
+        raise
     except Exception as e:
+        metricas.registrar_error(e)
         msg = str(e)
         # Mensajes más claros para el caso XLS-HTML o formato inválido
-        pistas = ("Unsupported format", "BOF", "xlrd", "read_html", "No tables found")
+        pistas = ("Unsupported format", "BOF", "xlrd", "tablas HTML", "tabla HTML", "No se pudo leer como")
         if any(p in msg for p in pistas):
             return (
                 jsonify(
@@ -66,6 +421,182 @@ def procesar_archivo():
         return jsonify({"error": f"Error al procesar archivo: {msg}"}), 500
 
 
+# ──────────────────────────────────────────────────────────────────────────────
+# Subidas por partes (enlaces lentos): un corte no obliga a reenviar todo
+# ──────────────────────────────────────────────────────────────────────────────
+
+@app.route("/procesar/subidas", methods=["POST"])
+def crear_subida():
+    """
+    JSON (o form) con archivo (nombre), bytes (tamaño total) y opcionales
+    tamano_parte y sha256 (del archivo completo, se verifica al finalizar).
+    """
+    datos = request.get_json(silent=True) or request.form
+    try:
+        n_bytes = int(datos.get("bytes"))
+        tamano_parte = int(datos["tamano_parte"]) if datos.get("tamano_parte") else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "bytes (y tamano_parte, si se envía) deben ser enteros"}), 400
+    sha256 = (datos.get("sha256") or "").strip().lower() or None
+    estado = subidas_partes.crear_subida(datos.get("archivo") or "", n_bytes, tamano_parte, sha256)
+    url = url_for("estado_subida", id_subida=estado["id"])
+    return jsonify(estado), 201, {"Location": url}
+
+
+@app.route("/procesar/subidas/<id_subida>", methods=["GET"])
+def estado_subida(id_subida):
+    """Partes recibidas y faltantes: lo que un cliente consulta para reanudar."""
+    return jsonify(subidas_partes.estado_subida(id_subida)), 200
+
+
+@app.route("/procesar/subidas/<id_subida>", methods=["DELETE"])
+def cancelar_subida(id_subida):
+    subidas_partes.borrar_subida(id_subida)
+    return "", 204
+
+
+def _sha256_declarado():
+    """sha256 (hex) de la parte: header X-Sha256 (hex) o Content-Digest: sha-256=:base64: (RFC 9530)."""
+    hexa = request.headers.get("X-Sha256")
+    if hexa:
+        return hexa.strip().lower()
+    m = re.search(r"sha-256=:([A-Za-z0-9+/=]+):", request.headers.get("Content-Digest", ""))
+    if m:
+        try:
+            return base64.b64decode(m.group(1), validate=True).hex()
+        except binascii.Error:
+            return None
+    return None
+
+
+@app.route("/procesar/subidas/<id_subida>/partes/<int:n>", methods=["PUT"])
+def recibir_parte(id_subida, n):
+    estado = subidas_partes.recibir_parte(id_subida, n, request.get_data(cache=False), _sha256_declarado())
+    return jsonify(estado), 200
+
+
+@app.route("/procesar/subidas/<id_subida>/finalizar", methods=["POST"])
+def finalizar_subida(id_subida):
+    """
+    Procesa el archivo armado con las mismas opciones y respuesta que
+    /procesar (formato, hoja, caché, ETag). Se puede reintentar: la subida
+    se conserva hasta vencer o hasta DELETE.
+    """
+    formato, hoja, error = _parametros_salida()
+    if error:
+        return error
+
+    contenido, prefijo = subidas_partes.abrir_completa(id_subida)
+    g.vista_subida = contenido
+    _registrar_entrada(contenido)
+    if prefijo is not None:
+        metricas.contar("bytes_prefijo", prefijo[0])
+    return _responder_procesamiento(contenido, formato, hoja, prefijo)
+
+
+@app.route("/perfiles", methods=["GET"])
+def listar_perfiles():
+    if not perfilado.autorizado(_token_perfil()):
+        return jsonify({"error": "Perfilado no autorizado"}), 403
+    return jsonify(perfilado.listar()), 200
+
+
+@app.route("/perfiles/<id_perfil>", methods=["GET"])
+def ver_perfil(id_perfil):
+    """Informe JSON; con ?pstats=1 entrega el volcado de cProfile (para snakeviz/pstats)."""
+    if not perfilado.autorizado(_token_perfil()):
+        return jsonify({"error": "Perfilado no autorizado"}), 403
+    informe = perfilado.leer(id_perfil)
+    if informe is None:
+        return jsonify({"error": "Perfil no encontrado"}), 404
+    if request.args.get("pstats"):
+        return send_file(perfilado.ruta(id_perfil, "prof"), mimetype="application/octet-stream",
+                         as_attachment=True, download_name=f"perfil_{id_perfil}.prof")
+    return jsonify(informe), 200
+
+
+@app.route("/procesar/lote", methods=["POST"])
+def procesar_lote():
+    """
+    Varios exports en un solo libro: acepta un ZIP y/o varias partes 'archivo'.
+    Los archivos con error se listan en la hoja 'Errores' sin detener el lote.
+    """
+    import lote
+
+    # Se admite por el tamaño declarado antes de leer el cuerpo (sin
+    # Content-Length, por el máximo). Las partes quedan en sus temporales en
+    # disco y los procesos de cálculo las leen desde ahí.
+    _admitir(request.content_length or subidas.MAX_SUBIDA_BYTES, "desconocido")
+    partes = [(f.filename, f.stream) for f in request.files.getlist("archivo") if f.filename.strip()]
+    if not partes:
+        return jsonify({"error": "No se envió ningún archivo"}), 400
+    metricas.contar("bytes_entrada", sum(lote.tamano(archivo) for _, archivo in partes))
+
+    try:
+        archivos = lote.expandir_archivos(partes, subidas.DIR_SUBIDAS)
+    except lote.LoteInvalido as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        output, errores = lote.procesar_lote(archivos)
+    finally:
+        lote.cerrar_archivos(archivos)
+    resp = send_file(
+        output,
+        mimetype=XLSX_MIMETYPE,
+        as_attachment=True,
+        download_name="resultado.xlsx",
+    )
+    resp.headers["X-Lote-Archivos"] = str(len(archivos))
+    resp.headers["X-Lote-Errores"] = str(len(errores))
+    return resp
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Trabajos asíncronos (archivos grandes): se encolan y se consultan después
+# ──────────────────────────────────────────────────────────────────────────────
+
+@app.route("/procesar/jobs", methods=["POST"])
+def crear_trabajo():
+    import trabajos
+
+    nombre, contenido, error = _leer_archivo()
+    if error:
+        return error
+
+    estado = trabajos.crear_trabajo(contenido, nombre)
+    url = url_for("estado_trabajo", id_trabajo=estado["id"])
+    return jsonify(estado), 202, {"Location": url}
+
+
+@app.route("/procesar/jobs/<id_trabajo>", methods=["GET"])
+def estado_trabajo(id_trabajo):
+    import trabajos
+
+    estado = trabajos.estado_trabajo(id_trabajo)
+    if estado is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    return jsonify(estado), 200
+
+
+@app.route("/procesar/jobs/<id_trabajo>/resultado", methods=["GET"])
+def resultado_trabajo(id_trabajo):
+    import trabajos
+
+    estado = trabajos.estado_trabajo(id_trabajo)
+    if estado is None:
+        return jsonify({"error": "Trabajo no encontrado"}), 404
+    ruta = trabajos.ruta_resultado(id_trabajo)
+    if ruta is None:
+        # Aún en proceso (o terminó con error): se informa el estado actual
+        return jsonify(estado), 409
+    return send_file(ruta, mimetype=XLSX_MIMETYPE, as_attachment=True, download_name="resultado.xlsx")
+
+
+arranque.marcar_flask_listo()
+arranque.iniciar()
+
+
 if __name__ == "__main__":
     # Desarrollo local (en Render se usa gunicorn vía Procfile)
     app.run(host="0.0.0.0", port=5000, debug=False)
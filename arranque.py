@@ -0,0 +1,164 @@
+"""
+Arranque en frío del worker: Flask responde la ruta de salud apenas está
+arriba, mientras el procesamiento (pandas, numpy, openpyxl, lxml) se importa y
+se calienta en segundo plano procesando una muestra mínima incluida aquí.
+/listo informa cuándo quedó caliente y cuánto tardó cada fase.
+
+Con gunicorn.conf.py (preload_app) la importación pesada se hace una sola vez
+en el master y los workers la heredan por fork; cada worker solo calienta.
+"""
+import importlib
+import os
+import sys
+import threading
+import time
+
+import metricas
+
+INICIO = time.perf_counter()
+
+# Módulos que arrastran pandas/numpy/openpyxl/lxml (en orden de dependencia)
+MODULOS_PESADOS = ("procesador", "cache_resultados", "lote", "trabajos")
+
+# Export XLS-HTML mínimo: un funcionario sin Rut (el almacén de días ignora las
+# filas sin Rut, así el calentamiento no deja rastro) y tres días con marcas,
+# atraso y extras, para recorrer lector, cálculo y escritor.
+MUESTRA_HTML = (
+    "<html><head><meta http-equiv='Content-Type' content='text/html; charset=utf-8'></head><body>"
+    "<table><tr><td>Funcionario</td><td>: Calentamiento</td></tr>"
+    "<tr><td>Rut</td><td>: </td></tr>"
+    "<tr><td>Organigrama</td><td>: </td></tr>"
+    "<tr><td>Turno</td><td>: 08:00-17:00 / 08:00-16:00 (vi)</td></tr>"
+    "<tr><td>Periodo</td><td>: 04-03-2024 al 08-03-2024</td></tr></table>"
+    "<table><tr><th>Día</th><th>Fecha</th><th>Entrada</th><th>Salida</th><th>Horas</th><th>Descripción</th></tr>"
+    "<tr><td>Lunes</td><td>04-03-2024</td><td>08:12</td><td>17:00</td><td></td><td></td></tr>"
+    "<tr><td>Jueves</td><td>07-03-2024</td><td>07:58</td><td>19:30</td><td></td><td></td></tr>"
+    "<tr><td>Viernes</td><td>08-03-2024</td><td>08:00</td><td>16:00</td><td></td><td>Permiso</td></tr>"
+    "</table></body></html>"
+).encode("utf-8")
+
+_lock = threading.Lock()
+_listo = threading.Event()
+_pid_hilo = None
+_en_master = False
+_estado = {
+    "pid": os.getpid(),
+    "precargado": False,
+    "flask_s": None,
+    "importacion_s": None,
+    "calentamiento_s": None,
+    "primera_request": None,
+    "error": None,
+}
+
+
+def marcar_flask_listo():
+    """Lo llama app.py al terminar de armar la app: tiempo hasta poder responder /."""
+    _estado["flask_s"] = time.perf_counter() - INICIO
+
+
+def precargar_en_master():
+    """
+    Lo llama gunicorn.conf.py cuando preload_app está activo: al importar app en
+    el master se cargan los módulos pesados sin hilos (no sobreviven al fork) y
+    cada worker calienta después, desde post_fork.
+    """
+    global _en_master
+    _en_master = True
+
+
+def iniciar():
+    """Al importar app: carga en el master (preload) o calienta en segundo plano."""
+    if _en_master:
+        cargar()
+        _estado["precargado"] = True
+    else:
+        calentar_en_segundo_plano()
+
+
+def cargado() -> bool:
+    return all(m in sys.modules for m in MODULOS_PESADOS)
+
+
+def cargar():
+    """Importa los módulos pesados (el lock de import de Python serializa con las requests)."""
+    t = time.perf_counter()
+    for nombre in MODULOS_PESADOS:
+        importlib.import_module(nombre)
+    with _lock:
+        if _estado["importacion_s"] is None:
+            _estado["importacion_s"] = time.perf_counter() - t
+
+
+def calentar():
+    """Carga y procesa la muestra (lector HTML, cálculo, XLSX de salida)."""
+    t = time.perf_counter()
+    try:
+        cargar()
+        from procesador import _calcular_tabla, _tabla_contenido, armar_excel_resultado, detectar_formato
+
+        # Sin calcular_contenido: la muestra no cuenta en las métricas de requests
+        resultado = _calcular_tabla(_tabla_contenido(MUESTRA_HTML, detectar_formato(MUESTRA_HTML)))
+        if len(resultado) != 3:
+            raise RuntimeError(f"la muestra dio {len(resultado)} filas (se esperaban 3)")
+        armar_excel_resultado(resultado)
+    except Exception as e:
+        _estado["error"] = f"{type(e).__name__}: {e}"
+        return
+    _estado["calentamiento_s"] = time.perf_counter() - t
+    _listo.set()
+
+
+def calentar_en_segundo_plano():
+    """Lanza calentar() en un hilo daemon, una vez por proceso."""
+    global _pid_hilo
+    with _lock:
+        if _pid_hilo == os.getpid():
+            return
+        _pid_hilo = os.getpid()
+        _estado["pid"] = _pid_hilo
+    threading.Thread(target=calentar, name="calentamiento", daemon=True).start()
+
+
+def registrar_request(endpoint, segundos):
+    """Guarda la latencia de la primera request de procesamiento del worker."""
+    if _estado["primera_request"] is not None:
+        return
+    with _lock:
+        if _estado["primera_request"] is None:
+            _estado["primera_request"] = {
+                "endpoint": endpoint,
+                "segundos": round(segundos, 4),
+                "en_frio": not _listo.is_set(),
+                "tras_arranque_s": round(time.perf_counter() - INICIO, 3),
+            }
+
+
+def listo() -> bool:
+    return _listo.is_set()
+
+
+def estado():
+    e = dict(_estado, listo=_listo.is_set(), uptime_s=round(time.perf_counter() - INICIO, 3))
+    for campo in ("flask_s", "importacion_s", "calentamiento_s"):
+        if e[campo] is not None:
+            e[campo] = round(e[campo], 4)
+    return e
+
+
+def _valor(campo):
+    valor = _estado[campo]
+    if valor is None:
+        raise LookupError(campo)  # sin serie hasta que se mida
+    return valor
+
+
+metricas.medidor("reloj_arranque_flask_segundos", "Segundos desde el inicio del proceso hasta tener la app Flask.",
+                 lambda: _valor("flask_s"))
+metricas.medidor("reloj_arranque_importacion_segundos", "Segundos de importación de los módulos de procesamiento.",
+                 lambda: _valor("importacion_s"))
+metricas.medidor("reloj_arranque_calentamiento_segundos", "Segundos de calentamiento (importación + muestra).",
+                 lambda: _valor("calentamiento_s"))
+metricas.medidor("reloj_primera_request_segundos", "Duración de la primera request de procesamiento del worker.",
+                 lambda: _valor("primera_request")["segundos"])
+metricas.medidor("reloj_listo", "1 si el procesamiento ya está caliente.", lambda: int(_listo.is_set()))
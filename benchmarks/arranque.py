@@ -0,0 +1,66 @@
+"""
+Arranque en frío: en un proceso nuevo mide cuánto tarda `import app`, la
+primera respuesta de / y la primera /procesar (en frío, sin esperar el
+calentamiento, o tras esperar /listo con --esperar-listo).
+
+Uso:
+  python -m benchmarks.arranque --repeticiones 5
+  python -m benchmarks.arranque --esperar-listo --json arranque.json
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+_MEDICION = r"""
+import json, sys, time
+t = time.perf_counter()
+import app
+import arranque
+importar = time.perf_counter() - t
+cliente = app.app.test_client()
+t = time.perf_counter()
+cliente.get("/")
+salud = time.perf_counter() - t
+if {esperar}:
+    while not arranque.listo() and not arranque.estado()["error"]:
+        time.sleep(0.01)
+t = time.perf_counter()
+r = cliente.post("/procesar?formato=csv", data={{"archivo": (__import__("io").BytesIO(arranque.MUESTRA_HTML), "m.xls")}})
+r.get_data()
+primera = time.perf_counter() - t
+json.dump({{"importar_app": importar, "primera_salud": salud, "primera_procesar": primera,
+           "estado": r.status_code}}, sys.stdout)
+"""
+
+
+def medir(esperar_listo):
+    salida = subprocess.run(
+        [sys.executable, "-c", _MEDICION.format(esperar=bool(esperar_listo))],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(salida)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--esperar-listo", action="store_true", help="espera el calentamiento antes de /procesar")
+    parser.add_argument("--json", help="guarda las medianas en este archivo")
+    args = parser.parse_args(argv)
+
+    corridas = [medir(args.esperar_listo) for _ in range(args.repeticiones)]
+    medianas = {
+        campo: statistics.median(c[campo] for c in corridas)
+        for campo in ("importar_app", "primera_salud", "primera_procesar")
+    }
+    for campo, valor in medianas.items():
+        print(f"{campo:18} {valor * 1000:9.1f} ms")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"esperar_listo": args.esperar_listo, "medianas": medianas, "corridas": corridas}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Benchmark de procesador.py por etapa (detectar, parsear, calcular, escribir)
+sobre exports sintéticos de benchmarks.generador.
+
+Uso:
+  python -m benchmarks.bench --empleados 300 --dias 31 --formatos xlsx html xls
+  python -m benchmarks.bench --json bench_output.json   # para comparar entre versiones
+
+Cada etapa se mide primero sin instrumentar (mejor de --repeticiones) y luego
+una vez con tracemalloc para el pico de memoria de Python de esa etapa.
+"""
+import argparse
+import json
+import platform
+import resource
+import statistics
+import time
+import tracemalloc
+
+import procesador
+from benchmarks.generador import GENERADORES, argumentos_generador, opciones_generador
+
+ETAPAS = ("detectar", "parsear", "calcular", "escribir")
+
+
+def _etapas(contenido):
+    """Ejecuta el pipeline etapa por etapa; genera (etapa, resultado)."""
+    formato = procesador.detectar_formato(contenido)
+    yield "detectar", formato
+    tabla = procesador._tabla_contenido(contenido, formato)
+    yield "parsear", tabla
+    resultado = procesador._calcular_tabla(tabla)
+    yield "calcular", resultado
+    yield "escribir", procesador.armar_excel_resultado(resultado)
+
+
+def medir_tiempos(contenido):
+    tiempos = {}
+    t = time.perf_counter()
+    for etapa, resultado in _etapas(contenido):
+        ahora = time.perf_counter()
+        tiempos[etapa] = ahora - t
+        if etapa == "calcular":
+            filas = len(resultado)
+        t = time.perf_counter()
+    return tiempos, filas
+
+
+def medir_memoria(contenido):
+    picos = {}
+    tracemalloc.start()
+    try:
+        for etapa, _ in _etapas(contenido):
+            picos[etapa] = tracemalloc.get_traced_memory()[1]
+            tracemalloc.reset_peak()
+    finally:
+        tracemalloc.stop()
+    return picos
+
+
+def correr(formato, contenido, repeticiones):
+    muestras = {e: [] for e in ETAPAS}
+    filas = 0
+    for _ in range(repeticiones):
+        tiempos, filas = medir_tiempos(contenido)
+        for e in ETAPAS:
+            muestras[e].append(tiempos[e])
+    picos = medir_memoria(contenido)
+    total = sum(min(muestras[e]) for e in ETAPAS)
+    return {
+        "formato": formato,
+        "bytes_entrada": len(contenido),
+        "filas": filas,
+        "etapas": {
+            e: {
+                "min_s": min(muestras[e]),
+                "mediana_s": statistics.median(muestras[e]),
+                "pico_mb": picos[e] / 1e6,
+            }
+            for e in ETAPAS
+        },
+        "total_s": total,
+        "filas_por_s": filas / total if total else 0.0,
+    }
+
+
+def imprimir(resultado):
+    print(f"\n{resultado['formato']}: {resultado['bytes_entrada']:,} bytes, {resultado['filas']:,} filas")
+    print(f"  {'etapa':<10}{'min (s)':>10}{'mediana (s)':>13}{'pico (MB)':>11}")
+    for e, m in resultado["etapas"].items():
+        print(f"  {e:<10}{m['min_s']:>10.3f}{m['mediana_s']:>13.3f}{m['pico_mb']:>11.1f}")
+    print(f"  {'total':<10}{resultado['total_s']:>10.3f}   ({resultado['filas_por_s']:,.0f} filas/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark por etapa de procesador.py.")
+    parser.add_argument("--formatos", nargs="+", choices=sorted(GENERADORES), default=["xlsx", "html", "xls"])
+    parser.add_argument("--repeticiones", type=int, default=3)
+    parser.add_argument("--json", help="guarda los resultados en este archivo")
+    argumentos_generador(parser)
+    args = parser.parse_args()
+
+    opciones = opciones_generador(args)
+    resultados = []
+    for formato in args.formatos:
+        try:
+            contenido = GENERADORES[formato](**opciones)
+        except (ImportError, ValueError) as e:
+            print(f"\n{formato}: omitido ({e})")
+            continue
+        resultado = correr(formato, contenido, args.repeticiones)
+        imprimir(resultado)
+        resultados.append(resultado)
+
+    rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"\nRSS máximo del proceso: {rss_mb:.0f} MB")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "version_reglas": procesador.VERSION_REGLAS,
+                "opciones": {k: v for k, v in opciones.items() if k != "turnos"} | {"turnos": len(opciones["turnos"])},
+                "rss_max_mb": rss_mb,
+                "resultados": resultados,
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
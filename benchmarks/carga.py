@@ -0,0 +1,369 @@
+"""
+Prueba de carga del servicio completo: levanta la app con gunicorn en local,
+envía a /procesar una mezcla configurable de exports sintéticos (formato y
+tamaño) con concurrencia creciente, y reporta por nivel el throughput, la
+latencia p50/p95/p99, la tasa de error (503 de admisión aparte) y el RSS de
+cada worker. Repite con cada configuración de workers para elegir el
+despliegue con datos.
+
+Clientes en lazo cerrado: cada uno envía la siguiente subida apenas recibe la
+respuesta anterior. El RSS se lee de /proc (solo Linux). El caché de
+resultados va desactivado salvo --con-cache: se mide el procesamiento.
+
+Uso:
+  python -m benchmarks.carga --configs sync:2 gthread:2:4 gthread:1:8 --concurrencias 1 2 4 8
+  python -m benchmarks.carga --mezcla html:20:6 xlsx:20:3 html:300:1 --duracion 20 --json carga.json
+  python -m benchmarks.carga --configs gthread:2:4 --env RELOJ_MEMORIA_MB=512
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import signal
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+from benchmarks.generador import GENERADORES, TURNOS
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+INTERVALO_RSS_S = 0.2
+
+
+class Carga:
+    """Una subida de la mezcla, con el cuerpo multipart ya armado (el cliente no gasta CPU en eso)."""
+
+    __slots__ = ("etiqueta", "cuerpo", "headers")
+
+    def __init__(self, etiqueta, contenido, nombre):
+        frontera = uuid.uuid4().hex
+        self.etiqueta = etiqueta
+        self.cuerpo = (
+            f"--{frontera}\r\nContent-Disposition: form-data; name=\"archivo\"; filename=\"{nombre}\"\r\n"
+            f"Content-Type: application/octet-stream\r\n\r\n"
+        ).encode() + contenido + f"\r\n--{frontera}--\r\n".encode()
+        self.headers = {"Content-Type": f"multipart/form-data; boundary={frontera}"}
+
+
+def armar_mezcla(especificaciones, dias, variantes, semilla):
+    """
+    [(cargas, peso)] desde 'formato:empleados[:peso]'. Cada entrada genera
+    `variantes` exports distintos (otra semilla) para no repetir el mismo archivo.
+    """
+    mezcla = []
+    for espec in especificaciones:
+        formato, empleados, *peso = espec.split(":")
+        cargas = []
+        for v in range(variantes):
+            try:
+                contenido = GENERADORES[formato](n_empleados=int(empleados), dias=dias, turnos=TURNOS,
+                                                 semilla=semilla + v)
+            except (ImportError, ValueError) as e:
+                print(f"{espec}: omitido ({e})", file=sys.stderr)
+                break
+            extension = "xlsx" if formato == "xlsx" else "xls"
+            cargas.append(Carga(f"{formato}:{empleados}", contenido, f"export_{v}.{extension}"))
+        if cargas:
+            mezcla.append((cargas, float(peso[0]) if peso else 1.0))
+    if not mezcla:
+        raise SystemExit("La mezcla quedó vacía")
+    return mezcla
+
+
+def _config(texto):
+    """'clase:workers[:hilos]' -> (clase, workers, hilos)."""
+    partes = texto.split(":")
+    if partes[0] not in ("sync", "gthread") or len(partes) not in (2, 3):
+        raise argparse.ArgumentTypeError("use sync:WORKERS o gthread:WORKERS:HILOS")
+    hilos = int(partes[2]) if len(partes) == 3 else 1
+    if partes[0] == "sync" and hilos != 1:
+        raise argparse.ArgumentTypeError("sync atiende una request por worker (sin hilos)")
+    return partes[0], int(partes[1]), hilos
+
+
+def _puerto_libre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Servidor (gunicorn) y RSS de sus procesos
+# ──────────────────────────────────────────────────────────────────────────────
+
+class Servidor:
+    def __init__(self, clase, workers, hilos, env_extra, con_cache):
+        self.clase, self.workers, self.hilos = clase, workers, hilos
+        self.puerto = _puerto_libre()
+        env = dict(os.environ, **env_extra)
+        if not con_cache:
+            env["RELOJ_CACHE_MB"] = "0"
+            env.pop("RELOJ_CACHE_DIR", None)
+        self.log = tempfile.NamedTemporaryFile("w+", prefix="carga_gunicorn_", suffix=".log", delete=False)
+        # --threads 1 en sync: con más hilos gunicorn cambia solo a gthread
+        self.proceso = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "app:app", "-b", f"127.0.0.1:{self.puerto}",
+             "-k", clase, "-w", str(workers), "--threads", str(hilos)],
+            cwd=RAIZ, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+
+    def esperar_listo(self, timeout=90):
+        """Espera que todos los workers respondan /listo (calentados) varias veces seguidas."""
+        seguidas, limite = 0, time.time() + timeout
+        while seguidas < 3 * self.workers * self.hilos:
+            if self.proceso.poll() is not None or time.time() > limite:
+                self.log.seek(0)
+                raise RuntimeError(f"gunicorn no quedó listo:\n{self.log.read()[-2000:]}")
+            try:
+                con = http.client.HTTPConnection("127.0.0.1", self.puerto, timeout=5)
+                con.request("GET", "/listo")
+                estado = con.getresponse().status
+                con.close()
+            except OSError:
+                estado = None
+            seguidas = seguidas + 1 if estado == 200 else 0
+            if estado != 200:
+                time.sleep(0.2)
+
+    def pids_workers(self):
+        return _hijos(self.proceso.pid)
+
+    def detener(self):
+        self.proceso.send_signal(signal.SIGTERM)
+        try:
+            self.proceso.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proceso.kill()
+            self.proceso.wait()
+        self.log.close()
+        os.unlink(self.log.name)
+
+
+def _hijos(pid):
+    """Pids cuyo padre es `pid` (recorre /proc)."""
+    hijos = []
+    for nombre in os.listdir("/proc"):
+        if not nombre.isdigit():
+            continue
+        try:
+            with open(f"/proc/{nombre}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if ppid == pid:
+            hijos.append(int(nombre))
+    return hijos
+
+
+def _rss_bytes(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for linea in f:
+                if linea.startswith("VmRSS:"):
+                    return int(linea.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+class MuestreoRss(threading.Thread):
+    """Máximo de RSS por worker (incluye sus procesos de cálculo) mientras corre un nivel."""
+
+    def __init__(self, servidor):
+        super().__init__(daemon=True)
+        self.servidor = servidor
+        self.maximos = {}
+        self._parar = threading.Event()
+
+    def run(self):
+        while not self._parar.wait(INTERVALO_RSS_S):
+            for pid in self.servidor.pids_workers():
+                rss = _rss_bytes(pid) + sum(_rss_bytes(h) for h in _hijos(pid))
+                self.maximos[pid] = max(self.maximos.get(pid, 0), rss)
+
+    def detener(self):
+        self._parar.set()
+        self.join()
+        return self.maximos
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Clientes y estadísticas
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _cliente(puerto, ruta, mezcla, fin, resultados, semilla, timeout):
+    rnd = random.Random(semilla)
+    grupos = [cargas for cargas, _ in mezcla]
+    pesos = [peso for _, peso in mezcla]
+    con = http.client.HTTPConnection("127.0.0.1", puerto, timeout=timeout)
+    while time.perf_counter() < fin:
+        carga = rnd.choice(rnd.choices(grupos, pesos)[0])
+        t = time.perf_counter()
+        try:
+            con.request("POST", ruta, body=carga.cuerpo, headers=carga.headers)
+            respuesta = con.getresponse()
+            respuesta.read()
+            estado = respuesta.status
+        except (OSError, http.client.HTTPException) as e:
+            estado = type(e).__name__
+            con.close()  # se reabre sola en la siguiente request
+        resultados.append((carga.etiqueta, estado, time.perf_counter() - t, len(carga.cuerpo)))
+    con.close()
+
+
+def _percentiles(latencias):
+    if len(latencias) < 2:
+        valor = latencias[0] if latencias else None
+        return {"p50_s": valor, "p95_s": valor, "p99_s": valor}
+    cortes = statistics.quantiles(latencias, n=100, method="inclusive")
+    return {"p50_s": cortes[49], "p95_s": cortes[94], "p99_s": cortes[98]}
+
+
+def correr_nivel(servidor, ruta, mezcla, concurrencia, duracion, timeout):
+    resultados = []
+    muestreo = MuestreoRss(servidor)
+    muestreo.start()
+    inicio = time.perf_counter()
+    fin = inicio + duracion
+    clientes = [
+        threading.Thread(target=_cliente, args=(servidor.puerto, ruta, mezcla, fin, resultados, i, timeout))
+        for i in range(concurrencia)
+    ]
+    for c in clientes:
+        c.start()
+    for c in clientes:
+        c.join()
+    segundos = time.perf_counter() - inicio  # incluye esperar las últimas respuestas
+    rss = muestreo.detener()
+
+    ok = [r for r in resultados if r[1] == 200]
+    estados = {}
+    for r in resultados:
+        estados[str(r[1])] = estados.get(str(r[1]), 0) + 1
+    rechazadas = estados.get("503", 0)
+    errores = len(resultados) - len(ok) - rechazadas
+    por_carga = {}
+    for etiqueta in sorted({r[0] for r in ok}):
+        latencias = [r[2] for r in ok if r[0] == etiqueta]
+        por_carga[etiqueta] = {"requests": len(latencias), **_percentiles(latencias)}
+    return {
+        "concurrencia": concurrencia,
+        "segundos": segundos,
+        "requests": len(resultados),
+        "ok": len(ok),
+        "throughput_rps": len(ok) / segundos,
+        "mb_por_s": sum(r[3] for r in ok) / 1e6 / segundos,
+        **_percentiles([r[2] for r in ok]),
+        "tasa_error": errores / len(resultados) if resultados else 0.0,
+        "tasa_503": rechazadas / len(resultados) if resultados else 0.0,
+        "estados": estados,
+        "por_carga": por_carga,
+        "rss_worker_max_mb": {str(pid): b / 1e6 for pid, b in sorted(rss.items())},
+    }
+
+
+def _ms(valor):
+    return f"{valor * 1000:8.0f}" if valor is not None else f"{'-':>8}"
+
+
+def imprimir_nivel(nombre, nivel):
+    rss = list(nivel["rss_worker_max_mb"].values())
+    print(f"  {nombre:<14}{nivel['concurrencia']:>4}{nivel['throughput_rps']:>9.2f}"
+          f"{_ms(nivel['p50_s'])}{_ms(nivel['p95_s'])}{_ms(nivel['p99_s'])}"
+          f"{nivel['tasa_error'] * 100:>8.1f}%{nivel['tasa_503'] * 100:>7.1f}%"
+          f"{max(rss, default=0):>9.0f}{sum(rss):>9.0f}")
+
+
+def _encabezado():
+    print(f"  {'config':<14}{'conc':>4}{'req/s':>9}{'p50 ms':>8}{'p95 ms':>8}{'p99 ms':>8}"
+          f"{'error':>9}{'503':>8}{'rss máx':>9}{'rss tot':>9}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--configs", nargs="+", type=_config, default=[("sync", 2, 1), ("gthread", 2, 4)],
+                        metavar="CLASE:WORKERS[:HILOS]", help="configuraciones de gunicorn a comparar")
+    parser.add_argument("--concurrencias", nargs="+", type=int, default=[1, 2, 4, 8])
+    parser.add_argument("--duracion", type=float, default=15, help="segundos por nivel de concurrencia")
+    parser.add_argument("--mezcla", nargs="+", default=["html:20:6", "xlsx:20:3", "html:300:1"],
+                        metavar="FORMATO:EMPLEADOS[:PESO]", help="subidas a enviar y su peso relativo")
+    parser.add_argument("--dias", type=int, default=31)
+    parser.add_argument("--variantes", type=int, default=3, help="exports distintos por entrada de la mezcla")
+    parser.add_argument("--salida", default="xlsx", choices=("xlsx", "csv", "ndjson", "parquet"),
+                        help="formato pedido a /procesar")
+    parser.add_argument("--con-cache", action="store_true", help="deja activo el caché de resultados")
+    parser.add_argument("--env", action="append", default=[], metavar="VAR=VALOR",
+                        help="variable de entorno para el servidor (repetible)")
+    parser.add_argument("--timeout", type=float, default=120, help="timeout del cliente por request (s)")
+    parser.add_argument("--max-error", type=float, default=0.5,
+                        help="deja de subir la concurrencia de una config si la tasa de error la supera")
+    parser.add_argument("--slo-p95", type=float, default=5.0, help="p95 aceptable (s) para el resumen final")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--json", help="guarda todos los resultados en este archivo")
+    args = parser.parse_args(argv)
+
+    env_extra = dict(e.split("=", 1) for e in args.env)
+    mezcla = armar_mezcla(args.mezcla, args.dias, args.variantes, args.semilla)
+    for cargas, peso in mezcla:
+        tamanos = sorted(len(c.cuerpo) for c in cargas)
+        print(f"{cargas[0].etiqueta:<12} peso {peso:g}: {tamanos[0]:,}-{tamanos[-1]:,} bytes")
+    ruta = f"/procesar?formato={args.salida}"
+
+    corridas = []
+    print()
+    _encabezado()
+    for clase, workers, hilos in args.configs:
+        nombre = f"{clase}:{workers}" + (f":{hilos}" if clase == "gthread" else "")
+        servidor = Servidor(clase, workers, hilos, env_extra, args.con_cache)
+        try:
+            servidor.esperar_listo()
+            niveles = []
+            for concurrencia in sorted(args.concurrencias):
+                nivel = correr_nivel(servidor, ruta, mezcla, concurrencia, args.duracion, args.timeout)
+                imprimir_nivel(nombre, nivel)
+                niveles.append(nivel)
+                if nivel["tasa_error"] > args.max_error:
+                    print(f"  {nombre}: tasa de error sobre {args.max_error:.0%}, no se sube más la concurrencia")
+                    break
+        finally:
+            servidor.detener()
+        corridas.append({"config": nombre, "clase": clase, "workers": workers, "hilos": hilos, "niveles": niveles})
+
+    # Por config: el mayor throughput con p95 dentro del SLO, sin errores ni rechazos (503)
+    print(f"\nMejor nivel por configuración (p95 <= {args.slo_p95:g} s, sin errores ni 503):")
+    resumen = []
+    for corrida in corridas:
+        aceptables = [n for n in corrida["niveles"]
+                      if n["p95_s"] is not None and n["p95_s"] <= args.slo_p95
+                      and n["tasa_error"] == 0 and n["tasa_503"] == 0]
+        mejor = max(aceptables, key=lambda n: n["throughput_rps"], default=None)
+        resumen.append({"config": corrida["config"], "mejor": mejor})
+    resumen.sort(key=lambda r: r["mejor"]["throughput_rps"] if r["mejor"] else -1, reverse=True)
+    _encabezado()
+    for r in resumen:
+        if r["mejor"] is None:
+            print(f"  {r['config']:<14} ningún nivel cumple")
+        else:
+            imprimir_nivel(r["config"], r["mejor"])
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "opciones": {k: v for k, v in vars(args).items() if k != "json"},
+                "corridas": corridas,
+                "mejor_por_config": [{"config": r["config"], "concurrencia": r["mejor"] and r["mejor"]["concurrencia"]}
+                                     for r in resumen],
+            }, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
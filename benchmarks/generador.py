@@ -0,0 +1,191 @@
+"""
+Generador de exports sintéticos del reloj control, en los tres formatos que
+acepta procesador.py:
+
+  xlsx  -> layout por bloques (Funcionario/Rut/.../tabla 'Día') de _procesar_hoja_openpyxl
+  xls   -> .xls binario (BIFF) con una tabla Fecha/Entrada/Salida, para _procesar_dataframe_generico
+  html  -> XLS-HTML con metadatos y tabla por funcionario, para detectar_html_y_procesar
+
+Uso:
+  python -m benchmarks.generador --formato html --empleados 300 --dias 31 -o marzo.xls
+"""
+import argparse
+import random
+from datetime import date, timedelta
+from html import escape
+from io import BytesIO
+
+TURNOS = (
+    "08:00-17:00 / 08:00-16:00 (vi)",
+    "08:00-17:00",
+    "07:30-16:30 / 07:30-15:30 (vi)",
+    "08:30-17:30",
+    "20:00-08:00",
+)
+DIAS_SEMANA = ("Lunes", "Martes", "Miércoles", "Jueves", "Viernes", "Sábado", "Domingo")
+COLUMNAS = ("Día", "Fecha", "Entrada", "Salida", "Horas", "Descripción")
+
+
+def _hhmm(minutos, segundos=False):
+    minutos %= 24 * 60
+    base = f"{minutos // 60:02}:{minutos % 60:02}"
+    return base + ":00" if segundos else base
+
+
+def empleados(n_empleados, dias, turnos=TURNOS, pct_ausencias=0.05, pct_faltas=0.05,
+              desde=date(2024, 3, 1), semilla=0):
+    """
+    Genera (meta, marcas) por funcionario. meta = dict con Funcionario, Rut,
+    Organigrama, Turno, Periodo; marcas = lista de (fecha, entrada, salida, descripcion).
+    """
+    rng = random.Random(semilla)
+    hasta = desde + timedelta(days=dias - 1)
+    for e in range(n_empleados):
+        turno = rng.choice(turnos)
+        meta = {
+            "Funcionario": f"Funcionario {e:05d}",
+            "Rut": f"{10_000_000 + e * 7919 % 9_000_000}-{rng.choice('0123456789K')}",
+            "Organigrama": f"CESFAM / Unidad {e % 12}",
+            "Turno": turno,
+            "Periodo": f"{desde:%d-%m-%Y} al {hasta:%d-%m-%Y}",
+        }
+        inicio = int(turno[:2]) * 60 + int(turno[3:5])
+        marcas = []
+        for d in range(dias):
+            fecha = desde + timedelta(days=d)
+            if fecha.weekday() >= 5:
+                marcas.append((fecha, "", "", "Libre"))
+                continue
+            r = rng.random()
+            if r < pct_ausencias:
+                marcas.append((fecha, "-", "-", "Ausente"))
+                continue
+            entrada = inicio + int(rng.gauss(0, 12))
+            salida = entrada + 9 * 60 + int(rng.expovariate(1 / 40))
+            if r < pct_ausencias + pct_faltas:
+                if rng.random() < 0.5:
+                    marcas.append((fecha, "-", _hhmm(salida, True), "Falta Entrada"))
+                else:
+                    marcas.append((fecha, _hhmm(entrada, True), "-", "Falta Salida"))
+                continue
+            marcas.append((fecha, _hhmm(entrada, True), _hhmm(salida, True), ""))
+        yield meta, marcas
+
+
+def generar_xlsx(**kw) -> bytes:
+    """Layout por bloques que lee _procesar_hoja_openpyxl."""
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Reporte")
+    for meta, marcas in empleados(**kw):
+        for campo in ("Funcionario", "Rut", "Organigrama", "Turno", "Periodo"):
+            ws.append([campo, f": {meta[campo]}"])
+        ws.append([])
+        ws.append(list(COLUMNAS))
+        for fecha, entrada, salida, desc in marcas:
+            ws.append([DIAS_SEMANA[fecha.weekday()], fecha.strftime("%d-%m-%Y"), entrada, salida, None, desc])
+        ws.append(["Totales"])
+        ws.append([])
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def generar_xls(**kw) -> bytes:
+    """
+    .xls binario (requiere xlwt, ver requirements-dev.txt). El parser genérico
+    lee una sola tabla con los metadatos del encabezado, así que todas las
+    marcas van en una tabla.
+    """
+    import xlwt
+
+    wb = xlwt.Workbook()
+    ws = wb.add_sheet("Reporte")
+    fila = 0
+    tabla_iniciada = False
+    for meta, marcas in empleados(**kw):
+        if not tabla_iniciada:
+            for campo in ("Funcionario", "Rut", "Organigrama", "Turno", "Periodo"):
+                ws.write(fila, 0, campo)
+                ws.write(fila, 1, meta[campo])
+                fila += 1
+            fila += 1
+            for j, c in enumerate(("Fecha", "Entrada", "Salida", "Horas", "Descripción")):
+                ws.write(fila, j, c)
+            fila += 1
+            tabla_iniciada = True
+        for fecha, entrada, salida, desc in marcas:
+            if fila >= 65536:
+                raise ValueError("El formato .xls admite como máximo 65536 filas")
+            for j, v in enumerate((fecha.strftime("%d/%m/%Y"), entrada, salida, "", desc)):
+                ws.write(fila, j, v)
+            fila += 1
+    out = BytesIO()
+    wb.save(out)
+    return out.getvalue()
+
+
+def generar_html(**kw) -> bytes:
+    """XLS-HTML: metadatos + tabla de marcas por funcionario."""
+    partes = [
+        "<html><head><meta http-equiv='Content-Type' content='text/html; charset=iso-8859-1'>"
+        "</head><body>"
+    ]
+    for meta, marcas in empleados(**kw):
+        partes.append("<table>")
+        for campo in ("Funcionario", "Rut", "Organigrama", "Turno", "Periodo"):
+            partes.append(f"<tr><td><b>{campo}</b></td><td>: {escape(meta[campo])}</td></tr>")
+        partes.append("</table><table border='1'><tr>")
+        partes.extend(f"<th>{c}</th>" for c in COLUMNAS)
+        partes.append("</tr>")
+        for fecha, entrada, salida, desc in marcas:
+            partes.append(
+                f"<tr><td>{DIAS_SEMANA[fecha.weekday()]}</td><td>{fecha:%d-%m-%Y}</td>"
+                f"<td>{entrada}</td><td>{salida}</td><td></td><td>{escape(desc)}</td></tr>"
+            )
+        partes.append("</table><br>")
+    partes.append("</body></html>")
+    return "".join(partes).encode("latin-1", errors="replace")
+
+
+GENERADORES = {"xlsx": generar_xlsx, "xls": generar_xls, "html": generar_html}
+
+
+def argumentos_generador(parser):
+    """Agrega al parser las opciones de tamaño/mezcla del export sintético."""
+    parser.add_argument("--empleados", type=int, default=100)
+    parser.add_argument("--dias", type=int, default=31)
+    parser.add_argument("--turnos", type=int, default=len(TURNOS),
+                        help=f"cuántos turnos distintos usar (1-{len(TURNOS)})")
+    parser.add_argument("--ausencias", type=float, default=0.05, help="fracción de días ausentes")
+    parser.add_argument("--faltas", type=float, default=0.05, help="fracción de días con una marca faltante")
+    parser.add_argument("--semilla", type=int, default=0)
+
+
+def opciones_generador(args):
+    return {
+        "n_empleados": args.empleados,
+        "dias": args.dias,
+        "turnos": TURNOS[:max(1, min(args.turnos, len(TURNOS)))],
+        "pct_ausencias": args.ausencias,
+        "pct_faltas": args.faltas,
+        "semilla": args.semilla,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera exports sintéticos del reloj control.")
+    parser.add_argument("--formato", choices=sorted(GENERADORES), default="html")
+    parser.add_argument("-o", "--salida", required=True)
+    argumentos_generador(parser)
+    args = parser.parse_args()
+
+    datos = GENERADORES[args.formato](**opciones_generador(args))
+    with open(args.salida, "wb") as f:
+        f.write(datos)
+    print(f"{args.salida}: {len(datos):,} bytes ({args.formato}, {args.empleados} funcionarios x {args.dias} días)")
+
+
+if __name__ == "__main__":
+    main()
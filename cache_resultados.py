@@ -0,0 +1,134 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from procesador import VERSION_REGLAS
+
+
+class CacheResultados:
+    """
+    Caché LRU de resultados por contenido (sha256 de la subida + versión de
+    reglas), con tope en bytes. Opcionalmente guarda cada resultado también en
+    disco, para que sobreviva a reinicios del worker y se comparta entre workers.
+    """
+
+    def __init__(self, max_bytes, directorio=None, max_bytes_disco=0):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.max_bytes_disco = max_bytes_disco
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.hits_disco = 0
+        self.misses = 0
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+
+    @staticmethod
+    def clave(contenido: bytes, *variante) -> str:
+        h = hashlib.sha256()
+        h.update(f"reglas={VERSION_REGLAS};{';'.join(variante)}\n".encode())
+        h.update(contenido)
+        return h.hexdigest()
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, clave + ".bin")
+
+    def _poner_en_memoria(self, clave, datos):
+        # Se asume el lock tomado
+        if len(datos) > self.max_bytes:
+            return
+        if clave in self._items:
+            self._bytes -= len(self._items.pop(clave))
+        self._items[clave] = datos
+        self._bytes += len(datos)
+        while self._bytes > self.max_bytes:
+            _, viejo = self._items.popitem(last=False)
+            self._bytes -= len(viejo)
+
+    def obtener(self, clave):
+        """bytes del resultado o None."""
+        with self._lock:
+            datos = self._items.get(clave)
+            if datos is not None:
+                self._items.move_to_end(clave)
+                self.hits += 1
+                return datos
+
+        datos = self._leer_disco(clave)
+        with self._lock:
+            if datos is None:
+                self.misses += 1
+                return None
+            self.hits_disco += 1
+            self._poner_en_memoria(clave, datos)
+            return datos
+
+    def guardar(self, clave, datos: bytes):
+        with self._lock:
+            self._poner_en_memoria(clave, datos)
+        self._escribir_disco(clave, datos)
+
+    def _leer_disco(self, clave):
+        if not self.directorio:
+            return None
+        ruta = self._ruta(clave)
+        try:
+            with open(ruta, "rb") as f:
+                datos = f.read()
+            os.utime(ruta)  # el mtime hace de "último uso" para el LRU en disco
+            return datos
+        except OSError:
+            return None
+
+    def _escribir_disco(self, clave, datos):
+        if not self.directorio or len(datos) > self.max_bytes_disco:
+            return
+        tmp = self._ruta(clave) + f".{os.getpid()}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(datos)
+            os.replace(tmp, self._ruta(clave))
+        except OSError:
+            return
+        self._recortar_disco()
+
+    def _recortar_disco(self):
+        """Borra los archivos menos usados hasta quedar bajo max_bytes_disco."""
+        archivos = []
+        for nombre in os.listdir(self.directorio):
+            if not nombre.endswith(".bin"):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directorio, nombre))
+            except OSError:
+                continue
+            archivos.append((st.st_mtime, st.st_size, nombre))
+        total = sum(a[1] for a in archivos)
+        for _, tamano, nombre in sorted(archivos):
+            if total <= self.max_bytes_disco:
+                break
+            try:
+                os.remove(os.path.join(self.directorio, nombre))
+                total -= tamano
+            except OSError:
+                pass
+
+    def estadisticas(self):
+        with self._lock:
+            return {
+                "hits": self.hits, "hits_disco": self.hits_disco, "misses": self.misses,
+                "entradas": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                "directorio": self.directorio,
+            }
+
+
+# Caché del worker. RELOJ_CACHE_MB=0 la desactiva en memoria; RELOJ_CACHE_DIR
+# activa la copia en disco (con tope RELOJ_CACHE_DISCO_MB).
+cache = CacheResultados(
+    max_bytes=int(float(os.environ.get("RELOJ_CACHE_MB", "64")) * 1024 * 1024),
+    directorio=os.environ.get("RELOJ_CACHE_DIR") or None,
+    max_bytes_disco=int(float(os.environ.get("RELOJ_CACHE_DISCO_MB", "512")) * 1024 * 1024),
+)
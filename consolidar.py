@@ -0,0 +1,263 @@
+"""
+Procesamiento masivo sin HTTP: recorre un directorio de exports del reloj
+control y los consolida en una sola salida (detalle, resumen y errores), para
+cierres de mes con decenas o cientos de archivos.
+
+Pipeline en generadores: buscar archivos -> detectar/parsear/calcular en un
+pool de procesos (con pocos archivos en vuelo) -> anexar filas a la salida en
+el orden de los archivos. La memoria no crece con la cantidad de archivos.
+
+Cada archivo terminado queda en un checkpoint (progreso.jsonl en la carpeta de
+salida) junto al tamaño de cada salida en ese momento: si el proceso se corta,
+volver a correr el mismo comando recorta lo escrito a medias y sigue desde el
+siguiente archivo.
+
+Uso:
+  python -m consolidar exports/marzo -o consolidado/marzo
+  python -m consolidar exports/marzo -o consolidado/marzo --formato ndjson --procesos 4
+  python -m consolidar exports/marzo -o consolidado/marzo --reiniciar
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from ejecutor import CONTEXTO, MAX_PROCESOS
+from procesador import (
+    COLUMNAS_DETALLE, COLUMNAS_ERRORES, COLUMNAS_RESUMEN, calcular_archivo, generar_csv, generar_ndjson,
+)
+
+EXTENSIONES = (".xls", ".xlsx", ".htm", ".html")
+CHECKPOINT = "progreso.jsonl"
+_HOJAS = (("detalle", COLUMNAS_DETALLE), ("resumen", COLUMNAS_RESUMEN), ("errores", COLUMNAS_ERRORES))
+
+
+class SalidaInconsistente(RuntimeError):
+    """La carpeta de salida no corresponde al checkpoint (o hay salida sin checkpoint)."""
+
+
+def buscar_archivos(directorio, extensiones=EXTENSIONES, excluir=None):
+    """Genera (ruta_relativa, ruta) de los exports bajo `directorio`, en orden estable."""
+    excluir = os.path.abspath(excluir) if excluir else None
+    for raiz, carpetas, archivos in os.walk(directorio):
+        carpetas[:] = sorted(c for c in carpetas
+                             if not c.startswith(".") and os.path.abspath(os.path.join(raiz, c)) != excluir)
+        for nombre in sorted(archivos):
+            if nombre.startswith(".") or not nombre.lower().endswith(extensiones):
+                continue
+            ruta = os.path.join(raiz, nombre)
+            yield os.path.relpath(ruta, directorio), ruta
+
+
+def calcular_en_pool(archivos, pool, en_vuelo):
+    """
+    Genera (relativa, ruta, resultado, error) en el mismo orden de `archivos`,
+    con a lo más `en_vuelo` archivos enviados al pool a la vez.
+    """
+    pendientes = deque()
+    for relativa, ruta in archivos:
+        pendientes.append((relativa, ruta, pool.submit(calcular_archivo, ruta)))
+        if len(pendientes) >= en_vuelo:
+            yield _recoger(*pendientes.popleft())
+    while pendientes:
+        yield _recoger(*pendientes.popleft())
+
+
+def _recoger(relativa, ruta, futuro):
+    try:
+        return relativa, ruta, futuro.result(), None
+    except Exception as e:
+        return relativa, ruta, None, str(e) or repr(e)
+
+
+class SalidaConsolidada:
+    """
+    Archivos de salida (detalle, resumen, errores) abiertos en modo anexar más
+    el checkpoint. Al abrir recorta cada salida al tamaño del último archivo
+    completado, así lo escrito a medias antes de un corte no queda duplicado.
+    """
+
+    def __init__(self, carpeta, formato="csv", reiniciar=False):
+        self.carpeta = carpeta
+        self.formato = formato
+        self.extension = "csv" if formato == "csv" else "ndjson"
+        os.makedirs(carpeta, exist_ok=True)
+        self.ruta_checkpoint = os.path.join(carpeta, CHECKPOINT)
+        rutas = {hoja: self._ruta(hoja) for hoja, _ in _HOJAS}
+        if reiniciar:
+            for ruta in (*rutas.values(), self.ruta_checkpoint):
+                if os.path.exists(ruta):
+                    os.remove(ruta)
+
+        self.hechos, tamanos = self._leer_checkpoint()
+        if tamanos is None and any(os.path.exists(r) for r in rutas.values()):
+            raise SalidaInconsistente(
+                f"{carpeta} ya tiene salidas sin {CHECKPOINT}: use --reiniciar o otra carpeta"
+            )
+        self._archivos = {}
+        for hoja, columnas in _HOJAS:
+            f = open(rutas[hoja], "a+b")
+            tamano = (tamanos or {}).get(hoja, 0)
+            if os.fstat(f.fileno()).st_size < tamano:
+                raise SalidaInconsistente(f"{rutas[hoja]} es más corto que lo registrado en {CHECKPOINT}")
+            f.truncate(tamano)
+            self._archivos[hoja] = (f, columnas)
+            if tamano == 0 and formato == "csv":
+                self._escribir(hoja, [], encabezado=True)
+        self._checkpoint = open(self.ruta_checkpoint, "a", encoding="utf-8")
+        if tamanos is None:
+            # Corrida nueva: los encabezados quedan registrados antes del primer
+            # archivo, así un corte temprano también se puede reanudar
+            self._registrar({"archivo": None})
+
+    def _ruta(self, hoja):
+        return os.path.join(self.carpeta, f"{hoja}.{self.extension}")
+
+    def _leer_checkpoint(self):
+        """({relativa: registro}, tamaños de salida tras el último archivo) o ({}, None)."""
+        hechos, tamanos = {}, None
+        if not os.path.exists(self.ruta_checkpoint):
+            return hechos, tamanos
+        with open(self.ruta_checkpoint, encoding="utf-8") as f:
+            for linea in f:
+                try:
+                    registro = json.loads(linea)
+                except ValueError:
+                    break  # última línea escrita a medias
+                if registro["archivo"] is not None:
+                    hechos[registro["archivo"]] = registro
+                tamanos = registro["tamanos"]
+        return hechos, tamanos
+
+    def _escribir(self, hoja, filas, encabezado=False):
+        f, columnas = self._archivos[hoja]
+        if self.formato == "csv":
+            partes = generar_csv(columnas, filas, encabezado=encabezado)
+        else:
+            partes = generar_ndjson(columnas, filas)
+        for parte in partes:
+            if parte:
+                f.write(parte.encode("utf-8"))
+
+    def agregar(self, relativa, ruta, resultado, error):
+        """Anexa el archivo a la salida y lo marca como hecho en el checkpoint. Retorna sus filas."""
+        if error is None:
+            self._escribir("detalle", resultado.filas_detalle())
+            self._escribir("resumen", resultado.filas_resumen())
+            filas = len(resultado)
+        else:
+            self._escribir("errores", [[relativa, error]])
+            filas = 0
+        st = os.stat(ruta)
+        self.hechos[relativa] = self._registrar({"archivo": relativa, "bytes": st.st_size,
+                                                 "mtime_ns": st.st_mtime_ns, "filas": filas, "error": error})
+        return filas
+
+    def _registrar(self, registro):
+        """Sincroniza las salidas y anota el registro con sus tamaños en el checkpoint."""
+        tamanos = {}
+        for hoja, (f, _) in self._archivos.items():
+            f.flush()
+            os.fsync(f.fileno())
+            tamanos[hoja] = f.tell()
+        registro["tamanos"] = tamanos
+        self._checkpoint.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        self._checkpoint.flush()
+        os.fsync(self._checkpoint.fileno())
+        return registro
+
+    def cerrar(self):
+        for f, _ in self._archivos.values():
+            f.close()
+        self._checkpoint.close()
+
+
+def consolidar(directorio, carpeta_salida, formato="csv", procesos=None, reiniciar=False, progreso=sys.stderr):
+    """Procesa el directorio completo (o lo que falte). Retorna el resumen de la corrida como dict."""
+    salida = SalidaConsolidada(carpeta_salida, formato, reiniciar)
+    try:
+        todos = list(buscar_archivos(directorio, excluir=carpeta_salida))
+        pendientes = [(r, ruta) for r, ruta in todos if r not in salida.hechos]
+        cambiados = [r for r, ruta in todos if r in salida.hechos and _cambio(salida.hechos[r], ruta)]
+        for relativa in cambiados:
+            print(f"aviso: {relativa} cambió desde que se procesó; no se reprocesa (use --reiniciar)",
+                  file=progreso)
+        if len(pendientes) < len(todos):
+            print(f"reanudando: {len(todos) - len(pendientes)} de {len(todos)} archivos ya procesados",
+                  file=progreso)
+
+        procesos = procesos or MAX_PROCESOS
+        archivos = filas = errores = bytes_leidos = 0
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=CONTEXTO) as pool:
+            for relativa, ruta, resultado, error in calcular_en_pool(pendientes, pool, en_vuelo=2 * procesos):
+                n = salida.agregar(relativa, ruta, resultado, error)
+                resultado = None  # se suelta antes de esperar el siguiente
+                archivos += 1
+                filas += n
+                errores += error is not None
+                bytes_leidos += salida.hechos[relativa]["bytes"]
+                transcurrido = time.perf_counter() - inicio
+                estado = f"ERROR: {error}" if error else f"{n:,} filas"
+                print(f"[{archivos}/{len(pendientes)}] {relativa}: {estado} "
+                      f"({archivos / transcurrido:.1f} archivos/s, {filas / transcurrido:,.0f} filas/s)",
+                      file=progreso, flush=True)
+        segundos = time.perf_counter() - inicio
+    finally:
+        salida.cerrar()
+
+    return {
+        "archivos": archivos,
+        "ya_procesados": len(todos) - len(pendientes),
+        "errores": errores,
+        "filas": filas,
+        "bytes": bytes_leidos,
+        "segundos": round(segundos, 3),
+        "archivos_por_s": round(archivos / segundos, 2) if segundos else 0.0,
+        "filas_por_s": round(filas / segundos) if segundos else 0,
+        "mb_por_s": round(bytes_leidos / 1e6 / segundos, 2) if segundos else 0.0,
+        "procesos": procesos,
+        "salida": {hoja: salida._ruta(hoja) for hoja, _ in _HOJAS},
+    }
+
+
+def _cambio(registro, ruta):
+    st = os.stat(ruta)
+    return (registro["bytes"], registro["mtime_ns"]) != (st.st_size, st.st_mtime_ns)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directorio", help="carpeta con los exports (se recorre recursivamente)")
+    parser.add_argument("-o", "--salida", required=True, help="carpeta de salida (detalle, resumen, errores, checkpoint)")
+    parser.add_argument("--formato", choices=("csv", "ndjson"), default="csv")
+    parser.add_argument("--procesos", type=int, help=f"procesos de cálculo (por defecto {MAX_PROCESOS})")
+    parser.add_argument("--reiniciar", action="store_true", help="descarta la salida y el checkpoint previos")
+    parser.add_argument("--json", help="guarda el resumen de la corrida en este archivo")
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(args.directorio):
+        parser.error(f"no existe el directorio {args.directorio}")
+    try:
+        resumen = consolidar(args.directorio, args.salida, args.formato, args.procesos, args.reiniciar)
+    except SalidaInconsistente as e:
+        parser.error(str(e))
+    except KeyboardInterrupt:
+        print("\ninterrumpido: vuelva a correr el mismo comando para continuar", file=sys.stderr)
+        return 130
+
+    print(f"\n{resumen['archivos']} archivos ({resumen['errores']} con error, "
+          f"{resumen['ya_procesados']} ya procesados antes), {resumen['filas']:,} filas "
+          f"en {resumen['segundos']:.1f} s")
+    print(f"{resumen['archivos_por_s']} archivos/s, {resumen['filas_por_s']:,} filas/s, {resumen['mb_por_s']} MB/s")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resumen, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
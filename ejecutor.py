@@ -0,0 +1,40 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# Procesos de cálculo por worker de gunicorn (RELOJ_PROCESOS, por defecto uno por CPU)
+MAX_PROCESOS = max(1, int(os.environ.get("RELOJ_PROCESOS") or os.cpu_count() or 1))
+
+# Los procesos de cálculo no se crean con fork: el worker de gunicorn tiene
+# hilos (gthread, calentamiento) y un hijo forkeado puede heredar tomado un
+# lock de otro hilo (import, logging, sqlite) y colgarse. forkserver los crea
+# desde un proceso aparte de un solo hilo.
+CONTEXTO = multiprocessing.get_context("forkserver")
+
+_pool = None
+_lock = threading.Lock()
+
+
+def obtener_pool() -> ProcessPoolExecutor:
+    """Pool de procesos acotado, compartido por todo el worker (se crea al primer uso)."""
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=MAX_PROCESOS, mp_context=CONTEXTO)
+        return _pool
+
+
+def enviar(fn, *args):
+    """
+    Encola fn(*args) en el pool. Si un proceso hijo murió (p. ej. OOM) el pool
+    queda roto: se reemplaza por uno nuevo y se reintenta una vez.
+    """
+    global _pool
+    try:
+        return obtener_pool().submit(fn, *args)
+    except BrokenProcessPool:
+        with _lock:
+            _pool = None
+        return obtener_pool().submit(fn, *args)
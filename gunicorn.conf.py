@@ -0,0 +1,24 @@
+# Configuración de gunicorn (la toma sola desde el directorio de trabajo: el
+# Procfile sigue siendo "gunicorn app:app").
+import os
+
+import arranque
+
+# Preload: el master importa app y los módulos pesados una vez; los workers los
+# heredan por fork (copy-on-write) y arrancan sin volver a importarlos.
+# RELOJ_PRECARGA=0 vuelve al comportamiento por defecto (cada worker importa).
+preload_app = os.environ.get("RELOJ_PRECARGA", "1") != "0"
+
+if preload_app:
+    arranque.precargar_en_master()
+
+
+def post_fork(server, worker):
+    # Los hilos no sobreviven al fork: cada worker calienta el suyo
+    if preload_app:
+        arranque.calentar_en_segundo_plano()
+
+# Hilos por worker (gthread): mientras una subida se procesa, /, /listo y
+# /metrics siguen respondiendo, y las subidas concurrentes pasan por el control
+# de admisión por memoria (admision.py) en vez de apilarse en el socket.
+threads = int(os.environ.get("RELOJ_HILOS", "4"))
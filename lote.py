@@ -0,0 +1,152 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+from itertools import chain
+
+import metricas
+from ejecutor import enviar
+from procesador import armar_excel_salida, calcular_archivo, calcular_contenido
+
+# Límites del lote (protegen contra ZIPs enormes o "zip bombs")
+MAX_ARCHIVOS_LOTE = int(os.environ.get("RELOJ_LOTE_MAX_ARCHIVOS", "500"))
+MAX_BYTES_LOTE = int(float(os.environ.get("RELOJ_LOTE_MAX_MB", "200")) * 1024 * 1024)
+
+
+class LoteInvalido(ValueError):
+    """El lote no se puede procesar (vacío, ZIP dañado o sobre los límites)."""
+
+
+def tamano(archivo) -> int:
+    """Bytes de un archivo binario abierto (queda posicionado al comienzo)."""
+    archivo.seek(0, os.SEEK_END)
+    n = archivo.tell()
+    archivo.seek(0)
+    return n
+
+
+def _es_zip_de_archivos(archivo) -> bool:
+    """ZIP contenedor; un .xlsx también es ZIP, pero trae [Content_Types].xml."""
+    try:
+        if archivo.read(2) != b"PK":
+            return False
+        archivo.seek(0)
+        with zipfile.ZipFile(archivo) as zf:
+            return "[Content_Types].xml" not in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
+    finally:
+        archivo.seek(0)
+
+
+def expandir_archivos(partes, directorio=None):
+    """
+    partes: lista de (nombre, contenido), con contenido en bytes o un archivo
+    binario abierto (la subida en su temporal en disco). Los ZIP se reemplazan
+    por los archivos que contienen, extraídos por streaming a temporales en
+    `directorio`. Retorna lista de (nombre, archivo) en el orden recibido;
+    al terminar hay que cerrarlos con cerrar_archivos.
+    """
+    archivos = []
+    total = 0
+    try:
+        for nombre, contenido in partes:
+            archivo = BytesIO(contenido) if isinstance(contenido, (bytes, bytearray)) else contenido
+            if not _es_zip_de_archivos(archivo):
+                archivos.append((nombre, archivo))
+                total += tamano(archivo)
+                continue
+            try:
+                with zipfile.ZipFile(archivo) as zf:
+                    for info in zf.infolist():
+                        base = os.path.basename(info.filename)
+                        if info.is_dir() or not base or base.startswith(".") or info.filename.startswith("__MACOSX/"):
+                            continue
+                        total += info.file_size
+                        if total > MAX_BYTES_LOTE:
+                            raise LoteInvalido(
+                                f"El lote supera el máximo de {MAX_BYTES_LOTE // (1024 * 1024)} MB descomprimido")
+                        if len(archivos) >= MAX_ARCHIVOS_LOTE:
+                            raise LoteInvalido(f"El lote supera el máximo de {MAX_ARCHIVOS_LOTE} archivos")
+                        extraido = tempfile.NamedTemporaryFile("rb+", dir=directorio, prefix="lote_")
+                        archivos.append((f"{nombre}/{info.filename}", extraido))
+                        with zf.open(info) as origen:
+                            shutil.copyfileobj(origen, extraido)
+                        extraido.flush()
+            except zipfile.BadZipFile as e:
+                raise LoteInvalido(f"ZIP inválido ({nombre}): {e}")
+
+        if total > MAX_BYTES_LOTE:
+            raise LoteInvalido(f"El lote supera el máximo de {MAX_BYTES_LOTE // (1024 * 1024)} MB")
+        if len(archivos) > MAX_ARCHIVOS_LOTE:
+            raise LoteInvalido(f"El lote supera el máximo de {MAX_ARCHIVOS_LOTE} archivos")
+        if not archivos:
+            raise LoteInvalido("El lote no contiene archivos")
+    except BaseException:
+        cerrar_archivos(archivos)
+        raise
+    return archivos
+
+
+def cerrar_archivos(archivos):
+    """Cierra los archivos del lote (los extraídos del ZIP se borran al cerrarse)."""
+    for _, archivo in archivos:
+        archivo.close()
+
+
+def _enviar_archivo(archivo):
+    """
+    Encola el cálculo de un archivo del lote. Si está en disco con nombre, el
+    proceso hijo lo lee vía mmap y el contenido no pasa por memoria ni por el
+    pipe del pool; si no, se envían sus bytes. El futuro entrega
+    (resultado, etapas, conteos), ver metricas.medir.
+    """
+    ruta = getattr(archivo, "name", None)
+    if isinstance(ruta, str) and os.path.isfile(ruta):
+        archivo.flush()
+        return enviar(metricas.medir, calcular_archivo, ruta)
+    contenido = archivo.getvalue() if isinstance(archivo, BytesIO) else archivo.read()
+    return enviar(metricas.medir, calcular_contenido, contenido)
+
+
+def calcular_archivos(archivos):
+    """
+    Calcula cada archivo en el pool de procesos y junta los resultados en el
+    orden recibido. Un archivo que falla no detiene el lote: queda en errores.
+    Retorna (detalle_rows, resumen_rows, errores_rows); detalle_rows es un
+    iterador que arma las filas recién al escribir.
+    """
+    futuros = []
+    for nombre, archivo in archivos:
+        if not tamano(archivo):
+            futuros.append((nombre, None))
+            continue
+        futuros.append((nombre, _enviar_archivo(archivo)))
+
+    resultados, errores = [], []
+    for nombre, futuro in futuros:
+        if futuro is None:
+            errores.append([nombre, "El archivo está vacío"])
+            continue
+        try:
+            resultado, etapas, conteos = futuro.result()
+        except Exception as e:
+            errores.append([nombre, str(e) or repr(e)])
+            continue
+        # parsear/calcular corrieron en el hijo: se suman al Server-Timing y /metrics
+        metricas.incorporar(etapas, conteos)
+        resultados.append(resultado)
+    # El detalle se arma al escribir; el resumen sigue siendo por archivo
+    detalle = chain.from_iterable(r.filas_detalle() for r in resultados)
+    resumen = [fila for r in resultados for fila in r.filas_resumen()]
+    return detalle, resumen, errores
+
+
+def procesar_lote(archivos):
+    """
+    XLSX consolidado del lote (con hoja 'Errores' si hubo fallas), desde los
+    (nombre, archivo) de expandir_archivos. Retorna (BytesIO, errores_rows).
+    """
+    detalle, resumen, errores = calcular_archivos(archivos)
+    return armar_excel_salida(detalle, resumen, errores), errores
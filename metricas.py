@@ -0,0 +1,266 @@
+"""
+Instrumentación liviana: duración por etapa de cada request (para el header
+Server-Timing) e histogramas/contadores acumulados en formato Prometheus para
+/metrics. Sin dependencias: procesador.py la usa sin saber si corre en Flask.
+
+Las métricas son por proceso (cada worker de gunicorn expone las suyas). Lo
+que corre en el pool de cálculo se mide en el hijo con medir() y el worker lo
+suma con incorporar() u observar_etapas().
+"""
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+BUCKETS_SEGUNDOS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+BUCKETS_BYTES = (1e3, 1e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+BUCKETS_FILAS = (10, 100, 1_000, 5_000, 10_000, 50_000, 100_000, 1_000_000)
+
+_registro_actual = contextvars.ContextVar("registro_metricas", default=None)
+_lock = threading.Lock()
+_metricas = {}
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Registro por request
+# ──────────────────────────────────────────────────────────────────────────────
+
+class Registro:
+    """Duraciones por etapa, conteos y error de una request."""
+
+    __slots__ = ("inicio", "etapas", "conteos", "error")
+
+    def __init__(self):
+        self.inicio = time.perf_counter()
+        self.etapas = {}
+        self.conteos = {}
+        self.error = None
+
+
+def iniciar_registro():
+    registro = Registro()
+    _registro_actual.set(registro)
+    return registro
+
+
+def registro_actual():
+    return _registro_actual.get()
+
+
+@contextmanager
+def etapa(nombre):
+    """
+    Suma la duración del bloque a la etapa `nombre` de la request en curso (si
+    hay). Sirve también como decorador.
+    """
+    registro = _registro_actual.get()
+    if registro is None:
+        yield
+        return
+    t = time.perf_counter()
+    try:
+        yield
+    finally:
+        registro.etapas[nombre] = registro.etapas.get(nombre, 0.0) + time.perf_counter() - t
+
+
+def contar(nombre, valor):
+    registro = _registro_actual.get()
+    if registro is not None:
+        registro.conteos[nombre] = valor
+
+
+def anotar(nombre, texto):
+    """Dato descriptivo de la request (p. ej. formato de entrada): va al Server-Timing como desc."""
+    contar(nombre, texto)
+
+
+def registrar_error(e):
+    registro = _registro_actual.get()
+    if registro is not None:
+        registro.error = type(e).__name__
+
+
+def medir(fn, *args):
+    """
+    En el proceso hijo: corre fn(*args) con un registro propio y retorna
+    (resultado, etapas, conteos), para que las etapas viajen con el resultado.
+    """
+    registro = iniciar_registro()
+    try:
+        return fn(*args), registro.etapas, registro.conteos
+    finally:
+        _registro_actual.set(None)
+
+
+def incorporar(etapas, conteos):
+    """
+    Suma a la request en curso las etapas y conteos numéricos medidos en otro
+    proceso. Con varios archivos en paralelo (lote), cada etapa es la suma de
+    lo que tomó en cada uno, no el tiempo de reloj.
+    """
+    registro = _registro_actual.get()
+    if registro is None:
+        return
+    for nombre, segundos in etapas.items():
+        registro.etapas[nombre] = registro.etapas.get(nombre, 0.0) + segundos
+    for nombre, valor in conteos.items():
+        if isinstance(valor, (int, float)):
+            registro.conteos[nombre] = registro.conteos.get(nombre, 0) + valor
+
+
+def server_timing(registro):
+    """Valor del header Server-Timing: etapas y total en ms, conteos como desc."""
+    partes = [f"{n};dur={s * 1000:.1f}" for n, s in registro.etapas.items()]
+    partes.append(f"total;dur={(time.perf_counter() - registro.inicio) * 1000:.1f}")
+    partes.extend(f'{n};desc="{v}"' for n, v in registro.conteos.items())
+    return ", ".join(partes)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Métricas acumuladas (formato de exposición de Prometheus)
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _etiquetas(pares):
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pares) + "}"
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, nombre, ayuda, buckets):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.buckets = tuple(buckets)
+        self._series = {}
+
+    def observar(self, valor, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with _lock:
+            serie = self._series.get(clave)
+            if serie is None:
+                serie = self._series[clave] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect.bisect_left(self.buckets, valor)
+            if i < len(self.buckets):
+                serie[0][i] += 1
+            serie[1] += valor
+            serie[2] += 1
+
+    def exportar(self):
+        lineas = []
+        with _lock:
+            for clave, (conteos, suma, total) in sorted(self._series.items()):
+                acumulado = 0
+                for le, n in zip(self.buckets, conteos):
+                    acumulado += n
+                    lineas.append(f"{self.nombre}_bucket{_etiquetas(clave + (('le', f'{le:g}'),))} {acumulado}")
+                lineas.append(f"{self.nombre}_bucket{_etiquetas(clave + (('le', '+Inf'),))} {total}")
+                lineas.append(f"{self.nombre}_sum{_etiquetas(clave)} {suma:.6g}")
+                lineas.append(f"{self.nombre}_count{_etiquetas(clave)} {total}")
+        return lineas
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, nombre, ayuda):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self._series = {}
+
+    def incrementar(self, valor=1, **etiquetas):
+        clave = tuple(sorted(etiquetas.items()))
+        with _lock:
+            self._series[clave] = self._series.get(clave, 0) + valor
+
+    def exportar(self):
+        with _lock:
+            return [f"{self.nombre}{_etiquetas(k)} {v}" for k, v in sorted(self._series.items())]
+
+
+class Medidor:
+    """Gauge que se lee al exportar (p. ej. tamaño de un caché)."""
+
+    tipo = "gauge"
+
+    def __init__(self, nombre, ayuda, fn):
+        self.nombre = nombre
+        self.ayuda = ayuda
+        self.fn = fn
+
+    def exportar(self):
+        try:
+            return [f"{self.nombre} {self.fn()}"]
+        except Exception:
+            return []
+
+
+def _registrar(clase, nombre, *args):
+    with _lock:
+        metrica = _metricas.get(nombre)
+        if metrica is None:
+            metrica = _metricas[nombre] = clase(nombre, *args)
+        return metrica
+
+
+def histograma(nombre, ayuda, buckets=BUCKETS_SEGUNDOS):
+    return _registrar(Histograma, nombre, ayuda, buckets)
+
+
+def contador(nombre, ayuda):
+    return _registrar(Contador, nombre, ayuda)
+
+
+def medidor(nombre, ayuda, fn):
+    return _registrar(Medidor, nombre, ayuda, fn)
+
+
+def exportar():
+    """Texto para /metrics."""
+    with _lock:
+        metricas = list(_metricas.values())
+    lineas = []
+    for m in metricas:
+        lineas.append(f"# HELP {m.nombre} {m.ayuda}")
+        lineas.append(f"# TYPE {m.nombre} {m.tipo}")
+        lineas.extend(m.exportar())
+    return "\n".join(lineas) + "\n"
+
+
+REQUESTS = contador("reloj_requests_total", "Requests atendidas por endpoint y código HTTP.")
+ERRORES = contador("reloj_errores_total", "Errores de procesamiento por clase de excepción.")
+DURACION_REQUEST = histograma("reloj_request_segundos", "Duración total de la request.")
+DURACION_ETAPA = histograma("reloj_etapa_segundos", "Duración por etapa del procesamiento.")
+BYTES_ENTRADA = histograma("reloj_entrada_bytes", "Tamaño del archivo subido.", BUCKETS_BYTES)
+BYTES_SALIDA = histograma("reloj_salida_bytes", "Tamaño de la respuesta generada.", BUCKETS_BYTES)
+FILAS = histograma("reloj_filas", "Filas de detalle por request.", BUCKETS_FILAS)
+FUNCIONARIOS = histograma("reloj_funcionarios", "Funcionarios por request.", BUCKETS_FILAS)
+FORMATOS = contador("reloj_formato_entrada_total", "Archivos recibidos por formato detectado.")
+
+
+def observar_etapas(etapas):
+    """Acumula en /metrics etapas fuera de una request (p. ej. un trabajo asíncrono)."""
+    for nombre, segundos in etapas.items():
+        DURACION_ETAPA.observar(segundos, etapa=nombre)
+
+
+def cerrar_registro(registro, endpoint, estado, bytes_salida=None):
+    """Vuelca el registro de la request a las métricas acumuladas."""
+    REQUESTS.incrementar(endpoint=endpoint, estado=estado)
+    DURACION_REQUEST.observar(time.perf_counter() - registro.inicio, endpoint=endpoint)
+    observar_etapas(registro.etapas)
+    if registro.error:
+        ERRORES.incrementar(endpoint=endpoint, clase=registro.error)
+    if "bytes_entrada" in registro.conteos:
+        BYTES_ENTRADA.observar(registro.conteos["bytes_entrada"], endpoint=endpoint)
+    if bytes_salida is not None:
+        BYTES_SALIDA.observar(bytes_salida, endpoint=endpoint)
+    if "filas" in registro.conteos:
+        FILAS.observar(registro.conteos["filas"])
+    if "funcionarios" in registro.conteos:
+        FUNCIONARIOS.observar(registro.conteos["funcionarios"])
+    if "formato" in registro.conteos:
+        FORMATOS.incrementar(endpoint=endpoint, formato=registro.conteos["formato"])
@@ -0,0 +1,177 @@
+"""
+Perfilado a pedido: corre una request bajo cProfile (tiempo acumulado por
+función) y tracemalloc (líneas que más memoria asignaron) y guarda el informe
+en disco, etiquetado con formato y tamaño del archivo. Sirve para encontrar
+dónde se va el tiempo con el archivo real de un usuario sin reproducirlo
+localmente.
+
+Solo se activa con RELOJ_TOKEN_PERFIL definido y la request trayendo ese token
+(header X-Perfil o ?perfil=). Perfila de a una request por proceso: cProfile y
+tracemalloc son globales y encarecen todo lo que corre mientras tanto.
+"""
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import re
+import tempfile
+import threading
+import time
+import tracemalloc
+import uuid
+
+TOKEN = os.environ.get("RELOJ_TOKEN_PERFIL") or None
+DIR_PERFILES = os.environ.get(
+    "RELOJ_DIR_PERFILES", os.path.join(tempfile.gettempdir(), "reloj_perfiles")
+)
+# Informes que se conservan (se borran los más antiguos)
+MAX_PERFILES = int(os.environ.get("RELOJ_MAX_PERFILES", "20"))
+TOP_FUNCIONES = 40
+TOP_ASIGNACIONES = 25
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{32}$")
+_lock = threading.Lock()
+
+
+def autorizado(token) -> bool:
+    return TOKEN is not None and token is not None and hmac.compare_digest(token.encode(), TOKEN.encode())
+
+
+def ruta(id_perfil, extension):
+    """Ruta del informe (.json) o del volcado de pstats (.prof); None si el id no es válido."""
+    if not _ID_VALIDO.match(id_perfil or ""):
+        return None
+    return os.path.join(DIR_PERFILES, f"{id_perfil}.{extension}")
+
+
+class Perfilador:
+    """
+    with Perfilador() as p: ...   (None si ya hay otra request perfilándose)
+    Después, p.guardar(etiquetas) escribe el informe y retorna su id.
+    """
+
+    def __init__(self):
+        self.perfil = cProfile.Profile()
+        self.segundos = None
+        self.snapshot = None
+        self.pico_bytes = None
+        self._inicio = None
+        self._tracemalloc_propio = False
+
+    def __enter__(self):
+        if not _lock.acquire(blocking=False):
+            return None
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_propio = True
+        tracemalloc.reset_peak()
+        self._inicio = time.perf_counter()
+        self.perfil.enable()
+        return self
+
+    def __exit__(self, *exc):
+        if self._inicio is None:
+            return False
+        self.perfil.disable()
+        self.segundos = time.perf_counter() - self._inicio
+        self.snapshot = tracemalloc.take_snapshot()
+        self.pico_bytes = tracemalloc.get_traced_memory()[1]
+        if self._tracemalloc_propio:
+            tracemalloc.stop()
+        _lock.release()
+        return False
+
+    def _funciones(self):
+        stats = pstats.Stats(self.perfil)
+        filas = []
+        for (archivo, linea, funcion), (_, llamadas, propio, acumulado, _) in stats.stats.items():
+            filas.append({
+                "funcion": f"{os.path.basename(archivo)}:{linea}({funcion})" if linea else funcion,
+                "llamadas": llamadas,
+                "propio_s": round(propio, 6),
+                "acumulado_s": round(acumulado, 6),
+            })
+        por_acumulado = sorted(filas, key=lambda f: f["acumulado_s"], reverse=True)[:TOP_FUNCIONES]
+        por_propio = sorted(filas, key=lambda f: f["propio_s"], reverse=True)[:TOP_FUNCIONES]
+        return por_acumulado, por_propio
+
+    def _asignaciones(self):
+        filtrado = self.snapshot.filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+        ))
+        return [
+            {"linea": f"{os.path.basename(s.traceback[0].filename)}:{s.traceback[0].lineno}",
+             "bytes": s.size, "bloques": s.count}
+            for s in filtrado.statistics("lineno")[:TOP_ASIGNACIONES]
+        ]
+
+    def guardar(self, etiquetas):
+        """Escribe <id>.json (informe) y <id>.prof (pstats, para snakeviz/pstats). Retorna el id."""
+        os.makedirs(DIR_PERFILES, exist_ok=True)
+        id_perfil = uuid.uuid4().hex
+        por_acumulado, por_propio = self._funciones()
+        informe = {
+            "id": id_perfil,
+            "creado": time.time(),
+            **etiquetas,
+            "segundos": round(self.segundos, 4),
+            "pico_memoria_python_bytes": self.pico_bytes,
+            "funciones_por_tiempo_acumulado": por_acumulado,
+            "funciones_por_tiempo_propio": por_propio,
+            "asignaciones": self._asignaciones(),
+        }
+        self.perfil.dump_stats(ruta(id_perfil, "prof"))
+        tmp = ruta(id_perfil, "json") + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(informe, f, ensure_ascii=False)
+        os.replace(tmp, ruta(id_perfil, "json"))
+        _purgar_antiguos()
+        return id_perfil
+
+
+def leer(id_perfil):
+    """Informe guardado como dict, o None."""
+    destino = ruta(id_perfil, "json")
+    if destino is None:
+        return None
+    try:
+        with open(destino, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def listar():
+    """[{id, creado, endpoint, formato, bytes_entrada, segundos}] del más nuevo al más viejo."""
+    informes = []
+    for id_perfil in _ids():
+        informe = leer(id_perfil)
+        if informe is not None:
+            informes.append({k: informe.get(k) for k in ("id", "creado", "endpoint", "formato",
+                                                        "bytes_entrada", "segundos")})
+    return sorted(informes, key=lambda i: i["creado"] or 0, reverse=True)
+
+
+def _ids():
+    if not os.path.isdir(DIR_PERFILES):
+        return []
+    return [n[:-5] for n in os.listdir(DIR_PERFILES) if n.endswith(".json") and _ID_VALIDO.match(n[:-5])]
+
+
+def _mtime(id_perfil):
+    try:
+        return os.path.getmtime(ruta(id_perfil, "json"))
+    except OSError:
+        return 0.0  # lo borró otro worker
+
+
+def _purgar_antiguos():
+    ids = sorted(_ids(), key=_mtime)
+    for id_perfil in ids[:-MAX_PERFILES] if MAX_PERFILES > 0 else ids:
+        for extension in ("json", "prof"):
+            try:
+                os.remove(ruta(id_perfil, extension))
+            except OSError:
+                pass
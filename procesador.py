@@ -1,11 +1,39 @@
+import codecs
+import csv
+import json
+import mmap
+import os
 import re
-from io import BytesIO
-from datetime import datetime, time
-
+import sqlite3
+from collections import deque
+from io import BytesIO, RawIOBase, StringIO
+from datetime import date, datetime, time
+from functools import lru_cache
+from itertools import chain
+from multiprocessing import parent_process
+
+import numpy as np
 import pandas as pd
-from openpyxl import load_workbook
+from lxml import etree
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.styles import PatternFill
 
+try:
+    # API privada de openpyxl (solo para la lectura en paralelo): si una versión
+    # la cambia, se usa el recorrido normal con iter_rows
+    from openpyxl.worksheet._reader import WorkSheetParser
+except ImportError:
+    WorkSheetParser = None
+
+import metricas
+from almacen import REUTILIZAR_DIAS, SIN_HUELLA, almacen
+from ejecutor import MAX_PROCESOS, enviar
+
+# Versión de las reglas de cálculo y del formato de salida. Subirla al cambiar
+# cualquiera de los dos: invalida los resultados guardados en caché.
+VERSION_REGLAS = "1"
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Utilidades de fecha/hora
 # ──────────────────────────────────────────────────────────────────────────────
@@ -35,6 +63,61 @@ def minutos_a_hhmm(minutos):
     return f"{int(minutos) // 60:02}:{int(minutos) % 60:02}"
 
 
+# Tamaño máximo del caché de turnos compilados (por proceso). Un export trae
+# pocos turnos distintos; el tope solo evita crecer sin límite entre requests.
+MAX_TURNOS_EN_CACHE = 256
+
+
+def _minutos_hhmm(hhmm):
+    """'HH:MM' -> minutos del día (None si la hora no es válida)."""
+    h, m = (int(x) for x in hhmm.split(":"))
+    if h > 23 or m > 59:
+        return None
+    return h * 60 + m
+
+
+class HorarioTurno:
+    """
+    Turno ya interpretado: inicio/fin en minutos del día para cada día de la
+    semana (0-Lun ... 6-Dom), None donde el turno no define horario.
+    """
+
+    __slots__ = ("turno", "horas", "inicio", "fin", "_textos")
+
+    def __init__(self, turno):
+        self.turno = turno
+        self.horas = re.findall(r"\d{1,2}:\d{2}", turno) if turno else []
+        inicio = [None] * 7
+        fin = [None] * 7
+        if len(self.horas) >= 2:
+            # L-J: primeras 2 horas
+            for dia in (0, 1, 2, 3):
+                inicio[dia], fin[dia] = self.horas[0], self.horas[1]
+            # Viernes: si hay 4 horas, usar las 2 últimas
+            if len(self.horas) >= 4:
+                inicio[4], fin[4] = self.horas[2], self.horas[3]
+        self.inicio = tuple(_minutos_hhmm(h) if h else None for h in inicio)
+        self.fin = tuple(_minutos_hhmm(h) if h else None for h in fin)
+        self._textos = tuple(zip(inicio, fin))
+
+    def textos_dia(self, dia_semana):
+        """(inicio, fin) como strings 'HH:MM' tal como vienen en el turno."""
+        if 0 <= dia_semana < 7:
+            return self._textos[dia_semana]
+        return None, None
+
+
+@lru_cache(maxsize=MAX_TURNOS_EN_CACHE)
+def compilar_turno(turno):
+    """HorarioTurno memoizado por string de turno (compartido entre requests del worker)."""
+    return HorarioTurno(turno)
+
+
+def estadisticas_cache_turnos():
+    info = compilar_turno.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "tamano": info.currsize, "maximo": info.maxsize}
+
+
 def obtener_horario_turno(turno: str, dia_semana: int):
     """
     turno: string con horas (ej: '08:00-17:00 / 08:00-16:00 (vi)')
@@ -42,18 +125,7 @@ def obtener_horario_turno(turno: str, dia_semana: int):
     """
     if not turno:
         return None, None
-    horas = re.findall(r"\d{1,2}:\d{2}", turno)
-    if len(horas) < 2:
-        return None, None
-
-    # L-J: primeras 2 horas
-    if dia_semana in (0, 1, 2, 3):
-        return horas[0], horas[1]
-    # Viernes: si hay 4 horas, usar las 2 últimas
-    if dia_semana == 4 and len(horas) >= 4:
-        return horas[2], horas[3]
-    # Otro día
-    return None, None
+    return compilar_turno(turno).textos_dia(dia_semana)
 
 
 def calcular_atraso(entrada, fecha, turno):
@@ -72,12 +144,13 @@ def calcular_atraso(entrada, fecha, turno):
         except Exception:
             return 0
 
-    dia_semana = f.weekday()
-    inicio_str, _ = obtener_horario_turno(turno, dia_semana)
-    if not inicio_str:
+    if not turno:
+        return 0
+    inicio = compilar_turno(turno).inicio[f.weekday()]
+    if inicio is None:
         return 0
 
-    hora_inicio = datetime.strptime(inicio_str, "%H:%M").time()
+    hora_inicio = time(inicio // 60, inicio % 60)
     if ent > hora_inicio:
         atraso = (
             datetime.combine(f, ent) - datetime.combine(f, hora_inicio)
@@ -122,16 +195,17 @@ def calcular_horas_extras(entrada, salida, fecha, turno, descripcion):
     if sal_dt < ent_dt:
         sal_dt = sal_dt + pd.Timedelta(days=1)
 
-    dia_semana = f.weekday()
-    inicio_str, fin_str = obtener_horario_turno(turno, dia_semana)
+    horario = compilar_turno(turno) if turno else None
+    inicio = horario.inicio[f.weekday()] if horario else None
+    fin = horario.fin[f.weekday()] if horario else None
 
     # Si no hay horario definido, considerar todo como 25% si supera 30 min
-    if not inicio_str or not fin_str:
+    if inicio is None or fin is None:
         total_min = (sal_dt - ent_dt).total_seconds() / 60
         return (total_min / 60, 0) if total_min > 30 else (0, 0)
 
-    h_ini = datetime.combine(f, datetime.strptime(inicio_str, "%H:%M").time())
-    h_fin = datetime.combine(f, datetime.strptime(fin_str, "%H:%M").time())
+    h_ini = datetime.combine(f, time(inicio // 60, inicio % 60))
+    h_fin = datetime.combine(f, time(fin // 60, fin % 60))
     limite_50 = datetime.combine(f, time(21, 0))
 
     min_25 = 0
@@ -160,52 +234,518 @@ def calcular_horas_extras(entrada, salida, fecha, turno, descripcion):
 
 
 # ──────────────────────────────────────────────────────────────────────────────
-# Helpers de salida (Excel con color)
+# Cálculo por lote (vectorizado)
 # ──────────────────────────────────────────────────────────────────────────────
+#
+# Mismas reglas que calcular_atraso / calcular_horas_extras (que quedan como
+# implementación de referencia), pero sobre columnas completas. Los valores
+# crudos (fechas, horas, turnos) se interpretan una sola vez por valor
+# distinto y el resto del cálculo es aritmética de numpy.
+
+# strptime('%H:%M') deja la fecha en 1900-01-01: la referencia compara la
+# entrada/salida ancladas a ese día contra el horario anclado a la fecha real.
+# Se replica igual para que ambos caminos den exactamente lo mismo.
+_ORDINAL_BASE_STRPTIME = date(1900, 1, 1).toordinal()
+_SEG_DIA = 24 * 3600
+_SEG_07 = 7 * 3600
+_SEG_21 = 21 * 3600
+
+
+def _segundos_hora(valor):
+    """'HH:MM:SS' o 'HH:MM' -> segundos desde medianoche (None si no es hora)."""
+    s = str(valor)
+    for fmt in ("%H:%M:%S", "%H:%M"):
+        try:
+            t = datetime.strptime(s, fmt)
+        except Exception:
+            continue
+        return t.hour * 3600 + t.minute * 60 + t.second
+    return None
 
-def _armar_excel_salida(detalle_rows, resumen_rows):
-    df_detalle = pd.DataFrame(
-        detalle_rows,
-        columns=[
-            "Funcionario", "Rut", "Organigrama", "Turno", "Periodo",
-            "Fecha", "Entrada", "Salida",
-            "Atraso (hh:mm)", "50%", "25%", "Descripción"
-        ],
-    )
-    df_resumen = pd.DataFrame(
-        resumen_rows,
-        columns=[
-            "Funcionario", "Rut", "Organigrama", "Turno", "Periodo",
-            "Total 50%", "Total 25%", "Total Atraso", "Total Horas"
-        ],
+
+def _ordinal_fecha(valor):
+    f = normalizar_fecha(valor)
+    return f.toordinal() if f else None
+
+
+def _por_valor_unico(valores, fn):
+    """
+    Evalúa fn una vez por cada valor distinto de la columna y expande el
+    resultado a un arreglo float (None -> NaN). Los nulos se evalúan como fn(None).
+    """
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+    tabla = [fn(u) for u in unicos] + [fn(None)]
+    tabla = np.array([np.nan if r is None else r for r in tabla], dtype=float)
+    # codigo -1 (nulo) apunta al último elemento de la tabla
+    return tabla[codigos]
+
+
+def _horario_por_turno(turnos):
+    """
+    Retorna (inicio, fin) en segundos, matrices (n_filas, 7) con NaN donde el
+    turno no define horario para ese día de la semana.
+    """
+    codigos, unicos = pd.factorize(pd.Series(turnos, dtype=object))
+    ini = np.full((len(unicos) + 1, 7), np.nan)
+    fin = np.full((len(unicos) + 1, 7), np.nan)
+    for k, turno in enumerate(unicos):
+        if not turno:
+            continue
+        horario = compilar_turno(turno)
+        ini[k] = [np.nan if m is None else m * 60 for m in horario.inicio]
+        fin[k] = [np.nan if m is None else m * 60 for m in horario.fin]
+    return ini[codigos], fin[codigos]
+
+
+def _redondear_horas(minutos):
+    """round(minutos / 60, 2) de Python (exacto), evaluado una vez por valor distinto."""
+    if not len(minutos):
+        return np.zeros(0)
+    unicos, inversa = np.unique(minutos, return_inverse=True)
+    return np.array([round(m / 60, 2) for m in unicos.tolist()])[inversa.reshape(-1)]
+
+
+def _tipar_marcas(fechas, entradas, salidas, descripciones):
+    """
+    Columnas tipadas de las marcas: (ordinal del día, entrada y salida en
+    segundos desde medianoche, si la descripción excluye extras). Sin valor
+    válido -> NaN. Cada valor distinto se convierte una sola vez.
+    """
+    ordinal = _por_valor_unico(fechas, _ordinal_fecha)
+    ent = _por_valor_unico(entradas, _segundos_hora)
+    sal = _por_valor_unico(salidas, _segundos_hora)
+    excluye = _por_valor_unico(
+        descripciones,
+        lambda d: any(p in str(d or "").lower() for p in ("ausente", "libre")),
+    ).astype(bool)
+    return ordinal, ent, sal, excluye
+
+
+def calcular_lote(fechas, entradas, salidas, descripciones, turnos):
+    """
+    Versión vectorizada de calcular_atraso + calcular_horas_extras.
+    Recibe columnas completas (turnos puede ser un único string para todas las
+    filas) y retorna (atraso_min, horas50, horas25) como arreglos numpy, con los
+    mismos valores que las funciones escalares fila a fila.
+    """
+    if isinstance(turnos, str) or turnos is None:
+        turnos = [turnos] * len(fechas)
+    return _calcular_columnas(*_tipar_marcas(fechas, entradas, salidas, descripciones), *_horario_por_turno(turnos))
+
+
+def _calcular_columnas(ordinal, ent, sal, excluye, ini_turno, fin_turno):
+    """
+    Núcleo de calcular_lote sobre columnas ya tipadas (ver _tipar_marcas) y el
+    horario del turno de cada fila (ver _horario_por_turno).
+    """
+    n = len(ordinal)
+    # Día de la semana (0-Lun) desde el ordinal; filas sin fecha quedan en 0 y
+    # se descartan por máscara.
+    fecha_ok = ~np.isnan(ordinal)
+    dia_semana = np.where(fecha_ok, (np.nan_to_num(ordinal) + 6) % 7, 0).astype(np.int64)
+    filas = np.arange(n)
+    ini = ini_turno[filas, dia_semana]
+    fin = fin_turno[filas, dia_semana]
+
+    # Atraso: entrada posterior al inicio del turno, en minutos truncados
+    ok_atraso = fecha_ok & ~np.isnan(ent) & ~np.isnan(ini) & (ent > ini)
+    atraso = np.zeros(n, dtype=np.int64)
+    atraso[ok_atraso] = np.floor((ent[ok_atraso] - ini[ok_atraso]) / 60)
+
+    # Extras
+    ok = fecha_ok & ~excluye & ~np.isnan(ent) & ~np.isnan(sal)
+    sal = np.where(sal < ent, sal + _SEG_DIA, sal)  # cruza medianoche
+
+    # Sin horario definido: todo como 50% si supera 30 min (sin redondeo)
+    sin_horario = np.isnan(ini) | np.isnan(fin)
+    total_min = (sal - ent) / 60
+    h50_sin = np.where(total_min > 30, total_min / 60, 0.0)
+
+    # Con horario: segundos absolutos desde 1900-01-01 (ver _ORDINAL_BASE_STRPTIME)
+    dia = (ordinal - _ORDINAL_BASE_STRPTIME) * _SEG_DIA
+    h_ini = dia + ini
+    h_fin = dia + fin
+    limite_50 = dia + _SEG_21
+
+    antes = ent < h_ini
+    tramo_antes = (np.minimum(sal, h_ini) - ent) / 60
+    temprano = ent < _SEG_07
+    min_50 = np.where(antes & temprano, tramo_antes, 0.0)
+    min_25 = np.where(antes & ~temprano, tramo_antes, 0.0)
+
+    despues = sal > h_fin
+    sobre_limite = sal > limite_50
+    min_25 = min_25 + np.where(
+        despues & sobre_limite, np.maximum(0, (np.minimum(sal, limite_50) - h_fin) / 60), 0.0
     )
+    min_50 = min_50 + np.where(despues & sobre_limite, (sal - np.maximum(h_fin, limite_50)) / 60, 0.0)
+    min_25 = min_25 + np.where(despues & ~sobre_limite, (sal - h_fin) / 60, 0.0)
+
+    con_horario = ok & ~sin_horario
+    h50 = np.zeros(n)
+    h25 = np.zeros(n)
+    m50 = con_horario & (min_50 > 30)
+    m25 = con_horario & (min_25 > 30)
+    h50[m50] = _redondear_horas(min_50[m50])
+    h25[m25] = _redondear_horas(min_25[m25])
+    m_sin = ok & sin_horario
+    h50[m_sin] = h50_sin[m_sin]
+
+    return atraso, h50, h25
+
+
+def _textos_columna(valores):
+    """repr de cada valor (nulos como None), evaluado una vez por valor distinto."""
+    codigos, unicos = pd.factorize(pd.Series(valores, dtype=object))
+    tabla = np.array([repr(u) for u in unicos] + [repr(None)], dtype=object)
+    return tabla[codigos]
+
+
+def _huellas_dias(turnos, fechas, entradas, salidas, descripciones):
+    """
+    Huella (int64) de lo que produce el resultado de cada día: turno, marcas,
+    descripción y versión de reglas. Si cambia cualquiera, el día se recalcula.
+    """
+    columnas = {
+        "reglas": VERSION_REGLAS,
+        "turno": _textos_columna(turnos),
+        "fecha": _textos_columna(fechas),
+        "entrada": _textos_columna(entradas),
+        "salida": _textos_columna(salidas),
+        "descripcion": _textos_columna(descripciones),
+    }
+    return pd.util.hash_pandas_object(pd.DataFrame(columnas), index=False).to_numpy().view(np.int64)
+
+
+def _calcular_incremental(tabla, ini_turno, fin_turno):
+    """
+    Como _calcular_columnas, pero además guarda los días en el almacén y
+    refresca el resumen mensual (resumen_mes) de los Rut y meses de la subida.
+    Con REUTILIZAR_DIAS solo calcula los días nuevos o cambiados: los que ya
+    están en el almacén (mismo Rut + fecha y misma huella) se reutilizan. Sin
+    él se calcula todo y los días se guardan sin huella. Filas sin Rut o sin
+    fecha válida se calculan siempre.
+    """
+    n = len(tabla)
+    ordinal, ent, sal, excluye = tabla.tipadas()
+    dias = pd.DataFrame({"rut": pd.Series(tabla.por_dia(1), dtype=object).fillna("").astype(str), "ordinal": ordinal})
+    dias["con_clave"] = (dias["rut"] != "") & dias["ordinal"].notna()
+    iso = {o: date.fromordinal(int(o)).isoformat() for o in dias.loc[dias["con_clave"], "ordinal"].unique()}
+    dias["fecha"] = dias["ordinal"].map(iso)
+    if REUTILIZAR_DIAS:
+        dias["huella"] = _huellas_dias(tabla.por_dia(3), tabla.fechas, tabla.entradas, tabla.salidas,
+                                       tabla.descripciones)
+    else:
+        dias["huella"] = SIN_HUELLA
+
+    con_clave = dias[dias["con_clave"]]
+    guardados = None
+    if REUTILIZAR_DIAS and len(con_clave):
+        try:
+            guardados = almacen.buscar(con_clave["rut"].unique().tolist(), con_clave["fecha"].min(), con_clave["fecha"].max())
+        except sqlite3.Error:
+            guardados = None
+    if guardados is not None and len(guardados):
+        dias = dias.merge(guardados, on=["rut", "fecha"], how="left", suffixes=("", "_guardada"))
+        reutilizar = (dias["con_clave"] & (dias["huella"] == dias["huella_guardada"])).to_numpy()
+    else:
+        reutilizar = np.zeros(n, dtype=bool)
+
+    atraso = np.zeros(n, dtype=np.int64)
+    h50 = np.zeros(n)
+    h25 = np.zeros(n)
+    if reutilizar.any():
+        atraso[reutilizar] = dias.loc[reutilizar, "atraso_min"].to_numpy()
+        h50[reutilizar] = dias.loc[reutilizar, "h50"].to_numpy()
+        h25[reutilizar] = dias.loc[reutilizar, "h25"].to_numpy()
+
+    pendientes = np.flatnonzero(~reutilizar)
+    if len(pendientes):
+        # Las columnas ya vienen tipadas: solo se toma el subconjunto
+        p = pendientes
+        atraso[p], h50[p], h25[p] = _calcular_columnas(
+            ordinal[p], ent[p], sal[p], excluye[p], ini_turno[p], fin_turno[p],
+        )
+        nuevos = np.flatnonzero(~reutilizar & dias["con_clave"].to_numpy())
+        try:
+            almacen.guardar(zip(
+                dias["rut"].to_numpy()[nuevos].tolist(), dias["fecha"].to_numpy()[nuevos].tolist(),
+                dias["huella"].to_numpy()[nuevos].tolist(), atraso[nuevos].tolist(),
+                h50[nuevos].tolist(), h25[nuevos].tolist(), [tabla.descripciones[i] for i in nuevos.tolist()],
+            ))
+        except sqlite3.Error:
+            pass
+
+    if len(con_clave):
+        tocados = con_clave[["rut", "fecha"]].assign(mes=con_clave["fecha"].str[:7])[["rut", "mes"]].drop_duplicates()
+        funcionarios = {str(m[1]): (m[0], m[2]) for m in tabla.metas if m[1]}
+        try:
+            almacen.actualizar_resumen(funcionarios, tocados.itertuples(index=False, name=None))
+        except sqlite3.Error:
+            pass
 
-    # 1) Escribimos con pandas a un buffer
-    tmp = BytesIO()
-    with pd.ExcelWriter(tmp, engine="openpyxl") as writer:
-        df_detalle.to_excel(writer, sheet_name="Detalle Diario", index=False)
-        df_resumen.to_excel(writer, sheet_name="Resumen", index=False)
-
-    # 2) Cargamos con openpyxl para colorear
-    tmp.seek(0)
-    wb = load_workbook(tmp)
-    ws = wb["Detalle Diario"]
-
-    fill_rojo = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    fill_amarillo = PatternFill(start_color="FFFACD", end_color="FFFACD", fill_type="solid")
-
-    # Recorremos filas (saltando encabezado)
-    for row in ws.iter_rows(min_row=2, max_row=ws.max_row, min_col=1, max_col=12):
-        descripcion = str(row[11].value or "")
-        entrada = str(row[6].value or "").strip()
-        salida = str(row[7].value or "").strip()
-
-        if "Ausente" in descripcion or "AUSENTE" in descripcion:
-            for c in row:
-                c.fill = fill_rojo
-        elif "Falta Entrada" in descripcion or "Falta Salida" in descripcion or entrada == "-" or salida == "-":
-            for c in row:
-                c.fill = fill_amarillo
+    almacen.contar(n - len(pendientes), len(pendientes))
+    metricas.contar("dias_reutilizados", n - len(pendientes))
+    return atraso, h50, h25
+
+
+class TablaMarcas:
+    """
+    Tabla normalizada que cada adaptador de formato (HTML, XLSX, XLS) entrega
+    a la etapa de cálculo común. Los metadatos de cada bloque (Funcionario, Rut,
+    Organigrama, Turno, Periodo) se guardan una vez y cada día los referencia
+    por índice. Fecha/entrada/salida/descripción quedan tal como vienen del
+    archivo (es lo que se muestra en el detalle); sus versiones tipadas se
+    calculan una sola vez, al pedirlas (ver tipadas()).
+    """
+
+    __slots__ = ("metas", "claves", "clave_bloque", "bloque", "fechas", "entradas", "salidas",
+                 "descripciones", "_tipadas")
+
+    def __init__(self, metas, claves, clave_bloque, bloque, fechas, entradas, salidas, descripciones):
+        self.metas = metas                  # meta de cada bloque
+        self.claves = claves                # claves de resumen distintas, en orden de aparición
+        self.clave_bloque = clave_bloque    # índice en claves de cada bloque
+        self.bloque = bloque                # índice de bloque de cada día (int32)
+        self.fechas = fechas
+        self.entradas = entradas
+        self.salidas = salidas
+        self.descripciones = descripciones
+        self._tipadas = None
+
+    @classmethod
+    def desde_bloques(cls, bloques):
+        """
+        Desde (clave_resumen, meta, filas), con filas = [(fecha, entrada,
+        salida, descripcion)]. Los bloques sin días se omiten.
+        """
+        metas, claves, clave_bloque, largos = [], [], [], []
+        indice_clave = {}
+        fechas, entradas, salidas, descripciones = [], [], [], []
+        for clave, meta, filas in bloques:
+            if not filas:
+                continue
+            if clave not in indice_clave:
+                indice_clave[clave] = len(claves)
+                claves.append(clave)
+            metas.append(meta)
+            clave_bloque.append(indice_clave[clave])
+            largos.append(len(filas))
+            for fecha, entrada, salida, descripcion in filas:
+                fechas.append(fecha)
+                entradas.append(entrada)
+                salidas.append(salida)
+                descripciones.append(descripcion)
+        bloque = np.repeat(np.arange(len(metas), dtype=np.int32), largos)
+        return cls(metas, claves, clave_bloque, bloque, fechas, entradas, salidas, descripciones)
+
+    @classmethod
+    def desde_columnas(cls, clave, meta, fechas, entradas, salidas, descripciones):
+        """Un solo bloque, con las columnas ya armadas (listas del mismo largo)."""
+        if not fechas:
+            return cls.desde_bloques(())
+        return cls([meta], [clave], [0], np.zeros(len(fechas), dtype=np.int32),
+                   fechas, entradas, salidas, descripciones)
+
+    def __len__(self):
+        return len(self.fechas)
+
+    def __reduce__(self):
+        # Viaja entre procesos (pool de cálculo) sin el caché de tipadas()
+        return (TablaMarcas, (self.metas, self.claves, self.clave_bloque, self.bloque, self.fechas,
+                              self.entradas, self.salidas, self.descripciones))
+
+    def tipadas(self):
+        """(ordinal, seg_entrada, seg_salida, excluye) de cada día (ver _tipar_marcas)."""
+        if self._tipadas is None:
+            self._tipadas = _tipar_marcas(self.fechas, self.entradas, self.salidas, self.descripciones)
+        return self._tipadas
+
+    def por_dia(self, campo):
+        """Campo `campo` de la meta (1 = Rut, 3 = Turno, ...) expandido a cada día."""
+        valores = np.empty(len(self.metas) + 1, dtype=object)
+        valores[:-1] = [m[campo] for m in self.metas]
+        return valores[self.bloque]
+
+    def horarios(self):
+        """(inicio, fin) del turno de cada día, matrices (n_dias, 7): se compila un turno por bloque."""
+        ini, fin = _horario_por_turno([m[3] for m in self.metas])
+        return ini[self.bloque], fin[self.bloque]
+
+
+def _calcular_tabla(tabla):
+    """Etapa de cálculo común: ResultadoCalculo de una TablaMarcas (atraso y extras de cada día)."""
+    ini_turno, fin_turno = tabla.horarios()
+    if almacen is not None and len(tabla):
+        atraso, h50, h25 = _calcular_incremental(tabla, ini_turno, fin_turno)
+    else:
+        atraso, h50, h25 = _calcular_columnas(*tabla.tipadas(), ini_turno, fin_turno)
+    return ResultadoCalculo(tabla, atraso, h50, h25)
+
+
+class ResultadoCalculo:
+    """
+    Resultado de _calcular_tabla: la TablaMarcas de la que sale y el atraso y
+    las extras de cada día en arreglos numpy. Las filas de 'Detalle Diario' y
+    'Resumen' se arman recién al escribir.
+    """
+
+    __slots__ = ("tabla", "atraso", "h50", "h25")
+
+    def __init__(self, tabla, atraso, h50, h25):
+        self.tabla = tabla
+        self.atraso = atraso                # minutos (int64)
+        self.h50 = h50                      # horas (float)
+        self.h25 = h25
+
+    def __len__(self):
+        return len(self.tabla)
+
+    def n_funcionarios(self):
+        return len(self.tabla.claves)
+
+    def filas_detalle(self):
+        """Filas de 'Detalle Diario' (listas, como COLUMNAS_DETALLE), una a una."""
+        tabla = self.tabla
+        hhmm_atraso = {}
+        hhmm_horas = {}
+        for b, fecha, entrada, salida, descripcion, atraso, h50, h25 in zip(
+            tabla.bloque.tolist(), tabla.fechas, tabla.entradas, tabla.salidas, tabla.descripciones,
+            self.atraso.tolist(), self.h50.tolist(), self.h25.tolist(),
+        ):
+            if atraso not in hhmm_atraso:
+                hhmm_atraso[atraso] = minutos_a_hhmm(atraso)
+            if h50 not in hhmm_horas:
+                hhmm_horas[h50] = convertir_a_hhmm(h50)
+            if h25 not in hhmm_horas:
+                hhmm_horas[h25] = convertir_a_hhmm(h25)
+            yield [*tabla.metas[b], fecha, entrada, salida,
+                   hhmm_atraso[atraso], hhmm_horas[h50], hhmm_horas[h25], descripcion]
+
+    def filas_resumen(self):
+        """
+        Filas de 'Resumen' (como COLUMNAS_RESUMEN): una por clave, con Rut,
+        Organigrama, Turno y Periodo de su primer bloque. bincount suma en el
+        orden de los días, igual que la suma fila a fila.
+        """
+        tabla = self.tabla
+        if not len(tabla):
+            return []
+        por_dia = np.asarray(tabla.clave_bloque, dtype=np.int64)[tabla.bloque]
+        n = len(tabla.claves)
+        total50 = np.bincount(por_dia, weights=self.h50, minlength=n).tolist()
+        total25 = np.bincount(por_dia, weights=self.h25, minlength=n).tolist()
+        atraso = np.bincount(por_dia, weights=self.atraso, minlength=n).tolist()
+        primer_bloque = {}
+        for b, c in enumerate(tabla.clave_bloque):
+            primer_bloque.setdefault(c, b)
+
+        filas = []
+        for c, clave in enumerate(tabla.claves):
+            _, rut, organigrama, turno, periodo = tabla.metas[primer_bloque[c]]
+            filas.append([
+                clave, rut, organigrama, turno, periodo,
+                convertir_a_hhmm(total50[c]), convertir_a_hhmm(total25[c]),
+                minutos_a_hhmm(atraso[c]), convertir_a_hhmm(total50[c] + total25[c]),
+            ])
+        return filas
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Helpers de salida (Excel con color)
+# ──────────────────────────────────────────────────────────────────────────────
+
+COLUMNAS_DETALLE = [
+    "Funcionario", "Rut", "Organigrama", "Turno", "Periodo",
+    "Fecha", "Entrada", "Salida",
+    "Atraso (hh:mm)", "50%", "25%", "Descripción"
+]
+COLUMNAS_RESUMEN = [
+    "Funcionario", "Rut", "Organigrama", "Turno", "Periodo",
+    "Total 50%", "Total 25%", "Total Atraso", "Total Horas"
+]
+COLUMNAS_ERRORES = ["Archivo", "Error"]
+
+FILL_ROJO = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+FILL_AMARILLO = PatternFill(start_color="FFFACD", end_color="FFFACD", fill_type="solid")
+
+# Formatos que usaba pandas.to_excel para fechas
+_FORMATO_FECHA_HORA = "YYYY-MM-DD HH:MM:SS"
+_FORMATO_FECHA = "YYYY-MM-DD"
+
+
+def _valor_celda(v):
+    """Normaliza un valor como lo hacía pandas.to_excel (NaN -> vacío, numpy -> python)."""
+    if v is None:
+        return None
+    if isinstance(v, pd.Timestamp):
+        return None if pd.isna(v) else v.to_pydatetime()
+    if isinstance(v, np.generic):
+        v = v.item()
+    if isinstance(v, float):
+        if v != v:
+            return None
+        if v in (float("inf"), float("-inf")):
+            return "inf" if v > 0 else "-inf"
+    return v
+
+
+def _fill_fila_detalle(valores):
+    """Rojo si Ausente; amarillo si falta una marca o viene '-'; None si no se colorea."""
+    descripcion = str(valores[11] or "")
+    entrada = str(valores[6] or "").strip()
+    salida = str(valores[7] or "").strip()
+
+    if "Ausente" in descripcion or "AUSENTE" in descripcion:
+        return FILL_ROJO
+    if "Falta Entrada" in descripcion or "Falta Salida" in descripcion or entrada == "-" or salida == "-":
+        return FILL_AMARILLO
+    return None
+
+
+def _celdas(ws, valores, fill=None):
+    """Arma la fila para ws.append; solo crea WriteOnlyCell donde hay estilo."""
+    fila = []
+    for v in valores:
+        if fill is None and not isinstance(v, date):
+            fila.append(v)
+            continue
+        c = WriteOnlyCell(ws, value=v)
+        if isinstance(v, datetime):
+            c.number_format = _FORMATO_FECHA_HORA
+        elif isinstance(v, date):
+            c.number_format = _FORMATO_FECHA
+        if fill is not None:
+            c.fill = fill
+        fila.append(c)
+    return fila
+
+
+@metricas.etapa("escribir")
+def armar_excel_salida(detalle_rows, resumen_rows, errores_rows=None):
+    """
+    Escribe 'Detalle Diario' y 'Resumen' en una sola pasada (openpyxl
+    write_only). El color de cada fila se decide al escribirla.
+    errores_rows (Archivo, Error) agrega la hoja 'Errores' (procesamiento por lote).
+    """
+    wb = Workbook(write_only=True)
+
+    ws = wb.create_sheet("Detalle Diario")
+    ws.append(COLUMNAS_DETALLE)
+    for fila in detalle_rows:
+        valores = [_valor_celda(v) for v in fila]
+        ws.append(_celdas(ws, valores, _fill_fila_detalle(valores)))
+
+    ws = wb.create_sheet("Resumen")
+    ws.append(COLUMNAS_RESUMEN)
+    for fila in resumen_rows:
+        ws.append(_celdas(ws, [_valor_celda(v) for v in fila]))
+
+    if errores_rows:
+        ws = wb.create_sheet("Errores")
+        ws.append(COLUMNAS_ERRORES)
+        for fila in errores_rows:
+            ws.append(fila)
 
     out = BytesIO()
     wb.save(out)
@@ -213,105 +753,373 @@ def _armar_excel_salida(detalle_rows, resumen_rows):
     return out
 
 
+def armar_excel_resultado(resultado):
+    """XLSX de salida de un ResultadoCalculo."""
+    return armar_excel_salida(resultado.filas_detalle(), resultado.filas_resumen())
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Salidas livianas (CSV / NDJSON / Parquet) para consumo por scripts
+# ──────────────────────────────────────────────────────────────────────────────
+
+def _valor_texto(v):
+    """Valor de celda como texto plano (None si vacío); fechas en ISO 8601."""
+    v = _valor_celda(v)
+    if v is None:
+        return None
+    if isinstance(v, (datetime, date, time)):
+        return v.isoformat()
+    return str(v)
+
+
+def generar_csv(columnas, filas, encabezado=True):
+    """Genera el CSV línea a línea (para respuestas en streaming o para anexar a un archivo)."""
+    buf = StringIO()
+    w = csv.writer(buf)
+    if encabezado:
+        w.writerow(columnas)
+    for i, fila in enumerate(filas, 1):
+        w.writerow(["" if v is None else v for v in map(_valor_texto, fila)])
+        if i % 500 == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def generar_ndjson(columnas, filas):
+    """Un objeto JSON por línea, con las columnas como llaves."""
+    for fila in filas:
+        yield json.dumps(dict(zip(columnas, map(_valor_texto, fila))), ensure_ascii=False) + "\n"
+
+
+@metricas.etapa("escribir")
+def armar_parquet(columnas, filas) -> BytesIO:
+    """Parquet con todas las columnas como texto (requiere pyarrow, ver requirements-parquet.txt)."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    datos = [[] for _ in columnas]
+    for fila in filas:
+        for columna, v in zip(datos, fila):
+            columna.append(_valor_texto(v))
+    tabla = pa.table({c: pa.array(d, type=pa.string()) for c, d in zip(columnas, datos)})
+    out = BytesIO()
+    pq.write_table(tabla, out)
+    out.seek(0)
+    return out
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Procesamiento para XLS/XLSX reales
 # ──────────────────────────────────────────────────────────────────────────────
 
 def procesar_excel(stream: BytesIO) -> BytesIO:
     """
-    Intenta:
-      1) Abrir como XLSX con openpyxl y parsear por bloques (layout tipo reloj).
-      2) Si falla, reintenta con pandas.read_excel(engine='xlrd') para .xls.
+    XLSX de salida del export leído de `stream`. El formato se detecta por los
+    primeros bytes (detectar_formato: firma ZIP = XLSX, OLE2 = XLS, marcas
+    HTML) y se lee con su adaptador; solo sin firma conocida se intenta XLSX y
+    luego XLS.
+    """
+    contenido = stream.getvalue() if isinstance(stream, BytesIO) else stream.read()
+    return armar_excel_resultado(_calcular_tabla(_tabla_contenido(contenido, detectar_formato(contenido))))
+
+
+def _tabla_excel(stream: BytesIO):
+    """
+    TablaMarcas de un .xlsx (openpyxl) o .xls (xlrd) cuando la firma no dice
+    cuál es: se intenta XLSX y, si falla, XLS.
     """
-    # Intento XLSX con openpyxl
     try:
-        wb = load_workbook(filename=stream, data_only=True)
-        sh = wb.active
-        return _procesar_hoja_openpyxl(sh)
+        return TablaMarcas.desde_bloques(_bloques_xlsx(stream))
     except Exception:
         # Reintenta .xls binario usando pandas+xlrd
         try:
             stream.seek(0)
-            df = pd.read_excel(stream, engine="xlrd", header=None)
-            return _procesar_dataframe_generico(df)
+            return _tabla_xls(stream)
         except Exception as e:
             raise RuntimeError(f"No se pudo leer como XLSX ni como XLS: {e}")
 
 
-def _procesar_hoja_openpyxl(sh):
+def _bloques_xlsx(stream):
+    """Bloques de un .xlsx con openpyxl (read_only: se lee en streaming, sin
+    armar el grafo completo de celdas en memoria)."""
+    wb = load_workbook(filename=stream, read_only=True, data_only=True)
+    try:
+        try:
+            bloques = _bloques_xlsx_en_paralelo(wb)
+        except (AttributeError, ImportError, TypeError):
+            # internos de openpyxl distintos a los esperados (en este proceso o
+            # en los hijos): la lectura normal no depende de ellos
+            bloques = None
+        if bloques is None:
+            bloques = list(_bloques_hoja_openpyxl(wb.active))
+        return bloques
+    finally:
+        wb.close()
+
+
+def _tabla_xls(stream):
+    """TablaMarcas de un .xls binario (BIFF) con pandas+xlrd."""
+    return _tabla_dataframe_generico(pd.read_excel(stream, engine="xlrd", header=None))
+
+
+# Filas que siguen a 'Funcionario' en el bloque de metadatos (None = separador)
+_FILAS_META = ("Rut", "Organigrama", "Turno", "Periodo", None)
+
+
+def _bloques_hoja_openpyxl(sh):
     """
-    Parser estilo previo:
-    - Busca bloque con 'Funcionario', siguiente líneas con 'Rut', 'Organigrama', 'Turno', 'Periodo'
-    - Luego una tabla con encabezado 'Dia'/'Día'
+    Recorre la hoja una sola vez hacia adelante (iter_rows, sirve en modo
+    read_only) y va entregando un bloque por tabla 'Día':
+    (clave_resumen, meta, filas). Solo se retiene en memoria el bloque en curso.
     """
-    detalle = []
-    resumen = {}
-    fila = 1
-    max_row = sh.max_row
+    return _bloques_filas_hoja(sh.iter_rows(min_col=1, max_col=6, values_only=True))
 
+
+def _bloques_filas_hoja(filas_hoja):
+    """Máquina de estados de _bloques_hoja_openpyxl sobre tuplas de valores (columnas A..F)."""
     meta = {"Funcionario": "", "Rut": "", "Organigrama": "", "Turno": "", "Periodo": ""}
+    meta_pendiente = []   # filas de metadatos que faltan tras 'Funcionario'
+    bloque = None         # tabla 'Día' en curso
+
+    for fila in filas_hoja:
+        if len(fila) < 6:
+            fila = tuple(fila) + (None,) * (6 - len(fila))
+        v = fila[0]
+
+        if meta_pendiente:
+            campo = meta_pendiente.pop(0)
+            if campo:
+                meta[campo] = str(fila[1] or "").strip(": ")
+            continue
+
+        if bloque is not None:
+            if v:
+                dia_text = str(v).strip().lower()
+                if dia_text in ("totales", "total"):
+                    continue
+                if not (dia_text.startswith("funcionario") or dia_text == "none"):
+                    fecha, entrada, salida = fila[1], fila[2], fila[3]
+                    descripcion = str(fila[5] or "").strip()
+                    bloque[2].append((fecha, entrada, salida, descripcion))
+                    continue
+            # Fin de la tabla: esta misma fila se evalúa abajo como fila normal
+            yield bloque
+            bloque = None
 
-    while fila <= max_row:
-        v = sh.cell(row=fila, column=1).value
         celda = str(v).strip().lower() if v is not None else ""
         if celda.startswith("funcionario"):
-            # Lee metadatos
-            meta["Funcionario"] = str(sh.cell(row=fila, column=2).value or "").strip(": ")
-            meta["Rut"] = str(sh.cell(row=fila + 1, column=2).value or "").strip(": ")
-            meta["Organigrama"] = str(sh.cell(row=fila + 2, column=2).value or "").strip(": ")
-            meta["Turno"] = str(sh.cell(row=fila + 3, column=2).value or "").strip(": ")
-            meta["Periodo"] = str(sh.cell(row=fila + 4, column=2).value or "").strip(": ")
-            fila += 6
-            continue
+            # Lee metadatos (las 4 filas siguientes + 1 separador)
+            meta = dict.fromkeys(meta, "")
+            meta["Funcionario"] = str(fila[1] or "").strip(": ")
+            meta_pendiente = list(_FILAS_META)
+        elif celda in ("dia", "día"):
+            bloque = (meta["Funcionario"], tuple(meta.values()), [])
 
-        if celda in ("dia", "día"):
-            fila += 1
-            while fila <= max_row and sh.cell(row=fila, column=1).value:
-                dia_text = str(sh.cell(row=fila, column=1).value).strip().lower()
-                if dia_text in ("totales", "total"):
-                    fila += 1
+    if bloque is not None:
+        yield bloque
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Hojas XLSX grandes en paralelo: el XML de la hoja se corta en trozos de
+# bloques completos (siempre justo antes de una fila 'Funcionario') y cada
+# trozo lo parsea un proceso del pool; los bloques se juntan en el orden original
+# ──────────────────────────────────────────────────────────────────────────────
+
+# XML de hoja (descomprimido) desde el que conviene repartir el parseo
+UMBRAL_PARALELO_BYTES = int(os.environ.get("RELOJ_UMBRAL_PARALELO_MB", "4")) * 1024 * 1024
+_TROZOS_POR_PROCESO = 4      # más trozos que procesos: reparte mejor la carga
+_LECTURA_XML = 1024 * 1024
+
+_RE_SHEETDATA = re.compile(rb"<([\w.-]+:)?sheetData\b[^>]*?(/?)>")
+_RE_RAIZ = re.compile(rb"<([\w.-]+:)?worksheet\b")
+_RE_FILA_XML = re.compile(rb"<(?:[\w.-]+:)?row[\s>/]")
+_RE_NUM_FILA = re.compile(rb"""\s(?:[\w.-]+:)?r\s*=\s*["'](\d+)["']""")
+_RE_PRIMERA_CELDA = re.compile(rb"<(?:[\w.-]+:)?c\b([^>]*?)(?:/>|>(.*?)</(?:[\w.-]+:)?c>)", re.S)
+# Atributos r/t de la celda, con comillas dobles o simples y prefijo opcional
+_RE_ATRIBUTO = re.compile(rb"""(?<![\w.:-])(?:[\w.-]+:)?(r|t)\s*=\s*(?:"([^"]*)"|'([^']*)')""")
+_RE_VALOR = re.compile(rb"<(?:[\w.-]+:)?v>([^<]*)<")
+_RE_TEXTO = re.compile(rb"<(?:[\w.-]+:)?t(?:\s[^>]*)?>([^<]*)<")
+
+
+def _es_rotulo_funcionario(texto) -> bool:
+    return str(texto).strip().lower().startswith("funcionario")
+
+
+def _cabecera_xml_hoja(fuente):
+    """
+    Lee el XML de la hoja hasta <sheetData>. Retorna (cabecera, cierre,
+    fin_datos, resto, eof) o None si la hoja no tiene datos: cabecera llega hasta
+    <sheetData> inclusive y cierre cierra ambas etiquetas (con sus prefijos).
+    """
+    buf, eof = bytearray(), False
+    while True:
+        m = _RE_SHEETDATA.search(buf)
+        if m or eof:
+            break
+        leido = fuente.read(_LECTURA_XML)
+        eof = not leido
+        buf += leido
+    if not m or m.group(2):
+        return None
+    raiz = _RE_RAIZ.search(buf, 0, m.start())
+    if not raiz:
+        return None
+    prefijo = bytes(m.group(1) or b"")
+    cierre = b"</" + prefijo + b"sheetData></" + bytes(raiz.group(1) or b"") + b"worksheet>"
+    return bytes(buf[:m.end()]), cierre, b"</" + prefijo + b"sheetData>", buf[m.end():], eof
+
+
+def _fila_xml_es_funcionario(fila, rotulos_compartidos) -> bool:
+    """¿La columna A de esta <row> es un rótulo 'Funcionario...'? (sin parsear el XML)."""
+    m = _RE_PRIMERA_CELDA.search(fila)
+    if not m or m.group(2) is None:
+        return False
+    atributos = {nombre: dobles or simples for nombre, dobles, simples in _RE_ATRIBUTO.findall(m.group(1))}
+    ref = atributos.get(b"r")
+    if ref is not None and ref.rstrip(b"0123456789") != b"A":
+        return False
+    tipo = atributos.get(b"t")
+    if tipo == b"s":
+        v = _RE_VALOR.search(m.group(2))
+        return v is not None and v.group(1).strip().isdigit() and int(v.group(1)) in rotulos_compartidos
+    if tipo == b"inlineStr":
+        texto = b"".join(_RE_TEXTO.findall(m.group(2)))
+    elif tipo == b"str":
+        v = _RE_VALOR.search(m.group(2))
+        texto = v.group(1) if v else b""
+    else:
+        return False
+    return _es_rotulo_funcionario(texto.decode("utf-8", "replace"))
+
+
+def _trozos_xml_hoja(fuente, tam_trozo, rotulos_compartidos):
+    """
+    Documentos XML (cabecera + filas + cierre) de ~tam_trozo bytes, cada uno
+    con bloques completos. Solo se examinan filas una vez alcanzado el tamaño,
+    hasta dar con un 'Funcionario' donde cortar; nunca dentro de las filas de
+    metadatos que siguen a otro 'Funcionario'.
+    """
+    partes = _cabecera_xml_hoja(fuente)
+    if partes is None:
+        return
+    cabecera, cierre, fin_datos, buf, eof = partes
+    examinar = None   # desde dónde se buscan filas candidatas a corte
+    recientes = deque(maxlen=len(_FILAS_META))  # (n° fila, es 'Funcionario') de las últimas examinadas
+    num_fila = 0
+    while True:
+        if examinar is None and len(buf) >= tam_trozo:
+            examinar = tam_trozo
+        if examinar is not None:
+            m = _RE_FILA_XML.search(buf, examinar)
+            siguiente = _RE_FILA_XML.search(buf, m.end()) if m else None
+            if m and (siguiente or eof):
+                fila = bytes(buf[m.start():siguiente.start() if siguiente else len(buf)])
+                r = _RE_NUM_FILA.search(fila, 0, fila.find(b">") + 1)
+                num_fila = int(r.group(1)) if r else num_fila + 1
+                es_funcionario = _fila_xml_es_funcionario(fila, rotulos_compartidos)
+                if es_funcionario and recientes and recientes[0][0] <= num_fila - len(_FILAS_META):
+                    if not any(f for n, f in recientes if n >= num_fila - len(_FILAS_META)):
+                        yield cabecera + buf[:m.start()] + cierre
+                        del buf[:m.start()]
+                        examinar = None
+                        recientes.clear()
+                        continue
+                recientes.append((num_fila, es_funcionario))
+                if siguiente:
+                    examinar = siguiente.start()
                     continue
-                if dia_text.startswith("funcionario") or dia_text == "none":
-                    break
-
-                fecha = sh.cell(row=fila, column=2).value
-                entrada = sh.cell(row=fila, column=3).value
-                salida = sh.cell(row=fila, column=4).value
-                descripcion = str(sh.cell(row=fila, column=6).value or "").strip()
-
-                atraso_min = calcular_atraso(entrada, fecha, meta["Turno"])
-                h50, h25 = calcular_horas_extras(entrada, salida, fecha, meta["Turno"], descripcion)
-
-                detalle.append([
-                    meta["Funcionario"], meta["Rut"], meta["Organigrama"], meta["Turno"], meta["Periodo"],
-                    fecha, entrada, salida, minutos_a_hhmm(atraso_min),
-                    convertir_a_hhmm(h50), convertir_a_hhmm(h25), descripcion
-                ])
-
-                k = meta["Funcionario"]
-                if k not in resumen:
-                    resumen[k] = {
-                        "Rut": meta["Rut"], "Organigrama": meta["Organigrama"],
-                        "Turno": meta["Turno"], "Periodo": meta["Periodo"],
-                        "Total50": 0.0, "Total25": 0.0, "AtrasoMin": 0
-                    }
-                resumen[k]["Total50"] += h50
-                resumen[k]["Total25"] += h25
-                resumen[k]["AtrasoMin"] += atraso_min
-                fila += 1
-        else:
-            fila += 1
+        if eof:
+            break
+        leido = fuente.read(_LECTURA_XML)
+        eof = not leido
+        buf += leido
 
-    resumen_rows = []
-    for f, r in resumen.items():
-        total_horas = r["Total50"] + r["Total25"]
-        resumen_rows.append([
-            f, r["Rut"], r["Organigrama"], r["Turno"], r["Periodo"],
-            convertir_a_hhmm(r["Total50"]), convertir_a_hhmm(r["Total25"]),
-            minutos_a_hhmm(r["AtrasoMin"]), convertir_a_hhmm(total_horas),
-        ])
+    fin = buf.find(fin_datos)
+    yield cabecera + buf[:fin if fin >= 0 else len(buf)] + cierre
 
-    return _armar_excel_salida(detalle, resumen_rows)
+
+def _valores_filas_xml(filas_parser, max_fila):
+    """Como iter_rows(min_col=1, max_col=6, values_only=True) sobre las filas de WorkSheetParser."""
+    vacia = (None,) * 6
+    siguiente = None
+    for idx, celdas in filas_parser:
+        if max_fila is not None and idx > max_fila:
+            break
+        if siguiente is None:
+            siguiente = idx
+        # filas ausentes en el XML = filas vacías
+        while siguiente < idx:
+            siguiente += 1
+            yield vacia
+        if siguiente == idx:
+            siguiente += 1
+            valores = [None] * 6
+            for celda in celdas:
+                if 1 <= celda["column"] <= 6:
+                    valores[celda["column"] - 1] = celda["value"]
+            yield tuple(valores)
+
+
+def _bloques_trozo_xlsx(xml, contexto):
+    """Corre en un proceso del pool: bloques (clave_resumen, meta, filas) de un trozo de la hoja."""
+    shared_strings, epoch, date_formats, timedelta_formats, max_fila = contexto
+    parser = WorkSheetParser(BytesIO(xml), shared_strings, data_only=True, epoch=epoch,
+                             date_formats=date_formats, timedelta_formats=timedelta_formats)
+    return list(_bloques_filas_hoja(_valores_filas_xml(parser.parse(), max_fila)))
+
+
+def _bloques_xlsx_en_paralelo(wb):
+    """
+    Bloques de la hoja activa repartiendo el parseo en el pool de procesos.
+    None si no conviene o no se puede (hoja chica, un solo proceso, ya estamos
+    dentro de un proceso del pool, openpyxl sin los internos que se usan, o no
+    hay dónde cortar): el llamador usa el recorrido normal.
+    """
+    sh = wb.active
+    ruta = getattr(sh, "_worksheet_path", None)
+    archivo = getattr(wb, "_archive", None)
+    date_formats = getattr(wb, "_date_formats", None)
+    timedelta_formats = getattr(wb, "_timedelta_formats", None)
+    if MAX_PROCESOS < 2 or parent_process() is not None or WorkSheetParser is None:
+        return None
+    if ruta is None or archivo is None or date_formats is None or timedelta_formats is None:
+        return None
+    tam_xml = archivo.getinfo(ruta).file_size
+    if tam_xml < UMBRAL_PARALELO_BYTES:
+        return None
+
+    rotulos = {i for i, s in enumerate(wb.shared_strings) if _es_rotulo_funcionario(s)}
+    contexto = (list(wb.shared_strings), wb.epoch, date_formats, timedelta_formats, sh.max_row)
+    tam_trozo = max(_LECTURA_XML, tam_xml // (MAX_PROCESOS * _TROZOS_POR_PROCESO))
+
+    bloques = []
+    pendientes = deque()  # en vuelo acotado: no se encola la hoja entera en memoria
+    n_trozos = 0
+    with archivo.open(ruta) as fuente:
+        trozos = _trozos_xml_hoja(fuente, tam_trozo, rotulos)
+        primeros = [xml for xml in (next(trozos, None), next(trozos, None)) if xml is not None]
+        if len(primeros) < 2:
+            return None  # no se encontró dónde cortar: no hay nada que repartir
+        for xml in chain(primeros, trozos):
+            if len(pendientes) >= 2 * MAX_PROCESOS:
+                bloques.extend(pendientes.popleft().result())
+            pendientes.append(enviar(_bloques_trozo_xlsx, xml, contexto))
+            n_trozos += 1
+    metricas.contar("trozos", n_trozos)
+    while pendientes:
+        bloques.extend(pendientes.popleft().result())
+    return bloques
+
+
+def _procesar_hoja_openpyxl(sh):
+    """
+    Parser estilo previo:
+    - Busca bloque con 'Funcionario', siguiente líneas con 'Rut', 'Organigrama', 'Turno', 'Periodo'
+    - Luego una tabla con encabezado 'Dia'/'Día'
+    """
+    return armar_excel_resultado(_calcular_tabla(TablaMarcas.desde_bloques(_bloques_hoja_openpyxl(sh))))
 
 
 def _procesar_dataframe_generico(df: pd.DataFrame) -> BytesIO:
@@ -319,20 +1127,28 @@ def _procesar_dataframe_generico(df: pd.DataFrame) -> BytesIO:
     Fallback genérico para .xls con pandas.
     Intenta encontrar un bloque de tabla donde existan columnas Fecha/Entrada/Salida/Descripción.
     """
-    # Buscar encabezado por palabras clave (muy tolerante)
-    headers_candidates = {}
-    for i in range(min(40, len(df))):
-        fila = df.iloc[i].astype(str).str.lower().tolist()
-        if any("fecha" in c for c in fila) and any("entrada" in c for c in fila) and any("salida" in c for c in fila):
-            headers_candidates[i] = fila
+    return armar_excel_resultado(_calcular_tabla(_tabla_dataframe_generico(df)))
+
+
+def _tabla_dataframe_generico(df: pd.DataFrame):
+    """
+    TablaMarcas (un solo bloque) de la tabla encontrada en el DataFrame: se
+    trabaja sobre la matriz de valores y por columnas, sin recorrer filas con
+    iloc.
+    """
+    valores = df.to_numpy(dtype=object)
 
-    if not headers_candidates:
+    # Buscar encabezado por palabras clave (muy tolerante): el primero que parece válido
+    hdr_row = None
+    for i in range(min(40, len(valores))):
+        fila = [str(c).lower() for c in valores[i].tolist()]
+        if any("fecha" in c for c in fila) and any("entrada" in c for c in fila) and any("salida" in c for c in fila):
+            hdr_row = i
+            break
+    if hdr_row is None:
         raise RuntimeError("No se encontraron encabezados compatibles en el XLS (pandas).")
 
-    # Toma el primero que parece válido
-    hdr_row = sorted(headers_candidates.keys())[0]
-    df_tabla = df.iloc[hdr_row + 1 :].reset_index(drop=True)
-    cols_map = {j: str(c).strip().lower() for j, c in enumerate(df.iloc[hdr_row].tolist())}
+    cols_map = {j: str(c).strip().lower() for j, c in enumerate(valores[hdr_row].tolist())}
 
     def col_idx(nombre):
         for j, c in cols_map.items():
@@ -348,183 +1164,436 @@ def _procesar_dataframe_generico(df: pd.DataFrame) -> BytesIO:
     if idx_fecha is None or idx_entrada is None or idx_salida is None:
         raise RuntimeError("No se hallaron columnas obligatorias (fecha/entrada/salida) en el XLS.")
 
-    # Metadatos básicos (si se ven arriba en las primeras filas)
-    def buscar_meta(df_all, clave):
-        # Busca "Funcionario", "Rut", etc. en las primeras 30 filas/2 columnas
-        for i in range(min(30, len(df_all))):
-            fila = df_all.iloc[i, :4].astype(str).tolist()
-            fila_l = [s.lower() for s in fila]
-            for j, s in enumerate(fila_l):
-                if clave in s:
-                    # valor en siguiente columna si existe
-                    try:
-                        return str(df_all.iloc[i, j + 1])
-                    except Exception:
-                        return ""
-        return ""
-
-    meta_func = buscar_meta(df, "funcionario")
-    meta_rut = buscar_meta(df, "rut")
-    meta_org = buscar_meta(df, "organigrama")
-    meta_turno = buscar_meta(df, "turno")
-    meta_periodo = buscar_meta(df, "periodo")
-
-    detalle = []
-    resumen = {}
-
-    for i in range(len(df_tabla)):
-        fila = df_tabla.iloc[i].tolist()
-        fecha = fila[idx_fecha] if idx_fecha is not None else ""
-        entrada = fila[idx_entrada] if idx_entrada is not None else ""
-        salida = fila[idx_salida] if idx_salida is not None else ""
-        descripcion = fila[idx_desc] if idx_desc is not None else ""
-
-        # Filas vacías o separadores
-        if pd.isna(fecha) and pd.isna(entrada) and pd.isna(salida):
-            continue
-
-        atraso_min = calcular_atraso(entrada, fecha, meta_turno)
-        h50, h25 = calcular_horas_extras(entrada, salida, fecha, meta_turno, descripcion)
-
-        detalle.append([
-            meta_func, meta_rut, meta_org, meta_turno, meta_periodo,
-            fecha, entrada, salida,
-            minutos_a_hhmm(atraso_min), convertir_a_hhmm(h50), convertir_a_hhmm(h25), descripcion
-        ])
-
-        k = meta_func or "(Funcionario)"
-        if k not in resumen:
-            resumen[k] = {
-                "Rut": meta_rut, "Organigrama": meta_org,
-                "Turno": meta_turno, "Periodo": meta_periodo,
-                "Total50": 0.0, "Total25": 0.0, "AtrasoMin": 0
-            }
-        resumen[k]["Total50"] += h50
-        resumen[k]["Total25"] += h25
-        resumen[k]["AtrasoMin"] += atraso_min
-
-    resumen_rows = []
-    for f, r in resumen.items():
-        total_horas = r["Total50"] + r["Total25"]
-        resumen_rows.append([
-            f, r["Rut"], r["Organigrama"], r["Turno"], r["Periodo"],
-            convertir_a_hhmm(r["Total50"]), convertir_a_hhmm(r["Total25"]),
-            minutos_a_hhmm(r["AtrasoMin"]), convertir_a_hhmm(total_horas),
-        ])
-
-    return _armar_excel_salida(detalle, resumen_rows)
+    # Metadatos básicos (si se ven arriba): una sola pasada por las primeras 30
+    # filas / 4 columnas; cada campo toma su primera aparición y el valor de la
+    # celda siguiente
+    claves_meta = ("funcionario", "rut", "organigrama", "turno", "periodo")
+    meta = dict.fromkeys(claves_meta)
+    for i in range(min(30, len(valores))):
+        for j, c in enumerate(valores[i, :4].tolist()):
+            s = str(c).lower()
+            for clave in claves_meta:
+                if meta[clave] is None and clave in s:
+                    meta[clave] = str(valores[i, j + 1]) if j + 1 < valores.shape[1] else ""
+    meta = tuple(v or "" for v in meta.values())
+
+    # Filas vacías o separadores (sin fecha, entrada ni salida) se descartan
+    cuerpo = valores[hdr_row + 1:]
+    fechas, entradas, salidas = cuerpo[:, idx_fecha], cuerpo[:, idx_entrada], cuerpo[:, idx_salida]
+    con_datos = ~(pd.isna(fechas) & pd.isna(entradas) & pd.isna(salidas))
+    descripciones = cuerpo[con_datos, idx_desc].tolist() if idx_desc is not None else [""] * int(con_datos.sum())
+    return TablaMarcas.desde_columnas(
+        meta[0] or "(Funcionario)", meta,
+        fechas[con_datos].tolist(), entradas[con_datos].tolist(), salidas[con_datos].tolist(), descripciones,
+    )
 
 
 # ──────────────────────────────────────────────────────────────────────────────
 # Procesamiento para XLS-HTML (archivo HTML con extensión .xls)
 # ──────────────────────────────────────────────────────────────────────────────
 
-def detectar_html_y_procesar(html_bytes: bytes) -> BytesIO:
+# Tamaño de los trozos con que se alimenta el parser HTML incremental
+_TROZO_HTML = 64 * 1024
+# Bytes del comienzo en que se busca <meta charset>
+_CABECERA_HTML = 4096
+
+_CAMPOS_META_HTML = {
+    "funcionario": "Funcionario", "rut": "Rut", "organigrama": "Organigrama",
+    "turno": "Turno", "periodo": "Periodo", "período": "Periodo",
+}
+
+
+def _charset_html(html_bytes: bytes):
     """
-    Lee tablas desde HTML (exportado por el reloj) usando pandas.read_html.
-    Intenta con codificación latin-1 y utf-8.
-    Busca una tabla con columnas Fecha/Entrada/Salida (y opcional Descripción).
+    Retorna (codificacion, bytes_a_saltar) según BOM o <meta charset>.
+    Sin declaración se asume latin-1 (lo que hacía la versión con read_html).
     """
-    tablas = None
-    error_capturado = None
-
-    for enc in ("latin-1", "utf-8"):
+    cab = html_bytes[:3]  # slice: funciona igual con bytes y con mmap
+    if cab.startswith(codecs.BOM_UTF8):
+        return "utf-8", len(codecs.BOM_UTF8)
+    if cab.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16", 0
+
+    m = re.search(rb"<meta[^>]+charset\s*=\s*[\"']?\s*([\w.:-]+)", html_bytes[:_CABECERA_HTML], re.IGNORECASE)
+    if m:
         try:
-            tablas = pd.read_html(BytesIO(html_bytes), flavor="bs4", encoding=enc)
-            if tablas and len(tablas) > 0:
-                break
-        except Exception as e:
-            error_capturado = e
-            tablas = None
-
-    if not tablas:
-        raise RuntimeError(f"No se pudieron leer tablas HTML: {error_capturado or 'Desconocido'}")
-
-    # Heurística: elegir la tabla que contenga columnas de interés
-    idx_tabla = None
-    for i, t in enumerate(tablas):
-        cols = [str(c).lower() for c in t.columns]
-        if any("fecha" in c for c in cols) and any("entrada" in c for c in cols) and any("salida" in c for c in cols):
-            idx_tabla = i
+            nombre = codecs.lookup(m.group(1).decode("ascii")).name
+        except LookupError:
+            nombre = None
+        if nombre:
+            # libxml2 no conoce los alias de Python con sufijo '-sig'
+            return ("utf-8" if nombre == "utf-8-sig" else nombre), 0
+    return codecs.lookup("latin-1").name, 0
+
+
+def _filas_html(html_bytes: bytes, prefijo=None):
+    """
+    Recorre el HTML con el parser incremental de lxml y genera
+    (n_tabla, celdas) por cada <tr>, con el texto de cada celda (colspan
+    expandido). Cada fila se libera apenas se entrega.
+    prefijo: (hasta, n_tablas, filas) ya leído de html_bytes[:hasta] con
+    leer_prefijo_html; solo se parsea lo que sigue.
+    """
+    encoding, inicio = _charset_html(html_bytes)
+    n_tablas = 0
+    if prefijo is not None:
+        inicio, n_tablas, filas = prefijo
+        yield from filas
+    if prefijo is None or inicio < len(html_bytes):
+        n_tablas = yield from _filas_segmento_html(html_bytes, encoding, inicio, len(html_bytes), n_tablas)
+    if not n_tablas:
+        raise RuntimeError("No se pudieron leer tablas HTML: el documento no contiene <table>")
+
+
+def _filas_segmento_html(html_bytes, encoding, desde, hasta, n_tablas):
+    """
+    Filas de html_bytes[desde:hasta] como documento propio (ver _filas_html);
+    las tablas se numeran a continuación de n_tablas. Retorna el total de
+    tablas vistas (valor de retorno del generador).
+    """
+    parser = etree.HTMLPullParser(events=("start", "end"), tag=("table", "tr"), encoding=encoding)
+    tablas = []  # pila de tablas abiertas (hay exports con tablas anidadas)
+
+    def eventos():
+        nonlocal n_tablas
+        for ev, el in parser.read_events():
+            if el.tag == "table":
+                if ev == "start":
+                    n_tablas += 1
+                    tablas.append(n_tablas)
+                elif tablas:
+                    tablas.pop()
+                continue
+            if ev != "end" or not tablas:
+                continue
+            # Filas de diagramación que contienen otra tabla: se ignoran
+            if el.find(".//table") is None:
+                celdas = []
+                for td in el:
+                    if td.tag not in ("td", "th"):
+                        continue
+                    texto = "".join(td.itertext()).strip()
+                    try:
+                        span = max(1, int(td.get("colspan", 1)))
+                    except ValueError:
+                        span = 1
+                    celdas.extend([texto] * span)
+                yield tablas[-1], celdas
+            el.clear()
+            while el.getprevious() is not None:
+                del el.getparent()[0]
+
+    for i in range(desde, hasta, _TROZO_HTML):
+        parser.feed(html_bytes[i:min(i + _TROZO_HTML, hasta)])
+        yield from eventos()
+    parser.close()
+    yield from eventos()
+    return n_tablas
+
+
+# Etiquetas que importan para cortar el HTML: apertura/cierre de tabla, y
+# comentarios/scripts/estilos (pueden contener '<table' que no es tabla)
+_RE_CORTE_HTML = re.compile(rb"<(/?)table\b[^>]*>|(<!--|<script\b|<style\b|<!\[CDATA\[)", re.IGNORECASE)
+
+
+def _corte_html(html_bytes, desde, hasta):
+    """
+    Último punto en html_bytes[desde:hasta] justo tras el cierre de una tabla
+    de primer nivel (fuera de toda tabla), o `desde` si no hay: desde ahí el
+    resto se puede parsear como documento aparte sin cambiar las filas.
+    """
+    corte, nivel = desde, 0
+    for m in _RE_CORTE_HTML.finditer(html_bytes, desde, hasta):
+        if m.group(2):
+            break  # comentario o script: no se corta más allá
+        if not m.group(1):
+            nivel += 1
+            continue
+        nivel -= 1
+        if nivel < 0:
             break
-    if idx_tabla is None:
-        # Si no hay columnas con nombre, intenta la primera y asumimos orden
-        idx_tabla = 0
+        if nivel == 0:
+            corte = m.end()
+    return corte
+
+
+def leer_prefijo_html(html_bytes, hasta, prefijo=None, min_bytes=0):
+    """
+    Avanza la lectura de un HTML del que solo están completos los primeros
+    `hasta` bytes (subida por partes): parsea desde donde quedó `prefijo`
+    hasta el último cierre de tabla de primer nivel. Retorna el segmento
+    nuevo (desde, corte, n_tablas, filas), o None si no avanza al menos
+    min_bytes o la codificación no permite cortar por bytes (UTF-16).
+    """
+    if hasta < min(len(html_bytes), _CABECERA_HTML):
+        return None
+    encoding, inicio = _charset_html(html_bytes)
+    if encoding.startswith("utf-16"):
+        return None
+    desde, n_tablas = (inicio, 0) if prefijo is None else prefijo[:2]
+    corte = _corte_html(html_bytes, desde, hasta)
+    if corte - desde < max(1, min_bytes):
+        return None
+    filas = _filas_segmento_html(html_bytes, encoding, desde, corte, n_tablas)
+    leidas = []
+    while True:
+        try:
+            leidas.append(next(filas))
+        except StopIteration as fin:
+            return desde, corte, fin.value, leidas
 
-    df = tablas[idx_tabla].copy()
-    # Limpia encabezados tipo multiindex o filas basura repetidas
-    df.columns = [str(c).strip() for c in df.columns]
-    df = df.rename(columns=lambda c: c.strip())
 
-    # Intenta detectar columnas
+def _meta_html(celdas):
+    """('Rut', '12.345.678-9') si la fila es un rótulo de metadatos; (None, None) si no."""
+    valores = [c for c in celdas if c]
+    if not valores:
+        return None, None
+    etiqueta, _, resto = valores[0].partition(":")
+    campo = _CAMPOS_META_HTML.get(etiqueta.strip().lower())
+    if not campo:
+        return None, None
+    # el valor va tras ':' en la misma celda o en la siguiente (saltando el
+    # rótulo repetido por colspan)
+    siguientes = [v for v in valores[1:] if v != valores[0]]
+    valor = resto.strip() or (siguientes[0].strip(": ") if siguientes else "")
+    return campo, valor
+
+
+def _columnas_html(celdas):
+    """Índices (fecha, entrada, salida, descripcion) si la fila es un encabezado; None si no."""
+    bajas = [c.lower() for c in celdas]
+
     def col_idx(nombre):
-        for j, c in enumerate(df.columns):
-            if nombre in str(c).lower():
+        for j, c in enumerate(bajas):
+            if nombre in c:
                 return j
         return None
 
-    i_fecha = col_idx("fecha")
-    i_ent = col_idx("entrada")
-    i_sal = col_idx("salida")
-    i_desc = col_idx("descrip") or col_idx("observ") or col_idx("detalle")
-
+    i_fecha, i_ent, i_sal = col_idx("fecha"), col_idx("entrada"), col_idx("salida")
     if i_fecha is None or i_ent is None or i_sal is None:
+        return None
+    i_desc = col_idx("descrip")
+    if i_desc is None:
+        i_desc = col_idx("observ")
+    if i_desc is None:
+        i_desc = col_idx("detalle")
+    return i_fecha, i_ent, i_sal, i_desc
+
+
+def _fila_html(celdas, columnas):
+    """(fecha, entrada, salida, descripcion) o None si la fila está vacía."""
+    def celda(j):
+        if j is None or j >= len(celdas):
+            return None
+        return celdas[j] or None
+
+    i_fecha, i_ent, i_sal, i_desc = columnas
+    fecha, entrada, salida = celda(i_fecha), celda(i_ent), celda(i_sal)
+    # Filas muy vacías -> saltar
+    if fecha is None and (entrada is None or salida is None):
+        return None
+    return fecha, entrada, salida, (celda(i_desc) if i_desc is not None else "")
+
+
+def _bloques_html(html_bytes: bytes, prefijo=None):
+    """
+    Entrega (clave_resumen, meta, filas) por cada tabla de marcas del HTML,
+    asociada a los metadatos (Funcionario, Rut, ...) vistos antes de ella.
+    """
+    return _bloques_filas_html(_filas_html(html_bytes, prefijo))
+
+
+def _bloques_filas_html(filas_html):
+    """_bloques_html sobre las filas (n_tabla, celdas) ya extraídas."""
+    meta = {"Funcionario": "", "Rut": "", "Organigrama": "", "Turno": "", "Periodo": ""}
+    bloque = None
+    columnas = None
+    tabla_bloque = None
+    # Si ninguna tabla tiene encabezado reconocible, se usa la primera por posición
+    primera_tabla = []
+    n_primera = None
+    hay_encabezado = False
+
+    for n_tabla, celdas in filas_html:
+        if n_primera is None:
+            n_primera = n_tabla
+        if bloque is not None and n_tabla != tabla_bloque:
+            yield bloque
+            bloque = None
+
+        cols = _columnas_html(celdas)
+        if cols is not None:
+            if bloque is not None:
+                yield bloque
+            hay_encabezado = True
+            primera_tabla = None
+            columnas, tabla_bloque = cols, n_tabla
+            func = meta["Funcionario"] or "Funcionario"
+            bloque = (func, (func, meta["Rut"], meta["Organigrama"], meta["Turno"], meta["Periodo"]), [])
+            continue
+
+        campo, valor = _meta_html(celdas)
+        if campo:
+            if bloque is not None:
+                yield bloque
+                bloque = None
+            if campo == "Funcionario":
+                meta = dict.fromkeys(meta, "")
+            meta[campo] = valor
+            continue
+
+        if bloque is not None:
+            fila = _fila_html(celdas, columnas)
+            if fila is not None:
+                bloque[2].append(fila)
+        elif not hay_encabezado and n_tabla == n_primera:
+            primera_tabla.append(celdas)
+
+    if bloque is not None:
+        yield bloque
+
+    if not hay_encabezado:
         # algunos exportan sin header claro: asume posiciones típicas
         # (Fecha, Entrada, Salida, ..., Descripción)
-        if df.shape[1] >= 4:
-            i_fecha, i_ent, i_sal = 0, 1, 2
-            i_desc = 4 if df.shape[1] > 4 else None
-        else:
+        ancho = max((len(c) for c in primera_tabla), default=0)
+        if ancho < 4:
             raise RuntimeError("La tabla HTML no tiene columnas reconocibles (fecha/entrada/salida).")
+        columnas = (0, 1, 2, 4 if ancho > 4 else None)
+        filas = [f for f in (_fila_html(c, columnas) for c in primera_tabla) if f is not None]
+        yield "Funcionario", ("Funcionario", "", "", "", ""), filas
 
-    # Metadatos (si existen en tablas vecinas, se podrían inferir aquí.
-    # Para mantener robusto, lo dejamos en blanco o 'Desconocido')
-    meta_func = "Funcionario"
-    meta_rut = ""
-    meta_org = ""
-    meta_turno = ""
-    meta_periodo = ""
-
-    detalle = []
-    resumen = {}
-
-    for _, row in df.iterrows():
-        fecha = row.iloc[i_fecha] if i_fecha is not None else ""
-        entrada = row.iloc[i_ent] if i_ent is not None else ""
-        salida = row.iloc[i_sal] if i_sal is not None else ""
-        descripcion = row.iloc[i_desc] if i_desc is not None and i_desc < len(row) else ""
-
-        # Filas muy vacías -> saltar
-        if (pd.isna(fecha) or str(fecha).strip() == "") and (pd.isna(entrada) or pd.isna(salida)):
-            continue
 
-        atraso_min = calcular_atraso(entrada, fecha, meta_turno)
-        h50, h25 = calcular_horas_extras(entrada, salida, fecha, meta_turno, descripcion)
-
-        detalle.append([
-            meta_func, meta_rut, meta_org, meta_turno, meta_periodo,
-            fecha, entrada, salida,
-            minutos_a_hhmm(atraso_min), convertir_a_hhmm(h50), convertir_a_hhmm(h25), descripcion
-        ])
-
-        k = meta_func
-        if k not in resumen:
-            resumen[k] = {
-                "Rut": meta_rut, "Organigrama": meta_org,
-                "Turno": meta_turno, "Periodo": meta_periodo,
-                "Total50": 0.0, "Total25": 0.0, "AtrasoMin": 0
-            }
-        resumen[k]["Total50"] += h50
-        resumen[k]["Total25"] += h25
-        resumen[k]["AtrasoMin"] += atraso_min
-
-    resumen_rows = []
-    for f, r in resumen.items():
-        total_horas = r["Total50"] + r["Total25"]
-        resumen_rows.append([
-            f, r["Rut"], r["Organigrama"], r["Turno"], r["Periodo"],
-            convertir_a_hhmm(r["Total50"]), convertir_a_hhmm(r["Total25"]),
-            minutos_a_hhmm(r["AtrasoMin"]), convertir_a_hhmm(total_horas),
-        ])
-
-    return _armar_excel_salida(detalle, resumen_rows)
+def detectar_html_y_procesar(html_bytes: bytes) -> BytesIO:
+    """
+    Lee el XLS-HTML exportado por el reloj en streaming con lxml (codificación
+    desde BOM o <meta charset>). Procesa cada tabla con columnas
+    Fecha/Entrada/Salida (y opcional Descripción) con los metadatos del
+    funcionario que la preceden.
+    """
+    return armar_excel_resultado(_calcular_tabla(TablaMarcas.desde_bloques(_bloques_html(html_bytes))))
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# Punto de entrada por contenido (usado por la API y los trabajos en segundo plano)
+# ──────────────────────────────────────────────────────────────────────────────
+
+class _LectorBuffer(RawIOBase):
+    """
+    Archivo de solo lectura sobre un buffer (p. ej. el mmap de la subida), sin
+    copiarlo: mmap no implementa seekable(), que zipfile/openpyxl exigen.
+    """
+
+    def __init__(self, buffer):
+        self._buffer = memoryview(buffer)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=0):
+        base = (0, self._pos, len(self._buffer))[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def readinto(self, b):
+        trozo = self._buffer[self._pos:self._pos + len(b)]
+        n = len(trozo)
+        b[:n] = trozo
+        self._pos += n
+        return n
+
+    def close(self):
+        if not self.closed:
+            self._buffer.release()  # permite cerrar el mmap de origen
+        super().close()
+
+
+# Firmas (magic bytes) de los formatos de entrada
+FIRMA_ZIP = b"PK\x03\x04"                          # .xlsx (Office Open XML)
+FIRMA_OLE2 = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"   # .xls (BIFF dentro de OLE2)
+_MARCAS_HTML = (b"<html", b"<!doctype html", b"<table", b"<meta", b"<head", b"<body")
+
+
+def es_html(contenido: bytes) -> bool:
+    """Detecta XLS-HTML (muchas plataformas exportan HTML con extensión .xls)."""
+    cab = contenido[:1024]
+    if cab.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        cab = cab.decode("utf-16", "ignore").encode("ascii", "ignore")
+    elif cab.startswith(codecs.BOM_UTF8):
+        cab = cab[len(codecs.BOM_UTF8):]
+    cab = cab.lstrip().lower()
+    return any(m in cab for m in _MARCAS_HTML)
+
+
+def detectar_formato(contenido) -> str:
+    """'xlsx', 'xls', 'html' o 'desconocido' según los primeros bytes del archivo."""
+    cab = contenido[:8]
+    if cab.startswith(FIRMA_ZIP):
+        return "xlsx"
+    if cab.startswith(FIRMA_OLE2):
+        return "xls"
+    if es_html(contenido):
+        return "html"
+    return "desconocido"
+
+
+def _tabla_contenido(contenido, formato, prefijo=None):
+    """
+    TablaMarcas del archivo, directo con el adaptador del formato detectado.
+    prefijo: filas HTML ya leídas de una subida por partes (ver leer_prefijo_html).
+    """
+    if formato == "html":
+        return TablaMarcas.desde_bloques(_bloques_html(contenido, prefijo))
+    stream = BytesIO(contenido) if isinstance(contenido, bytes) else _LectorBuffer(contenido)
+    with stream:
+        if formato == "xlsx":
+            try:
+                return TablaMarcas.desde_bloques(_bloques_xlsx(stream))
+            except Exception as e:
+                raise RuntimeError(f"No se pudo leer como XLSX: {e}")
+        if formato == "xls":
+            try:
+                return _tabla_xls(stream)
+            except Exception as e:
+                raise RuntimeError(f"No se pudo leer como XLS (xlrd): {e}")
+        # Sin firma conocida (p. ej. BIFF antiguo sin OLE2): se prueban ambos
+        return _tabla_excel(stream)
+
+
+def calcular_contenido(contenido, prefijo=None):
+    """
+    ResultadoCalculo del archivo subido, sin armar el XLSX.
+    contenido: bytes, o un mmap del archivo en disco (se lee sin copiarlo).
+    prefijo: (hasta, n_tablas, filas) de un HTML cuyo comienzo ya se parseó
+    mientras llegaban las partes; se ignora en los otros formatos.
+    """
+    with metricas.etapa("detectar"):
+        formato = detectar_formato(contenido)
+    metricas.anotar("formato", formato)
+    with metricas.etapa("parsear"):
+        tabla = _tabla_contenido(contenido, formato, prefijo)
+    with metricas.etapa("calcular"):
+        resultado = _calcular_tabla(tabla)
+    metricas.contar("filas", len(resultado))
+    metricas.contar("funcionarios", resultado.n_funcionarios())
+    return resultado
+
+
+def calcular_archivo(ruta):
+    """ResultadoCalculo de un archivo en disco, leído vía mmap (sin copiarlo a memoria)."""
+    with open(ruta, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError("El archivo está vacío")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as contenido:
+            return calcular_contenido(contenido)
+
+
+def procesar_contenido(contenido, prefijo=None) -> BytesIO:
+    """Procesa el archivo subido (XLS-HTML, .xls binario real o .xlsx) y retorna el XLSX de salida."""
+    return armar_excel_resultado(calcular_contenido(contenido, prefijo))
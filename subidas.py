@@ -0,0 +1,49 @@
+import mmap
+import os
+import tempfile
+from io import BytesIO
+
+from flask import Request
+
+# Tope por request (se rechaza con 413 antes de leer el cuerpo si viene Content-Length)
+MAX_SUBIDA_BYTES = int(os.environ.get("RELOJ_MAX_SUBIDA_MB", "100")) * 1024 * 1024
+# Sobre este tamaño la subida se escribe a un temporal en disco en vez de memoria
+UMBRAL_DISCO_BYTES = int(os.environ.get("RELOJ_UMBRAL_DISCO_KB", "512")) * 1024
+DIR_SUBIDAS = os.environ.get("RELOJ_DIR_SUBIDAS") or None  # None = tmp del sistema
+
+
+class RequestEnDisco(Request):
+    """
+    Request de Flask que guarda las subidas grandes en un temporal en disco.
+    El temporal tiene nombre para que los procesos de cálculo lo abran por su
+    ruta (lote); se borra al cerrarse, al terminar la request.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        if total_content_length is not None and total_content_length <= UMBRAL_DISCO_BYTES:
+            return BytesIO()
+        return tempfile.NamedTemporaryFile("rb+", dir=DIR_SUBIDAS, prefix="subida_")
+
+
+def abrir_vista(stream):
+    """
+    Contenido de la subida sin copiarlo a memoria: mmap de solo lectura sobre el
+    temporal en disco, o los bytes tal cual si la subida era chica.
+    """
+    try:
+        fd = stream.fileno()
+    except (AttributeError, OSError):
+        return stream.getvalue() if isinstance(stream, BytesIO) else stream.read()
+    stream.flush()
+    if os.fstat(fd).st_size == 0:
+        return b""
+    return mmap.mmap(fd, 0, access=mmap.ACCESS_READ)
+
+
+def cerrar_vista(vista):
+    if isinstance(vista, mmap.mmap):
+        try:
+            vista.close()
+        except BufferError:
+            # Aún hay vistas exportadas: se libera cuando las suelte el GC
+            pass
@@ -0,0 +1,306 @@
+"""
+Subidas por partes (reanudables) para exports grandes sobre enlaces lentos.
+Se crea la subida con el tamaño total, se envían las partes numeradas (PUT,
+cada una con su sha256) en cualquier orden y cuantas veces haga falta, se
+consulta cuáles faltan y al finalizar el archivo armado pasa por el mismo
+procesamiento que /procesar. Un corte obliga a reenviar solo lo que no llegó.
+
+Todo vive en disco, como los trabajos, para que cualquier worker de gunicorn
+reciba cualquier parte: el archivo se preasigna con su tamaño, cada parte se
+escribe en su posición y queda registrada recién cuando está sincronizada.
+
+Si el archivo es XLS-HTML, a medida que se completa su comienzo se va
+parseando hasta el último cierre de tabla (procesador.leer_prefijo_html): al
+finalizar solo queda leer el resto.
+"""
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+import metricas
+from subidas import MAX_SUBIDA_BYTES
+
+DIR_SUBIDAS_PARTES = os.environ.get(
+    "RELOJ_DIR_SUBIDAS_PARTES", os.path.join(tempfile.gettempdir(), "reloj_subidas_partes")
+)
+# Segundos sin recibir partes tras los cuales una subida se borra
+TTL_SUBIDAS = int(os.environ.get("RELOJ_TTL_SUBIDAS", str(24 * 3600)))
+# Tamaño de parte por defecto y límites que puede pedir el cliente
+TAMANO_PARTE_BYTES = int(os.environ.get("RELOJ_TAMANO_PARTE_KB", "1024")) * 1024
+MIN_PARTE_BYTES = 64 * 1024
+MAX_PARTE_BYTES = 16 * 1024 * 1024
+# El comienzo del HTML se parsea de a tramos de al menos/a lo más estos bytes
+# (el tope acota la latencia que agrega a la PUT que lo dispara)
+MIN_TRAMO_PREFIJO_BYTES = 256 * 1024
+MAX_TRAMO_PREFIJO_BYTES = 8 * 1024 * 1024
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{32}$")
+_SHA256_VALIDO = re.compile(r"^[0-9a-f]{64}$")
+
+PARTES = metricas.contador("reloj_subidas_partes_total", "Partes recibidas en subidas por partes, por resultado.")
+
+
+class ErrorSubida(Exception):
+    """Error de la subida con su código HTTP y datos extra para la respuesta (p. ej. faltantes)."""
+
+    def __init__(self, codigo, mensaje, **detalle):
+        super().__init__(mensaje)
+        self.codigo = codigo
+        self.detalle = detalle
+
+
+def _dir(id_subida):
+    return os.path.join(DIR_SUBIDAS_PARTES, id_subida)
+
+
+def _escribir_json(ruta, datos):
+    tmp = f"{ruta}.{uuid.uuid4().hex}.tmp"  # único también entre hilos del worker
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(datos, f)
+    os.replace(tmp, ruta)
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _purgar_vencidas():
+    """Borra subidas sin actividad por más de TTL_SUBIDAS."""
+    if not os.path.isdir(DIR_SUBIDAS_PARTES):
+        return
+    limite = time.time() - TTL_SUBIDAS
+    for nombre in os.listdir(DIR_SUBIDAS_PARTES):
+        directorio = _dir(nombre)
+        try:
+            if os.path.getmtime(directorio) < limite:
+                shutil.rmtree(directorio, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def crear_subida(nombre_archivo, n_bytes, tamano_parte=None, sha256=None) -> dict:
+    """Reserva el archivo en disco y retorna el estado inicial (id, partes, tamano_parte)."""
+    if n_bytes <= 0:
+        raise ErrorSubida(400, "bytes debe ser mayor que 0")
+    if n_bytes > MAX_SUBIDA_BYTES:
+        raise ErrorSubida(413, f"El archivo supera el máximo permitido ({MAX_SUBIDA_BYTES / (1024 * 1024):g} MB)")
+    tamano_parte = tamano_parte or TAMANO_PARTE_BYTES
+    if not MIN_PARTE_BYTES <= tamano_parte <= MAX_PARTE_BYTES:
+        raise ErrorSubida(400, f"tamano_parte debe estar entre {MIN_PARTE_BYTES} y {MAX_PARTE_BYTES} bytes")
+    if sha256 is not None and not _SHA256_VALIDO.match(sha256):
+        raise ErrorSubida(400, "sha256 debe ser el hash en hexadecimal (64 caracteres)")
+
+    _purgar_vencidas()
+    id_subida = uuid.uuid4().hex
+    directorio = _dir(id_subida)
+    os.makedirs(os.path.join(directorio, "partes"))
+    with open(os.path.join(directorio, "datos"), "wb") as f:
+        f.truncate(n_bytes)  # disperso: no ocupa disco hasta que llegan las partes
+
+    estado = {
+        "id": id_subida,
+        "archivo": nombre_archivo,
+        "bytes": n_bytes,
+        "tamano_parte": tamano_parte,
+        "partes": -(-n_bytes // tamano_parte),
+        "sha256": sha256,
+        "creado": time.time(),
+    }
+    _escribir_json(os.path.join(directorio, "estado.json"), estado)
+    return _con_avance(directorio, estado)
+
+
+def _cargar(id_subida):
+    estado = _leer_json(os.path.join(_dir(id_subida), "estado.json")) if _ID_VALIDO.match(id_subida) else None
+    if estado is None:
+        raise ErrorSubida(404, "Subida no encontrada")
+    return _dir(id_subida), estado
+
+
+def _recibidas(directorio):
+    return {int(n) for n in os.listdir(os.path.join(directorio, "partes")) if n.isdigit()}
+
+
+def _con_avance(directorio, estado, recibidas=None):
+    """Estado más lo recibido: faltantes, bytes recibidos y cuánto del comienzo ya se parseó."""
+    recibidas = _recibidas(directorio) if recibidas is None else recibidas
+    faltantes = [n for n in range(estado["partes"]) if n not in recibidas]
+    prefijo = _leer_json(os.path.join(directorio, "prefijo.json")) or {}
+    recibidos = sum(_largo_parte(estado, n) for n in recibidas)
+    return dict(
+        estado,
+        recibidas=len(recibidas),
+        faltantes=faltantes,
+        bytes_recibidos=recibidos,
+        completa=not faltantes,
+        bytes_parseados=prefijo.get("hasta", 0),
+    )
+
+
+def _largo_parte(estado, n):
+    return min(estado["tamano_parte"], estado["bytes"] - n * estado["tamano_parte"])
+
+
+def estado_subida(id_subida) -> dict:
+    return _con_avance(*_cargar(id_subida))
+
+
+def borrar_subida(id_subida):
+    directorio, _ = _cargar(id_subida)
+    shutil.rmtree(directorio, ignore_errors=True)
+
+
+def recibir_parte(id_subida, n, datos, sha256) -> dict:
+    """
+    Escribe la parte n (idempotente: reenviar una parte ya recibida con el
+    mismo contenido no hace nada). Retorna el estado con lo que falta.
+    """
+    directorio, estado = _cargar(id_subida)
+    if not 0 <= n < estado["partes"]:
+        raise ErrorSubida(404, f"La subida tiene partes 0 a {estado['partes'] - 1}")
+    largo = _largo_parte(estado, n)
+    if len(datos) != largo:
+        PARTES.incrementar(resultado="rechazada")
+        raise ErrorSubida(400, f"La parte {n} debe tener {largo} bytes (llegaron {len(datos)})")
+    if sha256 is None:
+        PARTES.incrementar(resultado="rechazada")
+        raise ErrorSubida(400, "Falta el checksum de la parte (X-Sha256 o Content-Digest: sha-256)")
+    digest = hashlib.sha256(datos).hexdigest()
+    if digest != sha256:
+        PARTES.incrementar(resultado="rechazada")
+        raise ErrorSubida(422, f"El sha256 de la parte {n} no coincide: reenvíela")
+
+    marca = os.path.join(directorio, "partes", str(n))
+    try:
+        with open(marca, encoding="ascii") as f:
+            previa = f.read()
+    except OSError:
+        previa = None
+    if previa is None:
+        with metricas.etapa("escribir"):
+            fd = os.open(os.path.join(directorio, "datos"), os.O_WRONLY)
+            try:
+                os.pwrite(fd, datos, n * estado["tamano_parte"])
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            tmp = f"{marca}.{uuid.uuid4().hex}.tmp"
+            with open(tmp, "w", encoding="ascii") as f:
+                f.write(digest)
+            os.replace(tmp, marca)  # la parte cuenta recién con los datos en disco
+        PARTES.incrementar(resultado="nueva")
+    elif previa != digest:
+        PARTES.incrementar(resultado="rechazada")
+        raise ErrorSubida(409, f"La parte {n} ya se recibió con otro contenido")
+    else:
+        PARTES.incrementar(resultado="repetida")
+    os.utime(directorio)  # actividad: aleja el vencimiento
+
+    recibidas = _recibidas(directorio)
+    with metricas.etapa("prefijo"):
+        _avanzar_prefijo(directorio, estado, recibidas)
+    return _con_avance(directorio, estado, recibidas)
+
+
+@contextmanager
+def _bloqueo(directorio):
+    """True si se obtuvo el lock del prefijo de la subida (sin esperar: otro worker ya avanza)."""
+    with open(os.path.join(directorio, "prefijo.lock"), "w") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _avanzar_prefijo(directorio, estado, recibidas):
+    """Parsea el tramo nuevo del comienzo contiguo del archivo, si es XLS-HTML."""
+    contiguas = 0
+    while contiguas in recibidas:
+        contiguas += 1
+    hasta = min(contiguas * estado["tamano_parte"], estado["bytes"])
+    ruta_prefijo = os.path.join(directorio, "prefijo.json")
+    prefijo = _leer_json(ruta_prefijo) or {"hasta": 0, "n_tablas": 0, "tramos": []}
+    if prefijo.get("formato") not in (None, "html") or hasta - prefijo["hasta"] < MIN_TRAMO_PREFIJO_BYTES:
+        return
+
+    # pesado (lxml): se importa al usarlo, como en app.py
+    from procesador import detectar_formato, leer_prefijo_html
+
+    with _bloqueo(directorio) as propio:
+        if not propio:
+            return
+        prefijo = _leer_json(ruta_prefijo) or prefijo
+        with open(os.path.join(directorio, "datos"), "rb") as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as vista:
+            if "formato" not in prefijo:
+                # ya hay al menos MIN_TRAMO_PREFIJO_BYTES contiguos: alcanza para la firma
+                prefijo["formato"] = detectar_formato(vista)
+                if prefijo["formato"] != "html":
+                    _escribir_json(ruta_prefijo, prefijo)
+                    return
+            anterior = (prefijo["hasta"], prefijo["n_tablas"]) if prefijo["tramos"] else None
+            tope = min(hasta, prefijo["hasta"] + MAX_TRAMO_PREFIJO_BYTES)
+            tramo = leer_prefijo_html(vista, tope, anterior, MIN_TRAMO_PREFIJO_BYTES)
+        if tramo is None:
+            return
+        desde, corte, n_tablas, filas = tramo
+        _escribir_json(os.path.join(directorio, f"filas_{desde}.json"), filas)
+        prefijo.update(hasta=corte, n_tablas=n_tablas, tramos=prefijo["tramos"] + [desde])
+        _escribir_json(ruta_prefijo, prefijo)
+
+
+def _prefijo(directorio):
+    """(hasta, n_tablas, filas) del comienzo ya parseado, o None."""
+    prefijo = _leer_json(os.path.join(directorio, "prefijo.json"))
+    if not prefijo or not prefijo.get("tramos"):
+        return None
+    filas = []
+    for desde in prefijo["tramos"]:
+        tramo = _leer_json(os.path.join(directorio, f"filas_{desde}.json"))
+        if tramo is None:
+            return None  # incompleto: se parsea todo al procesar
+        filas.extend((n_tabla, celdas) for n_tabla, celdas in tramo)
+    return prefijo["hasta"], prefijo["n_tablas"], filas
+
+
+def abrir_completa(id_subida):
+    """
+    (vista, prefijo) del archivo armado: mmap de solo lectura (se cierra con
+    subidas.cerrar_vista) y el comienzo ya parseado para calcular_contenido.
+    ErrorSubida 409 (con 'faltantes') si aún faltan partes; 422 si no
+    coincide el sha256 total declarado al crear la subida.
+    """
+    directorio, estado = _cargar(id_subida)
+    avance = _con_avance(directorio, estado)
+    if avance["faltantes"]:
+        raise ErrorSubida(409, f"Faltan {len(avance['faltantes'])} partes", faltantes=avance["faltantes"])
+    with open(os.path.join(directorio, "datos"), "rb") as f:
+        vista = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if estado.get("sha256") and not estado.get("verificada"):
+        with metricas.etapa("verificar"):
+            coincide = hashlib.sha256(vista).hexdigest() == estado["sha256"]
+        if not coincide:
+            vista.close()
+            raise ErrorSubida(422, "El sha256 del archivo armado no coincide con el declarado")
+        estado["verificada"] = True  # los reintentos de finalizar no vuelven a calcularlo
+        _escribir_json(os.path.join(directorio, "estado.json"), estado)
+    os.utime(directorio)
+    with metricas.etapa("leer_prefijo"):
+        return vista, _prefijo(directorio)
@@ -0,0 +1,88 @@
+"""
+calcular_lote (vectorizado) contra calcular_atraso/calcular_horas_extras
+(escalares) fila a fila, con marcas, fechas y turnos al azar en todos los
+formatos que traen los exports.
+"""
+import math
+import random
+from datetime import datetime, time
+
+import pytest
+
+import procesador
+
+TURNOS = [
+    "08:00-17:00 / 08:00-16:00 (vi)", "08:00-17:00", "", "7:30 a 16:30",
+    "20:00-08:00 / 20:00-07:00", "sin horario", "25:00-26:00", None,
+]
+DESCRIPCIONES = ["", "Ausente", "Libre", "Falta Entrada", "OK", None, "AUSENTE total"]
+
+
+def _hora(rng):
+    h, m, s = rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59)
+    return rng.choice([
+        f"{h:02}:{m:02}", f"{h:02}:{m:02}:{s:02}", f"{h}:{m}", time(h, m, s),
+        "-", "", None, float("nan"),
+    ])
+
+
+def _fecha(rng):
+    d, mes = rng.randint(1, 28), rng.randint(1, 12)
+    return rng.choice([
+        f"{d:02}-{mes:02}-2024", f"{d:02}/{mes:02}/2024", f"{d}-{mes}-2024",
+        datetime(2024, mes, d), None, "basura",
+    ])
+
+
+def _escalar(funcion, *args):
+    try:
+        return funcion(*args)
+    except ValueError:
+        return None  # la versión escalar no define resultado: no se compara
+
+
+@pytest.mark.parametrize("semilla", range(4))
+def test_calcular_lote_igual_a_escalares(semilla):
+    rng = random.Random(semilla)
+    n = 3000
+    fechas = [_fecha(rng) for _ in range(n)]
+    entradas = [_hora(rng) for _ in range(n)]
+    salidas = [_hora(rng) for _ in range(n)]
+    descripciones = [rng.choice(DESCRIPCIONES) for _ in range(n)]
+    turnos = [rng.choice(TURNOS) for _ in range(n)]
+
+    atraso, h50, h25 = procesador.calcular_lote(fechas, entradas, salidas, descripciones, turnos)
+
+    comparadas = 0
+    for i in range(n):
+        fila = (fechas[i], entradas[i], salidas[i], descripciones[i], turnos[i])
+        esperado = _escalar(procesador.calcular_atraso, entradas[i], fechas[i], turnos[i])
+        if esperado is not None:
+            assert atraso[i] == esperado, fila
+            comparadas += 1
+        esperado = _escalar(procesador.calcular_horas_extras, entradas[i], salidas[i], fechas[i],
+                            turnos[i], descripciones[i])
+        if esperado is not None:
+            assert math.isclose(h50[i], esperado[0], abs_tol=1e-9), fila
+            assert math.isclose(h25[i], esperado[1], abs_tol=1e-9), fila
+    assert comparadas > n // 2
+
+
+def test_calcular_lote_turno_unico():
+    fechas = ["04-03-2024", "05-03-2024", "08-03-2024"]
+    entradas = ["08:10", "07:30:00", "08:00"]
+    salidas = ["18:00", "17:00", "21:30"]
+    descripciones = ["", "", ""]
+    turno = "08:00-17:00 / 08:00-16:00 (vi)"
+
+    atraso, h50, h25 = procesador.calcular_lote(fechas, entradas, salidas, descripciones, turno)
+
+    for i in range(len(fechas)):
+        assert atraso[i] == procesador.calcular_atraso(entradas[i], fechas[i], turno)
+        assert (h50[i], h25[i]) == procesador.calcular_horas_extras(
+            entradas[i], salidas[i], fechas[i], turno, descripciones[i])
+
+
+def test_calcular_lote_vacio():
+    atraso, h50, h25 = procesador.calcular_lote([], [], [], [], [])
+    assert len(atraso) == len(h50) == len(h25) == 0
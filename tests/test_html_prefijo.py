@@ -0,0 +1,89 @@
+"""
+Lectura de un HTML mientras llegan las partes (leer_prefijo_html) contra el
+parseo del archivo completo: el prefijo acumulado más el resto debe dar las
+mismas filas, bloques y resultado, corte donde corte la subida.
+"""
+import random
+
+import pytest
+
+import procesador
+from benchmarks.generador import generar_html
+
+_BASE = generar_html(n_empleados=40, dias=31, semilla=40)
+_MITAD = _BASE.index(b"<table", len(_BASE) // 2)
+
+CASOS = {
+    "un_funcionario": generar_html(n_empleados=1, dias=31, semilla=1),
+    "tres_funcionarios": generar_html(n_empleados=3, dias=31, semilla=3),
+    "cuarenta_funcionarios": _BASE,
+    "bom": b"\xef\xbb\xbf" + _BASE,
+    "comentario_al_inicio": _BASE.replace(b"<table", b"<!-- <table> --><table", 1),
+    "comentario_al_medio": _BASE[:_MITAD] + b"<!-- <table> -->" + _BASE[_MITAD:],
+    "tabla_anidada": (_BASE[:_MITAD] + b"<table><tr><td><table><tr><td>x</td></tr></table></td></tr></table>"
+                      + _BASE[_MITAD:]),
+    "mayusculas": _BASE.replace(b"<table", b"<TABLE", 3),
+    "metadatos_anidados": (
+        b"<html><body><table><tr><td><table><tr><td>Funcionario</td><td>: X</td></tr></table></td></tr></table>"
+        b"<table><tr><th>Fecha</th><th>Entrada</th><th>Salida</th></tr>"
+        b"<tr><td>01-03-2024</td><td>08:10</td><td>17:00</td></tr></table>"
+        b"<table><tr><td>02-03-2024</td><td>08:00</td><td>18:00</td><td></td><td>x</td></tr></table></body></html>"
+    ),
+    "sin_encabezado": (
+        b"<table><tr><td>01-03-2024</td><td>08:10</td><td>17:00</td><td>1</td><td>Permiso</td></tr></table>"
+        b"<table><tr><td>02-03-2024</td><td>08:00</td><td>18:00</td><td></td><td>x</td></tr></table>"
+    ),
+}
+
+
+def _simular_subida(html, rng, min_bytes):
+    """Prefijo (hasta, n_tablas, filas) acumulado llegando el archivo en partes al azar."""
+    recibido = bytearray(len(html))
+    prefijo = None
+    hasta = 0
+    while hasta < len(html):
+        hasta = min(len(html), hasta + rng.randrange(1, max(2, len(html) // 7)))
+        recibido[:hasta] = html[:hasta]
+        segmento = procesador.leer_prefijo_html(bytes(recibido), hasta, prefijo, min_bytes)
+        if segmento is not None:
+            desde, corte, n_tablas, filas = segmento
+            assert prefijo is None or desde == prefijo[0]
+            prefijo = (corte, n_tablas, (prefijo[2] if prefijo else []) + filas)
+    return prefijo
+
+
+@pytest.mark.parametrize("nombre", sorted(CASOS))
+def test_prefijo_mas_resto_igual_a_completo(nombre):
+    html = CASOS[nombre]
+    filas = list(procesador._filas_html(html))
+    bloques = list(procesador._bloques_filas_html(filas))
+    completo = procesador.calcular_contenido(html)
+    rng = random.Random(nombre)
+    for _ in range(5):
+        prefijo = _simular_subida(html, rng, min_bytes=rng.choice([0, 500, 5000]))
+        assert list(procesador._filas_html(html, prefijo)) == filas
+        assert list(procesador._bloques_html(html, prefijo)) == bloques
+        con_prefijo = procesador.calcular_contenido(html, prefijo)
+        assert list(con_prefijo.filas_detalle()) == list(completo.filas_detalle())
+        assert list(con_prefijo.filas_resumen()) == list(completo.filas_resumen())
+
+
+def test_prefijo_de_todo_el_archivo():
+    segmento = procesador.leer_prefijo_html(_BASE, len(_BASE))
+    assert segmento is not None
+    _, corte, n_tablas, filas = segmento
+    assert list(procesador._filas_html(_BASE, (corte, n_tablas, filas))) == list(procesador._filas_html(_BASE))
+
+
+def test_cabecera_incompleta_no_avanza():
+    assert procesador.leer_prefijo_html(_BASE, 100) is None
+
+
+def test_utf16_no_se_corta_por_bytes():
+    contenido = _BASE.decode("iso-8859-1").encode("utf-16")
+    assert procesador.leer_prefijo_html(contenido, len(contenido)) is None
+
+
+def test_sin_tablas_mismo_error():
+    with pytest.raises(RuntimeError):
+        list(procesador._filas_html(b"<html><body>nada</body></html>", (0, 0, [])))
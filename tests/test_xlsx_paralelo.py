@@ -0,0 +1,103 @@
+"""
+Lectura en paralelo de un .xlsx (_bloques_xlsx_en_paralelo) contra el
+recorrido serial con openpyxl (_bloques_hoja_openpyxl): mismos bloques, en el
+mismo orden, con trozos chicos para que haya muchos puntos de corte.
+"""
+import random
+import re
+import zipfile
+from io import BytesIO
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import procesador
+from benchmarks.generador import generar_xlsx
+
+
+@pytest.fixture(autouse=True)
+def paralelo_siempre(monkeypatch):
+    monkeypatch.setattr(procesador, "MAX_PROCESOS", 3)
+    monkeypatch.setattr(procesador, "UMBRAL_PARALELO_BYTES", 0)
+    monkeypatch.setattr(procesador, "_LECTURA_XML", 2048)
+
+
+def _leer(contenido, lector):
+    wb = load_workbook(BytesIO(contenido), read_only=True, data_only=True)
+    try:
+        return lector(wb)
+    finally:
+        wb.close()
+
+
+def _paralelo(contenido):
+    return _leer(contenido, procesador._bloques_xlsx_en_paralelo)
+
+
+def _serial(contenido):
+    return _leer(contenido, lambda wb: list(procesador._bloques_hoja_openpyxl(wb.active)))
+
+
+def _comillas_simples(contenido):
+    """Mismo libro con los atributos de <row> y <c> entre comillas simples."""
+    origen = zipfile.ZipFile(BytesIO(contenido))
+    salida = BytesIO()
+    with zipfile.ZipFile(salida, "w") as destino:
+        for info in origen.infolist():
+            datos = origen.read(info)
+            if info.filename.startswith("xl/worksheets/sheet"):
+                datos = re.sub(rb"(<(?:row|c)\b[^>]*>)", lambda m: m.group(1).replace(b'"', b"'"), datos)
+            destino.writestr(info, datos)
+    return salida.getvalue()
+
+
+@pytest.mark.parametrize("semilla", range(3))
+def test_export_generado(semilla):
+    contenido = generar_xlsx(n_empleados=40, dias=31, semilla=semilla)
+    bloques = _paralelo(contenido)
+    assert bloques is not None
+    assert bloques == _serial(contenido)
+    assert len(bloques) == 40
+
+
+def test_atributos_con_comillas_simples():
+    contenido = _comillas_simples(generar_xlsx(n_empleados=40, dias=31))
+    bloques = _paralelo(contenido)
+    assert bloques is not None
+    assert bloques == _serial(contenido)
+
+
+def test_sin_puntos_de_corte_es_serial():
+    assert _paralelo(generar_xlsx(n_empleados=1, dias=31)) is None
+
+
+def test_sin_internos_de_openpyxl(monkeypatch):
+    contenido = generar_xlsx(n_empleados=40, dias=31)
+    monkeypatch.setattr(procesador, "WorkSheetParser", None)
+    assert _paralelo(contenido) is None
+    assert procesador._bloques_xlsx(BytesIO(contenido)) == _serial(contenido)
+
+
+def test_hojas_al_azar():
+    """Hojas con bloques incompletos, metadatos sueltos y filas vacías."""
+    valores = ["Funcionario", "funcionario:", "Rut", "Día", "dia", "Totales", "total", "None", None,
+               "x", "1", 0, "Organigrama"]
+    for semilla in range(40):
+        rng = random.Random(semilla)
+        wb = Workbook()
+        ws = wb.active
+        for fila in range(1, rng.randint(5, 300)):
+            valor = rng.choice(valores)
+            if valor is None and rng.random() < .5:
+                continue
+            ws.cell(row=fila, column=1, value=valor)
+            ws.cell(row=fila, column=2, value=rng.choice(["01-03-2024", ": Pepe", "08:00-17:00", None]))
+            ws.cell(row=fila, column=3, value=rng.choice(["06:30", "08:10", None, "-"]))
+            ws.cell(row=fila, column=4, value=rng.choice(["18:00", "22:00", None]))
+            if rng.random() < .5:
+                ws.cell(row=fila, column=6, value=rng.choice(["Ausente", "", None]))
+        salida = BytesIO()
+        wb.save(salida)
+        contenido = salida.getvalue()
+        bloques = _paralelo(contenido)
+        assert bloques is None or bloques == _serial(contenido), semilla
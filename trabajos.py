@@ -0,0 +1,147 @@
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+import metricas
+from ejecutor import enviar
+from procesador import procesar_contenido
+
+# Los trabajos viven en disco para que cualquier worker de gunicorn pueda
+# responder por ellos (el estado no queda atado al proceso que lo recibió).
+DIR_TRABAJOS = os.environ.get(
+    "RELOJ_DIR_TRABAJOS", os.path.join(tempfile.gettempdir(), "reloj_trabajos")
+)
+# Segundos que se conserva un trabajo (y su resultado) antes de borrarlo
+TTL_TRABAJOS = int(os.environ.get("RELOJ_TTL_TRABAJOS", "3600"))
+
+_ID_VALIDO = re.compile(r"^[0-9a-f]{32}$")
+
+
+def _dir(id_trabajo):
+    return os.path.join(DIR_TRABAJOS, id_trabajo)
+
+
+def _escribir_estado(directorio, estado):
+    tmp = os.path.join(directorio, "estado.json.tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(estado, f)
+    os.replace(tmp, os.path.join(directorio, "estado.json"))
+
+
+def _leer_estado(directorio):
+    try:
+        with open(os.path.join(directorio, "estado.json"), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _purgar_vencidos():
+    """Borra trabajos más antiguos que TTL_TRABAJOS."""
+    if not os.path.isdir(DIR_TRABAJOS):
+        return
+    limite = time.time() - TTL_TRABAJOS
+    for nombre in os.listdir(DIR_TRABAJOS):
+        directorio = _dir(nombre)
+        try:
+            if os.path.getmtime(directorio) < limite:
+                shutil.rmtree(directorio, ignore_errors=True)
+        except OSError:
+            continue
+
+
+def _ejecutar(directorio):
+    """
+    Corre en un proceso del pool: procesa la entrada y deja resultado + estado
+    en disco. Retorna las etapas medidas, que el worker suma a /metrics.
+    """
+    estado = _leer_estado(directorio) or {}
+    estado.update(estado="procesando", inicio=time.time())
+    _escribir_estado(directorio, estado)
+
+    entrada = os.path.join(directorio, "entrada")
+    etapas = {}
+    try:
+        with open(entrada, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as vista:
+            salida, etapas, _ = metricas.medir(procesar_contenido, vista)
+        tmp = os.path.join(directorio, "resultado.xlsx.tmp")
+        with open(tmp, "wb") as f:
+            f.write(salida.getbuffer())
+        os.replace(tmp, os.path.join(directorio, "resultado.xlsx"))
+        estado["estado"] = "listo"
+    except Exception as e:
+        estado.update(estado="error", error=str(e))
+    finally:
+        try:
+            os.remove(entrada)
+        except OSError:
+            pass
+
+    estado["fin"] = time.time()
+    estado["espera_s"] = round(estado["inicio"] - estado["creado"], 3)
+    estado["proceso_s"] = round(estado["fin"] - estado["inicio"], 3)
+    estado["etapas"] = {nombre: round(s, 4) for nombre, s in etapas.items()}
+    _escribir_estado(directorio, estado)
+    return etapas
+
+
+def _terminado(directorio, futuro):
+    """
+    En el worker, al terminar el trabajo: suma a /metrics las etapas medidas en
+    el proceso del pool. Si ese proceso murió sin dejar estado final, el
+    trabajo queda como error.
+    """
+    if futuro.cancelled():
+        return
+    if futuro.exception() is None:
+        metricas.observar_etapas(futuro.result())
+        return
+    estado = _leer_estado(directorio) or {}
+    estado.update(
+        estado="error",
+        error=f"El proceso de cálculo terminó inesperadamente: {futuro.exception()!r}",
+        fin=time.time(),
+    )
+    _escribir_estado(directorio, estado)
+
+
+def crear_trabajo(contenido, nombre_archivo: str) -> dict:
+    """Guarda la subida, la encola en el pool de procesos y retorna el estado inicial."""
+    _purgar_vencidos()
+    id_trabajo = uuid.uuid4().hex
+    directorio = _dir(id_trabajo)
+    os.makedirs(directorio)
+    with open(os.path.join(directorio, "entrada"), "wb") as f:
+        f.write(contenido)
+
+    estado = {
+        "id": id_trabajo,
+        "estado": "pendiente",
+        "archivo": nombre_archivo,
+        "bytes": len(contenido),
+        "creado": time.time(),
+    }
+    _escribir_estado(directorio, estado)
+    futuro = enviar(_ejecutar, directorio)
+    futuro.add_done_callback(lambda f: _terminado(directorio, f))
+    return estado
+
+
+def estado_trabajo(id_trabajo: str):
+    """Estado del trabajo (dict) o None si no existe."""
+    if not _ID_VALIDO.match(id_trabajo):
+        return None
+    return _leer_estado(_dir(id_trabajo))
+
+
+def ruta_resultado(id_trabajo: str):
+    """Ruta del resultado.xlsx si el trabajo terminó bien; None si no."""
+    estado = estado_trabajo(id_trabajo)
+    if not estado or estado.get("estado") != "listo":
+        return None
+    return os.path.join(_dir(id_trabajo), "resultado.xlsx")